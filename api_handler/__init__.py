@@ -0,0 +1,15 @@
+from .omdb_client import (
+    OmdbClient,
+    OmdbError,
+    OmdbConnectionError,
+    OmdbTimeoutError,
+    get_client,
+)
+
+__all__ = [
+    "OmdbClient",
+    "OmdbError",
+    "OmdbConnectionError",
+    "OmdbTimeoutError",
+    "get_client",
+]
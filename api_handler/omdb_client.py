@@ -0,0 +1,238 @@
+"""
+Client for the OMDb API.
+
+The client keeps one requests session with keep-alive connections for all
+lookups, limits the request rate with a token bucket and retries failed
+requests, 429 and server errors with exponential backoff and jitter.
+Concurrent lookups of the same title share one request. The API url can
+be pointed to a local stub server for offline tests and benchmarks.
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from db_handler.database import get_setting
+from db_handler.omdb_cache import normalize_title
+from metrics_handler import metrics
+
+
+OMDB_URL = "https://www.omdbapi.com/"
+DEFAULT_RATE = 10
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 5
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 10
+
+_client = None
+
+
+class OmdbError(Exception):
+    """The search API did not give a usable answer."""
+
+
+class OmdbConnectionError(OmdbError):
+    """The search API could not be reached."""
+
+
+class OmdbTimeoutError(OmdbError):
+    """The search API did not answer in time."""
+
+
+class TokenBucket:
+    """
+    Allows rate calls per second on average and bursts of up to
+    capacity calls. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        if not self.rate:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate,
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class OmdbClient:
+    """Pooled, retrying and rate limited OMDb client."""
+
+    def __init__(
+        self,
+        api_key,
+        base_url=OMDB_URL,
+        rate=DEFAULT_RATE,
+        workers=DEFAULT_WORKERS,
+        retries=DEFAULT_RETRIES,
+        timeout=DEFAULT_TIMEOUT,
+        backoff=DEFAULT_BACKOFF,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.requests = 0
+        self.coalesced = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._bucket = TokenBucket(rate)
+        self._executor = None
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_movie(self, title):
+        """
+        Looks up a movie by title and returns the response data as dict.
+        If the same title is already being requested by another thread,
+        waits for that request instead of making a new one.
+        Raises OmdbError if there is no usable answer.
+        """
+        key = normalize_title(title)
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            data = self._get({"t": title})
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(data)
+            return data
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def submit(self, title):
+        """Looks up a title in the worker pool and returns a Future."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor.submit(self.get_movie, title)
+
+    def close(self):
+        """Stops the worker pool and closes the connections."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get(self, params):
+        """Makes a rate limited request and retries it on failures."""
+        params = dict(params, apikey=self.api_key)
+
+        for attempt in range(self.retries + 1):
+            retry_after = 0
+            self._bucket.acquire()
+            try:
+                with self._lock:
+                    self.requests += 1
+                with metrics.timer("moviebrain_omdb_request_seconds"):
+                    response = self.session.get(
+                        self.base_url, params=params, timeout=self.timeout
+                    )
+            except requests.exceptions.Timeout as error:
+                last_error = OmdbTimeoutError(str(error))
+            except requests.exceptions.RequestException as error:
+                last_error = OmdbConnectionError(str(error))
+            else:
+                if response.status_code == 429 or response.status_code >= 500:
+                    last_error = OmdbError(
+                        "The search API answered with status "
+                        + f"{response.status_code}."
+                    )
+                    retry_after = parse_retry_after(
+                        response.headers.get("Retry-After")
+                    )
+                else:
+                    try:
+                        return response.json()
+                    except ValueError:
+                        raise OmdbError(
+                            "Invalid response from the search API."
+                        )
+
+            if attempt < self.retries:
+                time.sleep(max(retry_after, self._get_backoff(attempt)))
+
+        raise last_error
+
+    def _get_backoff(self, attempt):
+        """Returns an exponential backoff time with full jitter."""
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * 2**attempt))
+
+
+def parse_retry_after(value):
+    """Returns the seconds of a Retry-After header, 0 if not given."""
+    try:
+        return min(MAX_BACKOFF, float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_client():
+    """
+    Returns the shared client, creating it on first use from the
+    OMDB_API_KEY and MOVIEBRAIN_OMDB_* settings.
+    """
+    global _client
+    if _client is None:
+        api_key = get_setting("OMDB_API_KEY")
+        if not api_key:
+            raise OmdbError("No OMDB_API_KEY set in the .env file.")
+        _client = OmdbClient(
+            api_key,
+            base_url=get_setting("MOVIEBRAIN_OMDB_URL", OMDB_URL),
+            rate=float(get_setting("MOVIEBRAIN_OMDB_RATE", DEFAULT_RATE)),
+            workers=int(
+                get_setting("MOVIEBRAIN_OMDB_WORKERS", DEFAULT_WORKERS)
+            ),
+            retries=int(
+                get_setting("MOVIEBRAIN_OMDB_RETRIES", DEFAULT_RETRIES)
+            ),
+        )
+    return _client
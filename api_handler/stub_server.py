@@ -0,0 +1,98 @@
+"""
+Local stand-in for the OMDb API, used by tests and benchmarks.
+
+The server answers every title with a generated movie unless the title is
+in not_found. It can add latency to each answer and answer the first
+requests with 429 to exercise the retries of the client.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_movie(title):
+    """Returns an OMDb style answer for a title."""
+    number = sum(map(ord, title))
+    return {
+        "Response": "True",
+        "Title": title,
+        "Year": str(1950 + number % 75),
+        "imdbRating": str(round(1 + number % 90 / 10, 1)),
+        "imdbID": f"tt{number:07d}",
+        "Poster": "N/A",
+    }
+
+
+class StubOmdbServer:
+    """OMDb stub server running in a background thread."""
+
+    def __init__(self, latency=0, not_found=(), rate_limited=0):
+        self.latency = latency
+        self.not_found = {title.lower() for title in not_found}
+        self.rate_limited = rate_limited
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def answer(self, params):
+        """Returns the status code and data for the query parameters."""
+        with self._lock:
+            self.request_count += 1
+            if self.request_count <= self.rate_limited:
+                return 429, {"Response": "False", "Error": "Too many requests"}
+
+        title = params.get("t", [""])[0]
+        if title.lower() in self.not_found:
+            return 200, {"Response": "False", "Error": "Movie not found!"}
+        return 200, make_movie(title)
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep connections alive like the real API, without nagle the
+            # separate header and body writes are not held back
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if stub.latency:
+                    threading.Event().wait(stub.latency)
+                status, data = stub.answer(parse_qs(urlparse(self.path).query))
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,134 @@
+"""
+Compares the memory and the time per operation of a MovieCollection
+with the dict of dicts of get_movies, for the statistics, sorting and
+range filters the menu offers.
+
+Run with: python -m benchmarks.bench_collection [--movies 1000000]
+"""
+import argparse
+import gc
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.dataset import generate_dataset
+from db_handler.movie_collection import MovieCollection
+
+
+def build_dict(rows):
+    """Returns the rows as dict of dicts like get_movies."""
+    return {
+        title: {"year": year, "rating": rating, "poster": poster, "note": note}
+        for title, year, rating, poster, note in rows
+    }
+
+
+def measure_memory(function):
+    """Returns the result of function and the bytes it holds after."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_time(function, repeat):
+    """Returns the fastest duration of repeat calls in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def get_dict_operations(movies):
+    """The operations on the dict of dicts."""
+    return {
+        "mean": lambda: statistics.mean(
+            info["rating"] for info in movies.values()
+        ),
+        "median": lambda: statistics.median(
+            info["rating"] for info in movies.values()
+        ),
+        "min/max": lambda: (
+            min(info["rating"] for info in movies.values()),
+            max(info["rating"] for info in movies.values()),
+        ),
+        "sort by rating": lambda: sorted(
+            movies.items(), key=lambda item: (-item[1]["rating"], item[0])
+        ),
+        "sort by year": lambda: sorted(
+            movies.items(), key=lambda item: (item[1]["year"], item[0])
+        ),
+        "filter year and rating": lambda: {
+            title: info
+            for title, info in movies.items()
+            if 1990 <= info["year"] <= 2010 and 5 <= info["rating"] <= 8
+        },
+    }
+
+
+def get_collection_operations(collection):
+    """The same operations on the collection."""
+    return {
+        "mean": collection.mean,
+        "median": collection.median,
+        "min/max": lambda: (collection.min_rating(), collection.max_rating()),
+        "sort by rating": lambda: collection.argsort("rating", True),
+        "sort by year": lambda: collection.argsort("year"),
+        "filter year and rating": lambda: collection.filter(
+            year_range=(1990, 2010), rating_range=(5, 8)
+        ),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare MovieCollection with the dict of dicts."
+    )
+    parser.add_argument("--movies", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    catalog = generate_dataset(
+        users=0, movies=args.movies, note_share=0, seed=args.seed
+    ).movies
+    rows = [
+        (movie["title"], movie["year"], movie["rating"], movie["poster"], "")
+        for movie in catalog
+    ]
+    del catalog
+
+    movies, dict_bytes = measure_memory(lambda: build_dict(rows))
+    collection, collection_bytes = measure_memory(
+        lambda: MovieCollection.from_rows(rows)
+    )
+    # the title strings are shared with the rows, they count for neither
+    print(f"\n  {args.movies} movies, fastest of {args.repeat} runs\n")
+    print(f"  {'':<24} {'dict':>12} {'collection':>12}")
+    print(
+        f"  {'memory':<24} {dict_bytes / 1024 / 1024:9.1f} MiB"
+        + f" {collection_bytes / 1024 / 1024:9.1f} MiB"
+    )
+
+    dict_operations = get_dict_operations(movies)
+    collection_operations = get_collection_operations(collection)
+    for name, dict_operation in dict_operations.items():
+        dict_time = measure_time(dict_operation, args.repeat)
+        collection_time = measure_time(
+            collection_operations[name], args.repeat
+        )
+        print(
+            f"  {name:<24} {dict_time * 1000:9.1f} ms "
+            + f"{collection_time * 1000:9.1f} ms"
+            + f"  {dict_time / collection_time:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,119 @@
+"""
+Measures the throughput in rows/s and the peak memory of the streaming
+export for every format, with and without gzip, on synthetic catalogs
+of growing size. The peak memory of the streaming export should stay
+the same for all sizes, unlike the one of dumping get_movies as JSON.
+
+Run with: python -m benchmarks.bench_export [--sizes 10000 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.dataset import generate_dataset, load_dataset
+from db_handler import movie_storage_sql as storage
+from export_handler import EXPORT_FORMATS, export_movies
+
+
+def measure_peak(function):
+    """Returns the peak of the memory allocated by function in bytes."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_time(function, repeat):
+    """Returns the fastest duration of repeat calls in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def dump_movies(user_id, file_path):
+    """The export without streaming, all movies are loaded first."""
+    storage.collection_cache.clear()
+    with open(file_path, "w", encoding="utf-8") as handle:
+        json.dump(storage.get_movies(user_id), handle, ensure_ascii=False)
+
+
+def run_benchmarks(user_id, directory, repeat):
+    """Returns (name, seconds, peak bytes) for every export variant."""
+    variants = [
+        (export_format, compress)
+        for export_format in EXPORT_FORMATS
+        for compress in (False, True)
+    ]
+    results = []
+    for export_format, compress in variants:
+        name = export_format + (" gzip" if compress else "")
+        file_path = os.path.join(directory, "export." + export_format)
+
+        def export():
+            export_movies(
+                file_path,
+                user_id,
+                export_format=export_format,
+                compress=compress,
+            )
+
+        results.append(
+            (name, measure_time(export, repeat), measure_peak(export))
+        )
+
+    file_path = os.path.join(directory, "dump.json")
+
+    def dump():
+        dump_movies(user_id, file_path)
+
+    results.append(
+        ("json get_movies", measure_time(dump, repeat), measure_peak(dump))
+    )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput and memory of the export."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10000, 100000],
+        help="numbers of movies of the exported collection",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        dataset = generate_dataset(
+            users=1, movies=size, movies_per_user=size, note_share=0.1
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            storage.configure_database(
+                "sqlite:///" + os.path.join(directory, "bench.db")
+            )
+            user_id = load_dataset(dataset)["user 0"]
+            results = run_benchmarks(user_id, directory, args.repeat)
+            storage.configure_database()
+
+        print(f"\n  {size} movies\n")
+        for name, seconds, peak in results:
+            print(
+                f"  {name:<16} {size / seconds:12,.0f} rows/s"
+                + f"  {peak / 1024 / 1024:8.2f} MiB peak"
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,110 @@
+"""
+Compares the html rendering as it was before (template read on every call,
++= concatenation, file always rewritten) with the fragment cached renderer
+on a cold and a warm fragment cache and with unchanged content.
+
+Run with: python -m benchmarks.bench_html_renderer [sizes...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from html_display import html_generator
+
+
+def legacy_serialize_movie(movie, info):
+    data_string = ""
+    data_string += "<li>\n"
+    data_string += '<div class="movie" title="' + info["note"] + '">\n'
+    data_string += '<img class="movie-poster"\n'
+    data_string += 'src="' + info["poster"] + '"/>\n'
+    data_string += '<div class="movie-title">' + movie + "</div>"
+    data_string += (
+        '<div class="movie-info">'
+        + str(info["year"])
+        + " / "
+        + str(info["rating"])
+        + "</div>"
+    )
+    data_string += "</div>\n" + "</li>"
+    return data_string
+
+
+def legacy_generate_html_file(movie_dict, file_path):
+    data_string = ""
+    for movie, info in movie_dict.items():
+        data_string += legacy_serialize_movie(movie, info)
+    html_string = html_generator.read_template(
+        html_generator.HTML_TEMPLATE_FILE
+    ).replace(html_generator.PLACEHOLDER, data_string)
+    with open(file_path, "w") as handle:
+        handle.write(html_string)
+
+
+def make_movies(size):
+    return {
+        f"Movie {number}": {
+            "year": 1950 + number % 75,
+            "rating": round(number % 100 / 10, 1),
+            "poster": "N/A",
+            "note": "",
+        }
+        for number in range(size)
+    }
+
+
+def timed(function, repeat=1):
+    """Returns the best time of repeat calls in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+
+def main(*sizes):
+    sizes = [int(size) for size in sizes] or [10000, 50000, 100000]
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "index.html")
+
+        for size in sizes:
+            movies = make_movies(size)
+            html_generator._fragment_cache.clear()
+            html_generator._written_hashes.clear()
+
+            legacy = timed(
+                lambda: legacy_generate_html_file(movies, file_path), 3
+            )
+
+            def render():
+                head, tail = html_generator.get_template_parts()
+                html_string = "".join(
+                    [head, html_generator.format_data(movies), tail]
+                )
+                html_generator.write_html(file_path, html_string)
+
+            cold = timed(render)
+            warm_unchanged = timed(render, 3)
+
+            def change_and_render():
+                # one changed note, so the page has to be written again
+                note = movies["Movie 0"]["note"] + "x"
+                movies["Movie 0"] = dict(movies["Movie 0"], note=note)
+                render()
+
+            warm_changed = timed(change_and_render, 3)
+
+            print(f"\n  {size} movies:")
+            print(f"    legacy, always written:       {legacy:9.1f} ms")
+            print(f"    cold fragment cache:          {cold:9.1f} ms")
+            print(f"    warm cache, one movie changed:{warm_changed:9.1f} ms")
+            print(
+                f"    warm cache, write skipped:    {warm_unchanged:9.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
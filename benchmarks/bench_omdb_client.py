@@ -0,0 +1,88 @@
+"""
+Compares OMDb lookups with a bare requests.get per title, as add_movie
+did before, with the pooled client sequentially and with its worker pool.
+All requests go to the local stub server with a simulated latency.
+
+Run with: python -m benchmarks.bench_omdb_client [titles] [latency]
+"""
+import sys
+import threading
+import time
+
+import requests
+
+from api_handler import OmdbClient
+from api_handler.stub_server import StubOmdbServer
+
+
+def report(label, titles, seconds, requests_made):
+    print(
+        f"  {label:<28} {seconds:7.3f} s, "
+        + f"{seconds / titles * 1000:7.3f} ms/title, "
+        + f"{requests_made} requests"
+    )
+
+
+def main(titles=200, latency=0.01):
+    titles = int(titles)
+    latency = float(latency)
+    names = [f"Movie {number}" for number in range(titles)]
+
+    print(f"\n  {titles} titles, {latency * 1000:.0f} ms server latency\n")
+
+    with StubOmdbServer(latency=latency) as server:
+        start = time.perf_counter()
+        for name in names:
+            requests.get(
+                server.url, params={"apikey": "key", "t": name}, timeout=5
+            ).json()
+        report(
+            "requests.get per title",
+            titles,
+            time.perf_counter() - start,
+            server.request_count,
+        )
+
+        with OmdbClient("key", base_url=server.url, rate=0) as client:
+            start = time.perf_counter()
+            for name in names:
+                client.get_movie(name)
+            report(
+                "client, sequential",
+                titles,
+                time.perf_counter() - start,
+                client.requests,
+            )
+
+        with OmdbClient("key", base_url=server.url, rate=0) as client:
+            start = time.perf_counter()
+            futures = [client.submit(name) for name in names]
+            for future in futures:
+                future.result()
+            report(
+                f"client, {client.workers} workers",
+                titles,
+                time.perf_counter() - start,
+                client.requests,
+            )
+
+        with OmdbClient("key", base_url=server.url, rate=0) as client:
+            start = time.perf_counter()
+            threads = [
+                threading.Thread(target=client.get_movie, args=("Heat",))
+                for _ in range(titles)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            report(
+                "client, identical titles",
+                titles,
+                time.perf_counter() - start,
+                client.requests,
+            )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,92 @@
+"""
+Compares the former search, a substring test over every title of the
+users collection in Python, with the FTS5 trigram index of search_movies.
+
+Run with: python -m benchmarks.bench_search [movies] [searches]
+"""
+import random
+import sys
+import time
+
+from db_handler import movie_storage_sql as storage
+
+
+WORDS = [
+    "dark", "night", "star", "love", "war", "city", "dead", "blue",
+    "king", "man", "river", "ghost", "time", "last", "red", "house",
+]
+
+
+def make_title(number, randomizer):
+    words = randomizer.sample(WORDS, 3)
+    return " ".join(words).title() + f" {number}"
+
+
+def scan_search(user_id, search_term):
+    """the search of moviebrain.search_movie before the index"""
+    movies = storage.get_movies(user_id)
+    return {
+        movie: movies[movie]
+        for movie in movies
+        if search_term.lower() in movie.lower()
+    }
+
+
+def timed(function, terms):
+    start = time.perf_counter()
+    for term in terms:
+        function(term)
+    return (time.perf_counter() - start) / len(terms) * 1000
+
+
+def main(size=50000, searches=50):
+    size = int(size)
+    searches = int(searches)
+    randomizer = random.Random(1)
+
+    storage.configure_database("sqlite://")
+    user_id = storage.add_user("benchmark")
+    storage.add_movies(
+        user_id,
+        [
+            {
+                "title": make_title(number, randomizer),
+                "year": 2000,
+                "rating": 7.0,
+                "poster": "N/A",
+            }
+            for number in range(size)
+        ],
+    )
+    term_sets = {
+        "selective terms": [
+            str(randomizer.randrange(1000, size)) for _ in range(searches)
+        ],
+        "common words": [
+            randomizer.choice(WORDS) for _ in range(searches)
+        ],
+    }
+    searches_to_time = {
+        "scan, collection loaded per search": lambda term: (
+            storage.collection_cache.clear(),
+            scan_search(user_id, term),
+        ),
+        "scan, cached collection": lambda term: scan_search(user_id, term),
+        "search_movies, first 20 results": lambda term: (
+            storage.search_movies(user_id, term)
+        ),
+        "search_movies, all results": lambda term: storage.search_movies(
+            user_id, term, limit=None
+        ),
+    }
+
+    for label, terms in term_sets.items():
+        print(f"\n  {size} movies, {searches} searches for {label}\n")
+        for name, function in searches_to_time.items():
+            print(f"  {name:<36} {timed(function, terms):8.2f} ms/search")
+
+    storage.configure_database()
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
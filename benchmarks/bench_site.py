@@ -0,0 +1,72 @@
+"""
+Measures the static site build with one process and with a process
+pool, and the rebuild after no change and after a change of one user.
+
+Run with: python -m benchmarks.bench_site [--users 20 --workers 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.dataset import generate_dataset, load_dataset
+from db_handler import movie_storage_sql as storage
+from html_display import site_builder
+
+
+def measure_build(site_dir, workers, force):
+    """Returns the duration of a build in seconds and its report."""
+    start = time.perf_counter()
+    report = site_builder.build_site(site_dir, workers=workers, force=force)
+    return time.perf_counter() - start, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the static site build of all users."
+    )
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--movies-per-user", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    dataset = generate_dataset(
+        users=args.users,
+        movies=args.users * args.movies_per_user,
+        movies_per_user=args.movies_per_user,
+        note_share=0.1,
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        storage.configure_database(
+            "sqlite:///" + os.path.join(directory, "bench.db")
+        )
+        user_ids = load_dataset(dataset)
+        site_dir = os.path.join(directory, "site")
+
+        results = [
+            ("full build, 1 process", measure_build(site_dir, 1, True)),
+            (
+                f"full build, {args.workers} processes",
+                measure_build(site_dir, args.workers, True),
+            ),
+            ("rebuild, no change", measure_build(site_dir, None, False)),
+        ]
+        user_id = user_ids["user 0"]
+        title = next(iter(storage.get_movies(user_id)))
+        storage.update_movie_note(user_id, title, "changed")
+        results.append(
+            ("rebuild, 1 user changed", measure_build(site_dir, None, False))
+        )
+        storage.configure_database()
+
+    print(f"\n  {args.users} users, {args.movies_per_user} movies each\n")
+    for name, (seconds, report) in results:
+        print(
+            f"  {name:<28} {seconds * 1000:9.1f} ms"
+            + f"  {len(report['built']):4} built"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+"""
+Measures the startup of moviebrain.py: the import time reported by
+python -X importtime and the wall time of one-shot commands, each
+against a time budget. The database, the api client and the browser
+view are loaded lazily, so the import only pays for the cli helpers.
+
+Run with: python -m benchmarks.bench_startup [runs]
+Exits with status 1 if a budget is exceeded.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# budgets in milliseconds
+IMPORT_BUDGET = 30
+# interpreter start included, commands using the database load SQLAlchemy
+COMMAND_BUDGETS = {
+    "--help": 80,
+    "--no-html list": 350,
+}
+# modules that must not be loaded by the import
+HEAVY_MODULES = ["sqlalchemy", "requests", "http"]
+
+
+def get_import_times():
+    """
+    Returns the cumulative import time of moviebrain in ms and the
+    (ms, module) pairs of all imports, both from python -X importtime.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import moviebrain"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    total = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative) / 1000, name.strip()))
+        if name.strip() == "moviebrain":
+            total = int(cumulative) / 1000
+    return total, imports
+
+
+def time_command(arguments, env, runs):
+    """Returns the median wall time of a moviebrain.py command in ms."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "moviebrain.py", *arguments],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main(runs=5):
+    runs = int(runs)
+    failed = False
+
+    total, imports = get_import_times()
+    print(f"\n  import moviebrain: {total:.1f} ms (budget {IMPORT_BUDGET} ms)")
+    for duration, name in sorted(imports, reverse=True)[:8]:
+        print(f"    {duration:8.1f} ms  {name}")
+    failed |= total > IMPORT_BUDGET
+
+    heavy = [
+        name
+        for _, name in imports
+        if name.split(".")[0] in HEAVY_MODULES
+    ]
+    if heavy:
+        print(f"\n  loaded at import: {', '.join(sorted(set(heavy)))}")
+        failed = True
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            MOVIEBRAIN_DB_URL=f"sqlite:///{directory}/startup.db",
+        )
+        # create and migrate the database, so the runs measure startup
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "from db_handler import movie_storage_sql as storage;"
+                + "storage.add_user('startup')",
+            ],
+            env=env,
+            check=True,
+        )
+
+        print(f"\n  median of {runs} runs, interpreter start included\n")
+        for command, budget in COMMAND_BUDGETS.items():
+            arguments = ["--user", "startup", *command.split()]
+            duration = time_command(arguments, env, runs)
+            print(
+                f"  moviebrain.py {command:<16} {duration:8.1f} ms"
+                + f" (budget {budget} ms)"
+            )
+            failed |= duration > budget
+
+    print("\n  over budget!" if failed else "\n  within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,276 @@
+"""
+Times the main operations of MovieBrain on a synthetic dataset in an
+isolated database file and saves the results as JSON, so runs on
+different commits can be compared.
+
+Run with: python -m benchmarks.bench_suite [options]
+e.g. python -m benchmarks.bench_suite --output before.json, then after a
+change python -m benchmarks.bench_suite --compare before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import moviebrain
+from benchmarks.dataset import WORDS, generate_dataset, load_dataset
+from db_handler import movie_storage_sql as storage
+from html_display import html_generator
+
+
+def summarize(times):
+    """Returns the statistics of a list of durations in seconds as ms."""
+    times = sorted(time * 1000 for time in times)
+    return {
+        "runs": len(times),
+        "min_ms": round(times[0], 4),
+        "median_ms": round(statistics.median(times), 4),
+        "mean_ms": round(statistics.mean(times), 4),
+        "p95_ms": round(times[int(0.95 * (len(times) - 1))], 4),
+    }
+
+
+def timed(function, repeat, setup=None):
+    """
+    Calls function repeat times with the number of the run and returns
+    the durations. setup is called with the number before each run and
+    is not timed.
+    """
+    times = []
+    for number in range(repeat):
+        if setup is not None:
+            setup(number)
+        start = time.perf_counter()
+        function(number)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def get_commit():
+    """Returns the current git commit or None outside of a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(user_ids, dataset, repeat):
+    """Returns a dict with the timings of every benchmark."""
+    user_id = user_ids["user 0"]
+    core_titles = dataset.collections["user 0"][:repeat]
+    new_movies = [
+        {
+            "title": f"new movie {number}",
+            "year": 2000,
+            "rating": 7.5,
+            "poster": "N/A",
+        }
+        for number in range(repeat)
+    ]
+    # collections of the users that are created and deleted
+    spare = dataset.movies[:min(100, len(dataset.movies))]
+
+    # movies that are added and deleted together
+    bulk_movies = [
+        dict(movie, title=f"bulk movie {number}")
+        for number, movie in enumerate(new_movies[:1] * 10)
+    ]
+
+    def spare_names(number):
+        return [f"spare {number} a", f"spare {number} b"]
+
+    def add_spare_users(number):
+        for name in spare_names(number):
+            storage.add_movies(storage.add_user(name), spare)
+
+    def show_stats(number):
+        moviebrain.current_user_id = user_id
+        with contextlib.redirect_stdout(io.StringIO()):
+            moviebrain.show_stats()
+
+    def render(number):
+        html_generator.format_data(storage.get_movies(user_id))
+
+    benchmarks = {
+        "get_movies (cold)": timed(
+            lambda number: storage.get_movies(user_id),
+            repeat,
+            setup=lambda number: storage.collection_cache.clear(),
+        ),
+        "get_movies (cached)": timed(
+            lambda number: storage.get_movies(user_id), repeat
+        ),
+        "add_movie": timed(
+            lambda number: storage.add_movie(
+                user_id, **new_movies[number]
+            ),
+            repeat,
+        ),
+        "add_movie (existing movie)": timed(
+            lambda number: storage.add_movie(
+                user_ids["user 1"], **dataset.movies[-1 - number]
+            ),
+            repeat,
+        ),
+        "delete_movie": timed(
+            lambda number: storage.delete_movie(
+                user_id, new_movies[number]["title"]
+            ),
+            repeat,
+        ),
+        "delete_movie (shared movie)": timed(
+            lambda number: storage.delete_movie(
+                user_id, core_titles[number]
+            ),
+            repeat,
+        ),
+        "delete_user": timed(
+            lambda number: storage.delete_user(f"spare {number}"),
+            repeat,
+            setup=lambda number: storage.add_movies(
+                storage.add_user(f"spare {number}"), spare
+            ),
+        ),
+        "delete_user (all movies)": timed(
+            lambda number: storage.delete_user(f"collector {number}"),
+            repeat,
+            setup=lambda number: storage.add_movies(
+                storage.add_user(f"collector {number}"), dataset.movies
+            ),
+        ),
+        "delete_movies (10 movies)": timed(
+            lambda number: storage.delete_movies(
+                user_id, [movie["title"] for movie in bulk_movies]
+            ),
+            repeat,
+            setup=lambda number: storage.add_movies(user_id, bulk_movies),
+        ),
+        "delete_users (2 users)": timed(
+            lambda number: storage.delete_users(spare_names(number)),
+            repeat,
+            setup=add_spare_users,
+        ),
+        "show_stats": timed(show_stats, repeat),
+        "search_movie": timed(
+            lambda number: storage.search_movies(
+                user_id, WORDS[number % len(WORDS)], limit=None
+            ),
+            repeat,
+        ),
+        "get_recommendations": timed(
+            lambda number: storage.get_recommendations(user_id), repeat
+        ),
+        "format_data (cold)": timed(
+            render,
+            repeat,
+            setup=lambda number: html_generator._fragment_cache.clear(),
+        ),
+        "format_data (cached)": timed(render, repeat),
+    }
+
+    return {name: summarize(times) for name, times in benchmarks.items()}
+
+
+def print_results(results, baseline=None):
+    """Prints the medians, with the change to the baseline if given."""
+    for name, result in results.items():
+        line = f"  {name:<30} {result['median_ms']:10.3f} ms"
+        if baseline and name in baseline["results"]:
+            before = baseline["results"][name]["median_ms"]
+            if before:
+                change = (result["median_ms"] - before) / before * 100
+                line += f"  {before:10.3f} ms before  {change:+7.1f} %"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time MovieBrain operations on a synthetic dataset."
+    )
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--movies-per-user", type=int, default=1000)
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=0.2,
+        help="share of every collection all users have",
+    )
+    parser.add_argument(
+        "--notes",
+        type=float,
+        default=0.1,
+        help="share of the movies with a note",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    args = parser.parse_args(argv)
+
+    # the benchmarks change the first users collection
+    repeat = min(args.repeat, int(args.movies_per_user * args.overlap))
+    repeat = max(repeat, 1)
+
+    dataset = generate_dataset(
+        users=max(args.users, 2),
+        movies=args.movies,
+        movies_per_user=args.movies_per_user,
+        overlap=args.overlap,
+        note_share=args.notes,
+        seed=args.seed,
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage.configure_database(
+            "sqlite:///" + os.path.join(directory, "bench.db")
+        )
+        start = time.perf_counter()
+        user_ids = load_dataset(dataset)
+        load_time = time.perf_counter() - start
+
+        results = run_benchmarks(user_ids, dataset, repeat)
+        storage.configure_database()
+
+    report = {
+        "commit": get_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": dict(vars(args), repeat=repeat),
+        "load_seconds": round(load_time, 3),
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as handle:
+            baseline = json.load(handle)
+
+    print(
+        f"\n  {len(user_ids)} users, {args.movies} movies, "
+        + f"{args.movies_per_user} per user, {repeat} runs each, "
+        + "medians\n"
+    )
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\n  Saved the results to {args.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,152 @@
+"""
+Compares the single transaction add and delete paths of the storage layer
+with the former implementation that used one connection and commit per
+statement. Every commit syncs the journal and the database file to disk,
+so the number of commits per operation is reported next to the wall time.
+
+Run with: python -m benchmarks.bench_transactions [operations]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event, text
+
+from db_handler import movie_storage_sql as storage
+from db_handler.database import get_engine
+
+
+def legacy_add_movie(engine, user_id, title, year, rating, poster):
+    """add_movie as it was before, with up to two commits"""
+    with engine.connect() as connection:
+        movie_id = connection.execute(
+            text("SELECT movie_id FROM movies WHERE title = :title"),
+            {"title": title},
+        ).scalar()
+
+    if not movie_id:
+        with engine.connect() as connection:
+            movie_id = connection.execute(
+                text("""
+                     INSERT INTO movies (title, year, rating, poster)
+                     VALUES (:title, :year, :rating, :poster)
+                     RETURNING movie_id
+                    """),
+                {
+                    "title": title,
+                    "year": year,
+                    "rating": rating,
+                    "poster": poster,
+                },
+            ).scalar()
+            connection.commit()
+
+    with engine.connect() as connection:
+        connection.execute(
+            text("""
+                 INSERT INTO movies_users (movie_id, user_id)
+                 VALUES (:movie_id, :user_id)
+                """),
+            {"movie_id": movie_id, "user_id": user_id},
+        )
+        connection.commit()
+
+
+def legacy_delete_movie(engine, user_id, title):
+    """delete_movie as it was before, with two commits"""
+    with engine.connect() as connection:
+        connection.execute(
+            text("""
+                 DELETE FROM movies_users
+                 WHERE user_id = :user_id
+                 AND movie_id = (
+                    SELECT movie_id FROM movies WHERE title = :title
+                 )
+                 """),
+            {"title": title, "user_id": user_id},
+        )
+        connection.commit()
+
+    with engine.connect() as connection:
+        connection.execute(
+            text("""
+                 DELETE FROM movies
+                 WHERE title = :title
+                 AND movie_id NOT IN (SELECT movie_id FROM movies_users)
+                 """),
+            {"title": title},
+        )
+        connection.commit()
+
+
+def run(engine, label, add, delete, operations):
+    """Times operations adds and deletes and counts the commits."""
+    commits = [0]
+
+    def count_commit(connection):
+        commits[0] += 1
+
+    event.listen(engine, "commit", count_commit)
+
+    titles = [f"{label} movie {number}" for number in range(operations)]
+
+    start = time.perf_counter()
+    for title in titles:
+        add(title)
+    add_time = time.perf_counter() - start
+    add_commits = commits[0]
+
+    start = time.perf_counter()
+    for title in titles:
+        delete(title)
+    delete_time = time.perf_counter() - start
+    delete_commits = commits[0] - add_commits
+
+    event.remove(engine, "commit", count_commit)
+
+    print(f"\n  {label}:")
+    print(
+        f"    add_movie:    {add_commits / operations:.1f} commits/op, "
+        + f"{add_time / operations * 1000:.3f} ms/op"
+    )
+    print(
+        f"    delete_movie: {delete_commits / operations:.1f} commits/op, "
+        + f"{delete_time / operations * 1000:.3f} ms/op"
+    )
+
+
+def main(operations=500):
+    operations = int(operations)
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage.configure_database(
+            "sqlite:///" + os.path.join(directory, "bench.db")
+        )
+        engine = get_engine()
+        user_id = storage.add_user("benchmark")
+
+        run(
+            engine,
+            "legacy",
+            lambda title: legacy_add_movie(
+                engine, user_id, title, 2000, 7.5, "N/A"
+            ),
+            lambda title: legacy_delete_movie(engine, user_id, title),
+            operations,
+        )
+        run(
+            engine,
+            "single transaction",
+            lambda title: storage.add_movie(
+                user_id, title, 2000, 7.5, "N/A"
+            ),
+            lambda title: storage.delete_movie(user_id, title),
+            operations,
+        )
+
+        storage.configure_database()
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
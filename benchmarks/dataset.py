@@ -0,0 +1,121 @@
+"""
+Synthetic datasets for the benchmarks.
+
+A dataset has a catalog of movies and users that each hold a number of
+them. A share of every collection, the overlap, comes from a core of
+movies all users have, the rest is drawn at random from the catalog.
+A share of the cross-references gets a note. The same seed always gives
+the same dataset.
+"""
+import random
+
+from sqlalchemy import text
+
+from db_handler import movie_storage_sql as storage
+from db_handler.database import get_engine
+
+
+WORDS = [
+    "dark", "night", "star", "love", "war", "city", "dead", "blue",
+    "king", "man", "river", "ghost", "time", "last", "red", "house",
+]
+
+
+class Dataset:
+    """The catalog, the collections and the notes of a synthetic dataset"""
+
+    def __init__(self, movies, collections, notes):
+        # dicts with the keys title, year, rating and poster
+        self.movies = movies
+        # user names with the lists of their titles
+        self.collections = collections
+        # (user name, title, note) tuples
+        self.notes = notes
+
+
+def make_title(number, randomizer):
+    words = randomizer.sample(WORDS, 3)
+    return " ".join(words).title() + f" {number}"
+
+
+def generate_dataset(
+    users=10,
+    movies=10000,
+    movies_per_user=1000,
+    overlap=0.2,
+    note_share=0.1,
+    seed=1,
+):
+    """
+    Returns a Dataset with users collections of movies_per_user movies
+    from a catalog of movies movies. overlap and note_share are the
+    shares of every collection that all users have and that have a note.
+    """
+    randomizer = random.Random(seed)
+    movies_per_user = min(movies_per_user, movies)
+
+    catalog = [
+        {
+            "title": make_title(number, randomizer),
+            "year": randomizer.randint(1920, 2025),
+            "rating": round(randomizer.uniform(1, 10), 1),
+            # no remote posters, so rendering does not download
+            "poster": "N/A",
+        }
+        for number in range(movies)
+    ]
+    titles = [movie["title"] for movie in catalog]
+
+    core_size = int(movies_per_user * overlap)
+    core = titles[:core_size]
+    rest = titles[core_size:]
+
+    collections = {}
+    notes = []
+    for number in range(users):
+        name = f"user {number}"
+        collection = core + randomizer.sample(
+            rest, movies_per_user - core_size
+        )
+        collections[name] = collection
+        for title in collection:
+            if randomizer.random() < note_share:
+                notes.append((name, title, f"note of {name} on {title}"))
+
+    return Dataset(catalog, collections, notes)
+
+
+def load_dataset(dataset):
+    """
+    Writes the dataset to the configured database through the storage
+    layer. Returns a dict with the user names and their ids.
+    """
+    movies_by_title = {movie["title"]: movie for movie in dataset.movies}
+
+    user_ids = {}
+    for name, titles in dataset.collections.items():
+        user_ids[name] = storage.add_user(name)
+        storage.add_movies(
+            user_ids[name], [movies_by_title[title] for title in titles]
+        )
+
+    if dataset.notes:
+        # one statement for all notes instead of a transaction per note
+        with get_engine().begin() as connection:
+            connection.execute(
+                text("""
+                    UPDATE movies_users
+                    SET note = :note
+                    WHERE user_id = :user_id
+                    AND movie_id = (
+                        SELECT movie_id FROM movies WHERE title = :title
+                    )
+                    """),
+                [
+                    {"user_id": user_ids[name], "title": title, "note": note}
+                    for name, title, note in dataset.notes
+                ],
+            )
+        storage.collection_cache.clear()
+
+    return user_ids
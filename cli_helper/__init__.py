@@ -9,6 +9,7 @@ from .helper import (
     print_sub_menu,
     print_user_menu
 )
+from .lazy import lazy_import
 
 __all__ = [
     "print_intro",
@@ -19,5 +20,6 @@ __all__ = [
     "wait_for_enter",
     "print_message",
     "print_sub_menu",
-    "print_user_menu"
+    "print_user_menu",
+    "lazy_import"
 ]
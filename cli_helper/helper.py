@@ -101,7 +101,9 @@ def print_menu():
   2. Add movie              7. Search movie
   3. Delete movie           8. Sort movies
   4. Add/Update note        9. Filter movies
-  5. Show stats             0. Leave the MovieBrain
+  5. Show stats            10. Recommended movies
+
+  0. Leave the MovieBrain
 
     """)
 
@@ -0,0 +1,15 @@
+from .commands import (
+    CommandError,
+    create_parser,
+    run_command,
+    run_batch,
+    main,
+)
+
+__all__ = [
+    "CommandError",
+    "create_parser",
+    "run_command",
+    "run_batch",
+    "main",
+]
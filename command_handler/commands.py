@@ -0,0 +1,533 @@
+"""
+Non-interactive commands for scripts and automation.
+
+`python moviebrain.py --user NAME COMMAND ...` runs a single command,
+`python moviebrain.py --user NAME --batch FILE` runs one command per line
+of FILE, or of stdin if FILE is "-". A batch runs in one process with one
+database engine and OMDb client and renders the browser view once after
+the last command. Failed lines are reported on stderr with their line
+number and do not stop the batch. Without a command or --batch the
+interactive menu is started.
+"""
+import argparse
+import cProfile
+import json
+import shlex
+import sys
+
+from cli_helper import lazy_import
+from metrics_handler import metrics
+
+# loaded on first use, so --help and invalid commands return at once and
+# only commands that look up movies load the api client
+storage = lazy_import("db_handler.movie_storage_sql")
+omdb_cache = lazy_import("db_handler.omdb_cache")
+api_handler = lazy_import("api_handler")
+export_handler = lazy_import("export_handler")
+
+
+# the keys of storage.SORT_COLUMNS
+SORT_FIELDS = ["title", "year", "rating"]
+
+
+class CommandError(Exception):
+    """Raised when a command can not be run with the given arguments."""
+
+
+def get_command_errors():
+    """
+    Returns the exception types a command fails with that do not stop a
+    batch: CommandError and the errors of the storage layer, the OMDb
+    client and the files. Only called when a command failed, so the
+    modules are not loaded for commands that succeed.
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+
+    return (
+        CommandError,
+        api_handler.OmdbError,
+        SQLAlchemyError,
+        OSError,
+        ValueError,
+        KeyError,
+    )
+
+
+def get_user_id(name, create=False):
+    """
+    Returns the id of the user with the name, creating the user if create
+    is True. Raises CommandError if there is no such user.
+    """
+    if not name:
+        raise CommandError("No user given, use --user NAME.")
+    user_id = storage.get_user_id(name)
+    if user_id:
+        return user_id
+    if create:
+        return storage.add_user(name)
+    raise CommandError(f"User {name} not found.")
+
+
+def list_command(args):
+    """Returns the movies of the user, sorted if --sort is given."""
+    user_id = get_user_id(args.user)
+    if args.sort is None:
+        return storage.get_movies(user_id)
+    return storage.query_movies(
+        user_id, sort_by=args.sort, descending=args.descending
+    )
+
+
+def add_title(args, user_id, title):
+    """Looks up a title and adds the movie found to the user."""
+    try:
+        data = omdb_cache.get_or_fetch(
+            title, lambda name: api_handler.get_client().get_movie(name)
+        )
+    except api_handler.OmdbError as error:
+        raise CommandError(f"Can not look up {title}: {error}")
+    if data["Response"] != "True":
+        raise CommandError(f"No movie found for {title}.")
+
+    if data["Title"] in storage.get_movies(user_id):
+        print_info(args, f"{data['Title']} is already in the database.")
+        return
+    storage.add_movie(
+        user_id,
+        data["Title"],
+        data["Year"],
+        data["imdbRating"],
+        data["Poster"],
+    )
+    print_info(args, f"Added {data['Title']} ({data['Year']}).")
+
+
+def add_command(args):
+    """
+    Looks up the titles and adds the movies found to the user. A title
+    that fails does not stop the others, the failures are reported
+    together after the last title.
+    """
+    user_id = get_user_id(args.user, create=True)
+
+    failures = []
+    for title in args.titles:
+        try:
+            add_title(args, user_id, title)
+        except CommandError as error:
+            failures.append(str(error))
+        except get_command_errors() as error:
+            failures.append(f"Can not add {title}: {error}")
+    if failures:
+        raise CommandError(" ".join(failures))
+
+    return storage.get_movies(user_id)
+
+
+def delete_command(args):
+    """Deletes the titles from the movies of the user."""
+    user_id = get_user_id(args.user)
+    movies = storage.get_movies(user_id)
+
+    missing = [title for title in args.titles if title not in movies]
+    if missing:
+        raise CommandError(f"Not in the database: {', '.join(missing)}.")
+
+    storage.delete_movies(user_id, args.titles)
+    for title in args.titles:
+        print_info(args, f"Removed {title}.")
+
+    return storage.get_movies(user_id)
+
+
+def note_command(args):
+    """Sets the note of a movie of the user."""
+    user_id = get_user_id(args.user)
+    if args.title not in storage.get_movies(user_id):
+        raise CommandError(f"Not in the database: {args.title}.")
+
+    storage.update_movie_note(user_id, args.title, args.note)
+    print_info(args, f"Updated the note of {args.title}.")
+
+    return storage.get_movies(user_id)
+
+
+def stats_command(args):
+    """Prints the statistics of the users movies."""
+    stats = storage.get_stats(get_user_id(args.user))
+    if stats is None:
+        raise CommandError("The database is empty.")
+
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False))
+    else:
+        print(f"count: {stats['count']}")
+        print(f"average rating: {round(stats['mean'], 1)}")
+        print(f"median rating: {round(stats['median'], 1)}")
+        print(f"best: {', '.join(stats['best_movies'])}")
+        print(f"worst: {', '.join(stats['worst_movies'])}")
+
+    movies = dict(stats["best_movies"])
+    movies.update(stats["worst_movies"])
+    return movies
+
+
+def search_command(args):
+    """Returns the movies of the user matching the term, best first."""
+    return storage.search_movies(
+        get_user_id(args.user), args.term, limit=args.limit
+    )
+
+
+def recommend_command(args):
+    """Returns the movies users with similar collections also saved."""
+    return storage.get_recommendations(
+        get_user_id(args.user), limit=args.limit
+    )
+
+
+def export_command(args):
+    """
+    Streams the movies of the user, or of the catalog with --all, as
+    JSON, NDJSON or CSV to a file or stdout.
+    """
+    user_id = None if args.all else get_user_id(args.user)
+    export_format = args.format
+    if export_format is None and args.output != "-":
+        export_format = export_handler.get_export_format(args.output)
+
+    if args.output == "-":
+        if args.gzip:
+            raise CommandError("--gzip needs an --output file.")
+        export_handler.write_movies(
+            storage.iter_movies(user_id), sys.stdout, export_format or "json"
+        )
+    else:
+        export_handler.export_movies(
+            args.output,
+            user_id,
+            export_format=export_format,
+            compress=args.gzip or None,
+        )
+
+    # the exported movies are not shown again
+    return None
+
+
+def site_command(args):
+    """
+    Builds the static site with the pages of all users, only the users
+    that changed since the last build are rendered unless --force.
+    """
+    # imported here, so the other commands do not load the html modules
+    from html_display import site_builder
+
+    report = site_builder.build_site(
+        args.output, workers=args.workers, force=args.force
+    )
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print(
+            f"Built {len(report['built'])} users, "
+            + f"{len(report['unchanged'])} unchanged, "
+            + f"{len(report['removed'])} removed: {args.output}"
+        )
+
+    # the site replaces the browser view
+    return None
+
+
+COMMANDS = {
+    "list": list_command,
+    "add": add_command,
+    "delete": delete_command,
+    "note": note_command,
+    "stats": stats_command,
+    "search": search_command,
+    "recommend": recommend_command,
+    "export": export_command,
+    "site": site_command,
+}
+
+# commands that print the movies they return
+LISTING_COMMANDS = {"list", "search", "recommend"}
+
+
+def create_output_parser(default):
+    """
+    Returns the parent parser of the output options, which are accepted
+    before and after the command. The subparsers get them with the
+    default argparse.SUPPRESS, so they keep an option given before the
+    command.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        default=default,
+        help="print results as JSON",
+    )
+    parser.add_argument(
+        "--no-html",
+        action="store_true",
+        default=default,
+        help="do not update the browser view",
+    )
+    return parser
+
+
+def create_parser():
+    """Returns the parser for the command line and the batch lines."""
+    parser = argparse.ArgumentParser(
+        prog="moviebrain.py",
+        description="Run MovieBrain commands without the menu.",
+        parents=[create_output_parser(False)],
+    )
+    parser.add_argument("--user", help="name of the user")
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help='run one command per line of FILE, "-" reads stdin',
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="write latency metrics, as JSON for .json files, "
+        + "else in the Prometheus text format",
+    )
+    parser.add_argument(
+        "--profile", metavar="FILE", help="write cProfile statistics"
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    output_parser = create_output_parser(argparse.SUPPRESS)
+
+    list_parser = subparsers.add_parser(
+        "list", parents=[output_parser], help="list the movies"
+    )
+    list_parser.add_argument("--sort", choices=SORT_FIELDS)
+    list_parser.add_argument(
+        "--descending", action="store_true", help="reverse the sort order"
+    )
+
+    add_parser = subparsers.add_parser(
+        "add", parents=[output_parser], help="add movies by title"
+    )
+    add_parser.add_argument("titles", nargs="+", metavar="TITLE")
+
+    delete_parser = subparsers.add_parser(
+        "delete", parents=[output_parser], help="delete movies"
+    )
+    delete_parser.add_argument("titles", nargs="+", metavar="TITLE")
+
+    note_parser = subparsers.add_parser(
+        "note", parents=[output_parser], help="set a movie note"
+    )
+    note_parser.add_argument("title")
+    note_parser.add_argument("note")
+
+    subparsers.add_parser(
+        "stats", parents=[output_parser], help="show the rating statistics"
+    )
+
+    search_parser = subparsers.add_parser(
+        "search", parents=[output_parser], help="search movies"
+    )
+    search_parser.add_argument("term")
+    search_parser.add_argument("--limit", type=int)
+
+    recommend_parser = subparsers.add_parser(
+        "recommend",
+        parents=[output_parser],
+        help="recommend movies other users saved",
+    )
+    recommend_parser.add_argument("--limit", type=int, default=10)
+
+    export_parser = subparsers.add_parser(
+        "export", parents=[output_parser], help="export movies"
+    )
+    export_parser.add_argument(
+        "--format",
+        choices=["json", "ndjson", "csv"],
+        help="defaults to the extension of the output file, else json",
+    )
+    export_parser.add_argument(
+        "--output", default="-", help='file to write, "-" is stdout'
+    )
+    export_parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="compress the output file, the default for .gz files",
+    )
+    export_parser.add_argument(
+        "--all",
+        action="store_true",
+        help="export the whole catalog instead of the users movies",
+    )
+
+    site_parser = subparsers.add_parser(
+        "site",
+        parents=[output_parser],
+        help="build the static site of all users",
+    )
+    site_parser.add_argument(
+        "--output",
+        default="html_display/site",
+        help="directory of the site",
+    )
+    site_parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of processes, the default is one per CPU",
+    )
+    site_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="render all users, also the unchanged ones",
+    )
+
+    return parser
+
+
+def print_info(args, message):
+    """Prints a status message, on stderr if stdout holds JSON."""
+    print(message, file=sys.stderr if args.json else sys.stdout)
+
+
+def print_movies(args, movies):
+    """Prints the movies one per line or as JSON object."""
+    if args.json:
+        print(json.dumps(movies, ensure_ascii=False))
+    else:
+        for movie, info in movies.items():
+            print(f"{movie} ({info['year']}): {info['rating']}")
+
+
+def run_command(args):
+    """
+    Runs the command of the parsed arguments and prints its output.
+    Returns the movies to show in the browser view or None.
+    """
+    with metrics.timer("moviebrain_action_seconds", action=args.command):
+        movies = COMMANDS[args.command](args)
+    if args.command in LISTING_COMMANDS:
+        print_movies(args, movies)
+    return movies
+
+
+def read_batch(parser, handle, defaults):
+    """
+    Yields the line number and the parsed arguments of every command in
+    the batch file. Empty lines and lines starting with # are skipped,
+    --user and --json default to the values of the command line, a line
+    with --no-html does not update the browser view.
+    """
+    for number, line in enumerate(handle, start=1):
+        try:
+            tokens = shlex.split(line, comments=True)
+        except ValueError as error:
+            yield number, CommandError(str(error))
+            continue
+        if not tokens:
+            continue
+
+        try:
+            args = parser.parse_args(tokens)
+        except SystemExit:
+            yield number, CommandError(f"Invalid command: {line.strip()}")
+            continue
+
+        if args.batch or args.command is None:
+            yield number, CommandError("Each line needs one command.")
+            continue
+
+        args.user = args.user or defaults.user
+        args.json = args.json or defaults.json
+        yield number, args
+
+
+def run_batch(parser, handle, defaults):
+    """
+    Runs all commands of the batch file.
+    Returns the movies of the last command that returned some without
+    --no-html and the number of failed lines.
+    """
+    movies = None
+    failures = 0
+
+    for number, args in read_batch(parser, handle, defaults):
+        try:
+            if isinstance(args, CommandError):
+                raise args
+            result = run_command(args)
+        except get_command_errors() as error:
+            print(f"line {number}: {error}", file=sys.stderr)
+            failures += 1
+            continue
+        # the browser view shows the last movies of a line with html
+        if result is not None and not args.no_html:
+            movies = result
+
+    return movies, failures
+
+
+def run(parser, args, interactive=None):
+    """
+    Runs a command, a batch of commands or, without both, the interactive
+    function if given. Returns the exit status, 1 if a command failed.
+    """
+    if args.batch:
+        if args.batch == "-":
+            movies, failures = run_batch(parser, sys.stdin, args)
+        else:
+            with open(args.batch, "r") as handle:
+                movies, failures = run_batch(parser, handle, args)
+    elif args.command:
+        failures = 0
+        try:
+            movies = run_command(args)
+        except get_command_errors() as error:
+            print(error, file=sys.stderr)
+            return 1
+    elif interactive is not None:
+        interactive()
+        return 0
+    else:
+        parser.print_usage(sys.stderr)
+        return 2
+
+    if movies is not None and not args.no_html:
+        # imported here, so commands without html output stay light
+        from html_display import html_generator
+
+        html_generator.generate_html_file(movies)
+
+    return 1 if failures else 0
+
+
+def main(argv=None, interactive=None):
+    """
+    Parses the arguments and runs them, see run. With --metrics the
+    latency metrics and with --profile the cProfile statistics of the
+    whole run are written to the given files, even if it fails.
+    Returns the exit status.
+    """
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        return run(parser, args, interactive)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.metrics:
+            metrics.write_metrics(args.metrics)
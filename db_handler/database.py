@@ -0,0 +1,165 @@
+"""
+Engine factory for the MovieBrain SQLite database.
+
+The engine is created on first use from the MOVIEBRAIN_DB_* settings in
+the environment or the .env file. Every new connection gets the
+performance pragmas applied, the schema is migrated once per engine.
+"""
+import os
+
+from dotenv import dotenv_values
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from .migrations import migrate
+
+
+DEFAULT_DB_URL = "sqlite:///data/moviebrain.db"
+
+# pragma defaults, can be overridden by MOVIEBRAIN_DB_<NAME> settings
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    # 256 MiB memory mapped I/O
+    "mmap_size": 268435456,
+    # negative values are KiB, so 64 MiB page cache
+    "cache_size": -65536,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+    # SQLite only enforces foreign keys and their ON DELETE actions with
+    # this pragma, it has to be set on every connection
+    "foreign_keys": "ON",
+}
+
+# busy_timeout comes first, so setting the journal mode waits for locks
+PRAGMA_ORDER = [
+    "busy_timeout",
+    "journal_mode",
+    "synchronous",
+    "mmap_size",
+    "cache_size",
+    "temp_store",
+    "foreign_keys",
+]
+
+_engine = None
+_db_url = None
+_pragmas = {}
+# functions called with every new engine, e.g. to add event listeners
+_engine_hooks = []
+
+
+def get_setting(name, default=None):
+    """
+    Returns a setting from the environment or the .env file,
+    the environment takes precedence.
+    """
+    if name in os.environ:
+        return os.environ[name]
+    return dotenv_values(".env").get(name, default)
+
+
+def is_memory_url(db_url):
+    """Returns True if the url points to an in-memory database."""
+    return db_url in ("sqlite://", "sqlite:///:memory:")
+
+
+def get_pragmas(db_url, overrides=None):
+    """
+    Returns the pragmas for a database url, built from the defaults, the
+    MOVIEBRAIN_DB_<NAME> settings and the given overrides.
+    """
+    pragmas = {}
+    for name, value in DEFAULT_PRAGMAS.items():
+        pragmas[name] = get_setting(f"MOVIEBRAIN_DB_{name.upper()}", value)
+    pragmas.update(overrides or {})
+
+    # in-memory databases have no file to write ahead of
+    if is_memory_url(db_url):
+        pragmas["journal_mode"] = "MEMORY"
+
+    return pragmas
+
+
+def create_sqlite_engine(db_url, pragmas=None):
+    """
+    Creates an engine for db_url that applies the pragmas on each new
+    connection. In-memory databases share one connection, so all users of
+    the engine see the same data, file databases use a connection pool.
+    """
+    if is_memory_url(db_url):
+        engine = create_engine(
+            db_url,
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+    else:
+        engine = create_engine(db_url, poolclass=QueuePool)
+
+    pragmas = pragmas or {}
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name in PRAGMA_ORDER:
+            if name in pragmas:
+                # pragmas do not accept bound parameters
+                cursor.execute(f"PRAGMA {name} = {pragmas[name]}")
+        cursor.close()
+
+    return engine
+
+
+def configure(db_url=None, **pragmas):
+    """
+    Sets the database url and pragma overrides used for the engine.
+    Without db_url the MOVIEBRAIN_DB_URL setting is used.
+    The current engine is disposed and recreated on next use.
+    """
+    global _db_url, _pragmas
+    dispose_engine()
+    _db_url = db_url
+    _pragmas = pragmas
+
+
+def get_db_url():
+    """Returns the configured database url or the one of the settings."""
+    return _db_url or get_setting("MOVIEBRAIN_DB_URL", DEFAULT_DB_URL)
+
+
+def get_engine():
+    """Returns the engine, creating and migrating it on first use."""
+    global _engine
+    if _engine is None:
+        db_url = get_db_url()
+        engine = create_sqlite_engine(db_url, get_pragmas(db_url, _pragmas))
+        for hook in _engine_hooks:
+            hook(engine)
+        # Create or upgrade the tables to the current schema version
+        migrate(engine)
+        _engine = engine
+    return _engine
+
+
+def add_engine_hook(hook):
+    """
+    Registers a function that is called with every new engine before it
+    is used, and with the current engine if there is one.
+    """
+    if hook in _engine_hooks:
+        return
+    _engine_hooks.append(hook)
+    if _engine is not None:
+        hook(_engine)
+
+
+def dispose_engine(close=True):
+    """
+    Closes all connections of the engine, if there is one. A process
+    forked from the owner of the engine passes close=False, so it only
+    forgets the connections it shares with the owner.
+    """
+    global _engine
+    if _engine is not None:
+        _engine.dispose(close=close)
+        _engine = None
@@ -0,0 +1,935 @@
+"""
+Versioned schema migrations for the MovieBrain database.
+
+The schema version is stored in the SQLite user_version pragma. Every
+migration upgrades the schema by exactly one version, so existing
+database files are upgraded in place by running the missing steps.
+"""
+import sys
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+
+# queries of the storage layer whose query plans are compared
+# before and after the migrations
+QUERY_PLAN_CHECKS = {
+    "get_movies": (
+        """
+        SELECT title, year, rating, poster, note
+        FROM movies AS m
+        JOIN movies_users AS mu
+        ON m.movie_id = mu.movie_id
+        WHERE mu.user_id = :user_id
+        """,
+        {"user_id": 1},
+    ),
+    "delete_movie": (
+        """
+        DELETE FROM movies_users
+        WHERE user_id = :user_id
+        AND movie_id = (
+            SELECT movie_id FROM movies WHERE title = :title
+        )
+        """,
+        {"user_id": 1, "title": ""},
+    ),
+    "update_movie_note": (
+        """
+        UPDATE movies_users
+        SET note = :note
+        WHERE user_id = :user_id
+        AND movie_id = (
+            SELECT movie_id FROM movies WHERE title = :title
+        )
+        """,
+        {"user_id": 1, "title": "", "note": ""},
+    ),
+    "orphan_check": (
+        """
+        SELECT 1 FROM movies_users WHERE movie_id = :movie_id
+        """,
+        {"movie_id": 1},
+    ),
+    "delete_movies_orphans": (
+        """
+        DELETE FROM movies
+        WHERE title IN (:title)
+        AND NOT EXISTS (
+            SELECT 1
+            FROM movies_users AS mu
+            WHERE mu.movie_id = movies.movie_id
+        )
+        """,
+        {"title": ""},
+    ),
+    "delete_users_orphans": (
+        """
+        DELETE FROM movies
+        WHERE movie_id IN (:movie_id)
+        AND NOT EXISTS (
+            SELECT 1
+            FROM movies_users AS mu
+            WHERE mu.movie_id = movies.movie_id
+        )
+        """,
+        {"movie_id": 1},
+    ),
+    "delete_users_overlaps": (
+        """
+        DELETE FROM user_overlaps
+        WHERE user_id IN (:user_id) OR other_id IN (:user_id)
+        """,
+        {"user_id": 1},
+    ),
+    "random_movie": (
+        """
+        SELECT title, year, rating, poster, note
+        FROM movies_users AS mu
+        JOIN movies AS m
+        ON m.movie_id = mu.movie_id
+        WHERE mu.user_id = :user_id AND mu.position = :position
+        """,
+        {"user_id": 1, "position": 0},
+    ),
+    "recommendation_neighbours": (
+        """
+        SELECT o.other_id, o.movie_count, own.movie_count, other.movie_count
+        FROM user_overlaps AS o
+        JOIN user_overlaps AS own
+        ON own.user_id = o.user_id AND own.other_id = o.user_id
+        JOIN user_overlaps AS other
+        ON other.user_id = o.other_id AND other.other_id = o.other_id
+        WHERE o.user_id = :user_id AND o.other_id != :user_id
+        """,
+        {"user_id": 1},
+    ),
+    "recommendation_candidates": (
+        """
+        SELECT mu.movie_id, mu.user_id
+        FROM movies_users AS mu
+        WHERE mu.user_id IN (:user_id)
+        AND NOT EXISTS (
+            SELECT 1
+            FROM movies_users AS own
+            WHERE own.user_id = :own_id
+            AND own.movie_id = mu.movie_id
+        )
+        """,
+        {"user_id": 2, "own_id": 1},
+    ),
+}
+
+
+def create_base_tables(connection):
+    """Creates the movies, users and movies_users tables."""
+    connection.execute(
+        text("""
+        CREATE TABLE IF NOT EXISTS movies (
+            movie_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT UNIQUE NOT NULL,
+            year INTEGER NOT NULL,
+            rating REAL NOT NULL,
+            poster TEXT NOT NULL
+        )
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TABLE IF NOT EXISTS movies_users (
+            movie_id INTEGER NOT NULL REFERENCES movies(movie_id),
+            user_id INTEGER NOT NULL REFERENCES users(user_id)
+        )
+    """)
+    )
+
+
+def add_note_column(connection):
+    """
+    Adds the note column to movies_users, older databases
+    got it added by hand already.
+    """
+    columns = connection.execute(
+        text("PRAGMA table_info(movies_users)")
+    ).fetchall()
+
+    if "note" not in [column[1] for column in columns]:
+        connection.execute(
+            text("ALTER TABLE movies_users ADD COLUMN note TEXT")
+        )
+
+
+def add_movies_users_key(connection):
+    """
+    Rebuilds movies_users with a composite (user_id, movie_id) primary key
+    and adds an index on movie_id for lookups from the movie side.
+    Duplicate cross-references are merged, keeping a note if there is one.
+    """
+    connection.execute(text("DROP TABLE IF EXISTS movies_users_new"))
+    connection.execute(
+        text("""
+        CREATE TABLE movies_users_new (
+            user_id INTEGER NOT NULL REFERENCES users(user_id),
+            movie_id INTEGER NOT NULL REFERENCES movies(movie_id),
+            note TEXT,
+            PRIMARY KEY (user_id, movie_id)
+        ) WITHOUT ROWID
+    """)
+    )
+    connection.execute(
+        text("""
+        INSERT INTO movies_users_new (user_id, movie_id, note)
+        SELECT user_id, movie_id, MAX(note)
+        FROM movies_users
+        GROUP BY user_id, movie_id
+    """)
+    )
+    connection.execute(text("DROP TABLE movies_users"))
+    connection.execute(
+        text("ALTER TABLE movies_users_new RENAME TO movies_users")
+    )
+    connection.execute(
+        text("""
+        CREATE INDEX IF NOT EXISTS idx_movies_users_movie_id
+        ON movies_users (movie_id)
+    """)
+    )
+
+
+def create_omdb_cache_table(connection):
+    """
+    Creates the table for cached OMDb responses, keyed by the normalized
+    title that was looked up. Responses for not found movies are cached
+    too, they have no imdb_id.
+    """
+    connection.execute(
+        text("""
+        CREATE TABLE IF NOT EXISTS omdb_cache (
+            lookup_key TEXT PRIMARY KEY,
+            imdb_id TEXT,
+            response TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE INDEX IF NOT EXISTS idx_omdb_cache_imdb_id
+        ON omdb_cache (imdb_id)
+    """)
+    )
+
+
+def add_movie_value_indexes(connection):
+    """
+    Converts years and ratings stored as OMDb text like "2010–2013" or
+    "N/A" to numbers and adds indexes for sorting and filtering by year
+    and rating.
+    """
+    connection.execute(
+        text("""
+        UPDATE movies
+        SET year = CAST(substr(year, 1, 4) AS INTEGER)
+        WHERE typeof(year) != 'integer'
+    """)
+    )
+    connection.execute(
+        text("""
+        UPDATE movies
+        SET rating = CAST(rating AS REAL)
+        WHERE typeof(rating) NOT IN ('real', 'integer')
+    """)
+    )
+    connection.execute(
+        text("CREATE INDEX IF NOT EXISTS idx_movies_year ON movies (year)")
+    )
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS idx_movies_rating ON movies (rating)"
+        )
+    )
+
+
+def create_search_index(connection):
+    """
+    Creates FTS5 full-text indexes with the trigram tokenizer, so searches
+    match any part of a title or note. movies_fts indexes the titles of
+    the movies table, notes_fts the notes of movies_users. Triggers keep
+    both in sync. movies_users has no rowid, so the notes are stored with
+    (user_id << 32) | movie_id as rowid.
+    """
+    connection.execute(
+        text("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+            title,
+            content='movies',
+            content_rowid='movie_id',
+            tokenize='trigram'
+        )
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            note,
+            tokenize='trigram'
+        )
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS movies_fts_insert
+        AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts (rowid, title)
+            VALUES (new.movie_id, new.title);
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS movies_fts_delete
+        AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title)
+            VALUES ('delete', old.movie_id, old.title);
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS movies_fts_update
+        AFTER UPDATE OF title ON movies
+        WHEN old.title != new.title BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title)
+            VALUES ('delete', old.movie_id, old.title);
+            INSERT INTO movies_fts (rowid, title)
+            VALUES (new.movie_id, new.title);
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_insert
+        AFTER INSERT ON movies_users
+        WHEN new.note IS NOT NULL AND new.note != '' BEGIN
+            INSERT INTO notes_fts (rowid, note)
+            VALUES ((new.user_id << 32) | new.movie_id, new.note);
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete
+        AFTER DELETE ON movies_users BEGIN
+            DELETE FROM notes_fts
+            WHERE rowid = (old.user_id << 32) | old.movie_id;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update
+        AFTER UPDATE OF note ON movies_users BEGIN
+            DELETE FROM notes_fts
+            WHERE rowid = (old.user_id << 32) | old.movie_id;
+            INSERT INTO notes_fts (rowid, note)
+            SELECT (new.user_id << 32) | new.movie_id, new.note
+            WHERE new.note IS NOT NULL AND new.note != '';
+        END
+    """)
+    )
+    # index the existing rows
+    connection.execute(
+        text("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')")
+    )
+    connection.execute(
+        text("""
+        INSERT INTO notes_fts (rowid, note)
+        SELECT (user_id << 32) | movie_id, note
+        FROM movies_users
+        WHERE note IS NOT NULL AND note != ''
+    """)
+    )
+
+
+def create_user_stats_tables(connection):
+    """
+    Creates the per-user rating histogram with one bucket per 0.1 rating
+    step and the per-user movie counts per decade. Triggers update both
+    when cross-references are added or removed, deleting a user removes
+    the users rows. Count, mean, median, minimum and maximum of the
+    ratings are answered from the at most 101 histogram buckets.
+    """
+    connection.execute(
+        text("""
+        CREATE TABLE IF NOT EXISTS user_rating_histogram (
+            user_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            movie_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, bucket)
+        ) WITHOUT ROWID
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TABLE IF NOT EXISTS user_decade_counts (
+            user_id INTEGER NOT NULL,
+            decade INTEGER NOT NULL,
+            movie_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, decade)
+        ) WITHOUT ROWID
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS user_stats_insert
+        AFTER INSERT ON movies_users BEGIN
+            INSERT INTO user_rating_histogram (user_id, bucket, movie_count)
+            SELECT new.user_id, CAST(ROUND(rating * 10) AS INTEGER), 1
+            FROM movies
+            WHERE movie_id = new.movie_id
+            ON CONFLICT (user_id, bucket)
+            DO UPDATE SET movie_count = movie_count + 1;
+            INSERT INTO user_decade_counts (user_id, decade, movie_count)
+            SELECT new.user_id, year / 10 * 10, 1
+            FROM movies
+            WHERE movie_id = new.movie_id
+            ON CONFLICT (user_id, decade)
+            DO UPDATE SET movie_count = movie_count + 1;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS user_stats_delete
+        AFTER DELETE ON movies_users BEGIN
+            UPDATE user_rating_histogram
+            SET movie_count = movie_count - 1
+            WHERE user_id = old.user_id
+            AND bucket = (
+                SELECT CAST(ROUND(rating * 10) AS INTEGER)
+                FROM movies
+                WHERE movie_id = old.movie_id
+            );
+            DELETE FROM user_rating_histogram
+            WHERE user_id = old.user_id AND movie_count <= 0;
+            UPDATE user_decade_counts
+            SET movie_count = movie_count - 1
+            WHERE user_id = old.user_id
+            AND decade = (
+                SELECT year / 10 * 10
+                FROM movies
+                WHERE movie_id = old.movie_id
+            );
+            DELETE FROM user_decade_counts
+            WHERE user_id = old.user_id AND movie_count <= 0;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS user_stats_delete_user
+        AFTER DELETE ON users BEGIN
+            DELETE FROM user_rating_histogram WHERE user_id = old.user_id;
+            DELETE FROM user_decade_counts WHERE user_id = old.user_id;
+        END
+    """)
+    )
+    # count the existing rows
+    connection.execute(
+        text("""
+        INSERT INTO user_rating_histogram (user_id, bucket, movie_count)
+        SELECT mu.user_id, CAST(ROUND(m.rating * 10) AS INTEGER), COUNT(*)
+        FROM movies_users AS mu
+        JOIN movies AS m
+        ON m.movie_id = mu.movie_id
+        GROUP BY 1, 2
+    """)
+    )
+    connection.execute(
+        text("""
+        INSERT INTO user_decade_counts (user_id, decade, movie_count)
+        SELECT mu.user_id, m.year / 10 * 10, COUNT(*)
+        FROM movies_users AS mu
+        JOIN movies AS m
+        ON m.movie_id = mu.movie_id
+        GROUP BY 1, 2
+    """)
+    )
+
+
+def add_sample_positions(connection):
+    """
+    Numbers the movies of every user densely from 0, so a random movie is
+    picked with one lookup on (user_id, position). New cross-references
+    get the next free position, on delete the last movie of the user is
+    moved into the gap, so the positions stay dense.
+    """
+    connection.execute(
+        text("ALTER TABLE movies_users ADD COLUMN position INTEGER")
+    )
+    connection.execute(
+        text("""
+        UPDATE movies_users
+        SET position = numbered.position
+        FROM (
+            SELECT
+                user_id,
+                movie_id,
+                ROW_NUMBER() OVER (
+                    PARTITION BY user_id ORDER BY movie_id
+                ) - 1 AS position
+            FROM movies_users
+        ) AS numbered
+        WHERE movies_users.user_id = numbered.user_id
+        AND movies_users.movie_id = numbered.movie_id
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_movies_users_position
+        ON movies_users (user_id, position)
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS sample_position_insert
+        AFTER INSERT ON movies_users BEGIN
+            UPDATE movies_users
+            SET position = (
+                SELECT COALESCE(MAX(position), -1) + 1
+                FROM movies_users
+                WHERE user_id = new.user_id
+            )
+            WHERE user_id = new.user_id AND movie_id = new.movie_id;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS sample_position_delete
+        AFTER DELETE ON movies_users BEGIN
+            UPDATE movies_users
+            SET position = old.position
+            WHERE user_id = old.user_id
+            AND position = (
+                SELECT MAX(position)
+                FROM movies_users
+                WHERE user_id = old.user_id
+            )
+            AND position > old.position;
+        END
+    """)
+    )
+
+
+def add_change_stamps(connection):
+    """
+    Adds a change stamp to every user that triggers increase whenever a
+    movie of the user is added, removed, gets a new note or changes its
+    data. Builds of the static site compare the stamps with the ones of
+    the last build and only render the users that changed.
+    """
+    connection.execute(
+        text("""
+        ALTER TABLE users
+        ADD COLUMN change_stamp INTEGER NOT NULL DEFAULT 0
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS change_stamp_insert
+        AFTER INSERT ON movies_users BEGIN
+            UPDATE users
+            SET change_stamp = change_stamp + 1
+            WHERE user_id = new.user_id;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS change_stamp_delete
+        AFTER DELETE ON movies_users BEGIN
+            UPDATE users
+            SET change_stamp = change_stamp + 1
+            WHERE user_id = old.user_id;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS change_stamp_note
+        AFTER UPDATE OF note ON movies_users BEGIN
+            UPDATE users
+            SET change_stamp = change_stamp + 1
+            WHERE user_id = new.user_id;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS change_stamp_movie
+        AFTER UPDATE OF title, year, rating, poster ON movies
+        WHEN old.title IS NOT new.title
+        OR old.year IS NOT new.year
+        OR old.rating IS NOT new.rating
+        OR old.poster IS NOT new.poster BEGIN
+            UPDATE users
+            SET change_stamp = change_stamp + 1
+            WHERE user_id IN (
+                SELECT user_id FROM movies_users WHERE movie_id = new.movie_id
+            );
+        END
+    """)
+    )
+
+
+def add_cascading_foreign_keys(connection):
+    """
+    Rebuilds movies_users with foreign keys that delete the
+    cross-references of deleted users and movies. Cross-references of
+    users or movies that no longer exist are deleted first, through the
+    triggers, so the stats stay in sync. The indexes and the triggers
+    that use movies_users are created again from their saved
+    definitions, the triggers that only keep data of the user itself up
+    to date skip the cross-references of deleted users and the notes
+    index skips the ones without a note.
+    """
+    connection.execute(
+        text("""
+        DELETE FROM movies_users
+        WHERE user_id NOT IN (SELECT user_id FROM users)
+        OR movie_id NOT IN (SELECT movie_id FROM movies)
+    """)
+    )
+    definitions = connection.execute(
+        text("""
+        SELECT type, name, sql
+        FROM sqlite_schema
+        WHERE sql IS NOT NULL
+        AND (
+            (type = 'index' AND tbl_name = 'movies_users')
+            OR (type = 'trigger' AND sql LIKE '%movies_users%')
+        )
+        ORDER BY type = 'trigger', rowid
+    """)
+    ).fetchall()
+    # triggers of other tables would stop the rename, as they use the
+    # table while it is missing
+    for kind, name, _ in definitions:
+        if kind == "trigger":
+            connection.execute(text(f"DROP TRIGGER {name}"))
+
+    connection.execute(text("DROP TABLE IF EXISTS movies_users_new"))
+    connection.execute(
+        text("""
+        CREATE TABLE movies_users_new (
+            user_id INTEGER NOT NULL
+                REFERENCES users(user_id) ON DELETE CASCADE,
+            movie_id INTEGER NOT NULL
+                REFERENCES movies(movie_id) ON DELETE CASCADE,
+            note TEXT,
+            position INTEGER,
+            PRIMARY KEY (user_id, movie_id)
+        ) WITHOUT ROWID
+    """)
+    )
+    connection.execute(
+        text("""
+        INSERT INTO movies_users_new (user_id, movie_id, note, position)
+        SELECT user_id, movie_id, note, position
+        FROM movies_users
+    """)
+    )
+    connection.execute(text("DROP TABLE movies_users"))
+    connection.execute(
+        text("ALTER TABLE movies_users_new RENAME TO movies_users")
+    )
+    for _, _, sql in definitions:
+        # the saved statements are run as they are, without bind params
+        connection.exec_driver_sql(sql)
+
+    # the stats, positions and change stamp of a deleted user are gone
+    # with the user, so its cascaded cross-references skip them. Only
+    # notes that are not empty are indexed, so the cross-references
+    # without one skip the notes index.
+    for name in [
+        "user_stats_delete",
+        "sample_position_delete",
+        "change_stamp_delete",
+        "notes_fts_delete",
+    ]:
+        connection.execute(text(f"DROP TRIGGER {name}"))
+    connection.execute(
+        text("""
+        CREATE TRIGGER user_stats_delete
+        AFTER DELETE ON movies_users
+        WHEN EXISTS (SELECT 1 FROM users WHERE user_id = old.user_id) BEGIN
+            UPDATE user_rating_histogram
+            SET movie_count = movie_count - 1
+            WHERE user_id = old.user_id
+            AND bucket = (
+                SELECT CAST(ROUND(rating * 10) AS INTEGER)
+                FROM movies
+                WHERE movie_id = old.movie_id
+            );
+            DELETE FROM user_rating_histogram
+            WHERE user_id = old.user_id AND movie_count <= 0;
+            UPDATE user_decade_counts
+            SET movie_count = movie_count - 1
+            WHERE user_id = old.user_id
+            AND decade = (
+                SELECT year / 10 * 10
+                FROM movies
+                WHERE movie_id = old.movie_id
+            );
+            DELETE FROM user_decade_counts
+            WHERE user_id = old.user_id AND movie_count <= 0;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER sample_position_delete
+        AFTER DELETE ON movies_users
+        WHEN EXISTS (SELECT 1 FROM users WHERE user_id = old.user_id) BEGIN
+            UPDATE movies_users
+            SET position = old.position
+            WHERE user_id = old.user_id
+            AND position = (
+                SELECT MAX(position)
+                FROM movies_users
+                WHERE user_id = old.user_id
+            )
+            AND position > old.position;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER change_stamp_delete
+        AFTER DELETE ON movies_users
+        WHEN EXISTS (SELECT 1 FROM users WHERE user_id = old.user_id) BEGIN
+            UPDATE users
+            SET change_stamp = change_stamp + 1
+            WHERE user_id = old.user_id;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER notes_fts_delete
+        AFTER DELETE ON movies_users
+        WHEN old.note IS NOT NULL AND old.note != '' BEGIN
+            DELETE FROM notes_fts
+            WHERE rowid = (old.user_id << 32) | old.movie_id;
+        END
+    """)
+    )
+
+
+def create_user_overlap_index(connection):
+    """
+    Creates the co-occurrence index of the recommendations: for every
+    pair of users sharing movies the number of movies they share, in
+    both directions. The row of a user with itself holds the size of its
+    collection. Adding or removing a cross-reference updates the rows of
+    the users that have the movie, so a change costs the same for any
+    collection size and counts every movie of a collection. The rows of
+    deleted users are removed by delete_users, so their cascaded
+    cross-references skip the trigger.
+    """
+    connection.execute(
+        text("""
+        CREATE TABLE IF NOT EXISTS user_overlaps (
+            user_id INTEGER NOT NULL,
+            other_id INTEGER NOT NULL,
+            movie_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, other_id)
+        ) WITHOUT ROWID
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE INDEX IF NOT EXISTS idx_user_overlaps_other_id
+        ON user_overlaps (other_id)
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS user_overlap_insert
+        AFTER INSERT ON movies_users BEGIN
+            INSERT INTO user_overlaps (user_id, other_id, movie_count)
+            SELECT new.user_id, user_id, 1
+            FROM movies_users
+            WHERE movie_id = new.movie_id
+            ON CONFLICT (user_id, other_id)
+            DO UPDATE SET movie_count = movie_count + 1;
+            INSERT INTO user_overlaps (user_id, other_id, movie_count)
+            SELECT user_id, new.user_id, 1
+            FROM movies_users
+            WHERE movie_id = new.movie_id AND user_id != new.user_id
+            ON CONFLICT (user_id, other_id)
+            DO UPDATE SET movie_count = movie_count + 1;
+        END
+    """)
+    )
+    connection.execute(
+        text("""
+        CREATE TRIGGER IF NOT EXISTS user_overlap_delete
+        AFTER DELETE ON movies_users
+        WHEN EXISTS (SELECT 1 FROM users WHERE user_id = old.user_id) BEGIN
+            UPDATE user_overlaps
+            SET movie_count = movie_count - 1
+            WHERE user_id = old.user_id
+            AND (
+                other_id = old.user_id
+                OR other_id IN (
+                    SELECT user_id
+                    FROM movies_users
+                    WHERE movie_id = old.movie_id
+                )
+            );
+            UPDATE user_overlaps
+            SET movie_count = movie_count - 1
+            WHERE other_id = old.user_id
+            AND user_id IN (
+                SELECT user_id FROM movies_users WHERE movie_id = old.movie_id
+            );
+            DELETE FROM user_overlaps
+            WHERE user_id = old.user_id AND movie_count <= 0;
+            DELETE FROM user_overlaps
+            WHERE other_id = old.user_id AND movie_count <= 0;
+        END
+    """)
+    )
+    # count the overlaps of the existing collections
+    connection.execute(
+        text("""
+        INSERT INTO user_overlaps (user_id, other_id, movie_count)
+        SELECT a.user_id, b.user_id, COUNT(*)
+        FROM movies_users AS a
+        JOIN movies_users AS b
+        ON b.movie_id = a.movie_id
+        GROUP BY a.user_id, b.user_id
+    """)
+    )
+
+
+# list of all migrations, the position in the list + 1 is the
+# schema version after the migration ran
+MIGRATIONS = [
+    create_base_tables,
+    add_note_column,
+    add_movies_users_key,
+    create_omdb_cache_table,
+    add_movie_value_indexes,
+    create_search_index,
+    create_user_stats_tables,
+    add_sample_positions,
+    add_change_stamps,
+    add_cascading_foreign_keys,
+    create_user_overlap_index,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(connection):
+    """Returns the schema version stored in the database."""
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate(engine):
+    """
+    Runs all migrations the database is missing.
+    Every migration is committed together with its new version number,
+    a migration that fails is rolled back as a whole.
+    Returns the schema version of the database.
+    """
+    # pysqlite only begins a transaction before DML, so DDL ahead of it
+    # would commit at once. The driver is put in autocommit mode and
+    # every migration gets an explicit BEGIN instead.
+    with engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        version = get_schema_version(connection)
+
+        for number, migration in enumerate(MIGRATIONS, start=1):
+            if number <= version:
+                continue
+            connection.exec_driver_sql("BEGIN")
+            try:
+                migration(connection)
+                # pragmas do not accept bound parameters
+                connection.execute(text(f"PRAGMA user_version = {number}"))
+            except Exception:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            connection.exec_driver_sql("COMMIT")
+            version = number
+
+    return version
+
+
+def get_query_plans(engine):
+    """
+    Returns the query plans of the storage layer queries as dict with the
+    query names as keys and lists of plan steps as values.
+    Queries on columns the schema does not have yet are skipped.
+    """
+    plans = {}
+
+    with engine.connect() as connection:
+        for name, (query, params) in QUERY_PLAN_CHECKS.items():
+            try:
+                result = connection.execute(
+                    text("EXPLAIN QUERY PLAN " + query), params
+                )
+            except OperationalError:
+                continue
+            # the fourth column holds the readable plan step
+            plans[name] = [row[3] for row in result.fetchall()]
+
+    return plans
+
+
+def print_query_plans(plans):
+    """Prints the query plans returned by get_query_plans."""
+    for name, steps in plans.items():
+        print(f"  {name}:")
+        for step in steps:
+            print(f"    {step}")
+
+
+def main(db_path="data/moviebrain.db"):
+    """
+    Upgrades the database file at db_path in place and prints
+    the query plans before and after the upgrade.
+    """
+    engine = create_engine(f"sqlite:///{db_path}")
+
+    with engine.connect() as connection:
+        old_version = get_schema_version(connection)
+
+    print(f"\n  Query plans at schema version {old_version}:\n")
+    try:
+        print_query_plans(get_query_plans(engine))
+    except OperationalError:
+        print("    (the schema is too old to plan the queries)")
+
+    new_version = migrate(engine)
+
+    print(f"\n  Query plans at schema version {new_version}:\n")
+    print_query_plans(get_query_plans(engine))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,142 @@
+"""
+In-memory cache for the movie collections of the users.
+
+The storage layer keeps the result of get_movies per user and patches or
+invalidates it on every write, so repeated reads during one menu round
+trip do not load the collection again. Every collection is stored with
+the change stamp the user had when it was read, a read with another
+stamp drops it, so writes of other processes are seen. The number of
+cached users is bounded, the least recently used collection is evicted
+first.
+"""
+import threading
+from collections import OrderedDict
+
+
+class CollectionCache:
+    """
+    LRU cache of movie collections keyed by user id, each stored with
+    the change stamp of the user it belongs to. Every user has a version
+    counter that is increased on each write, so consumers can tell
+    whether a collection changed.
+    """
+
+    def __init__(self, max_users=128):
+        self.max_users = max_users
+        self._collections = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, user_id, stamp):
+        """
+        Returns the cached collection of the user or None on a miss.
+        A collection cached with another change stamp is dropped.
+        The returned dict is shared, callers must not modify it.
+        """
+        with self._lock:
+            entry = self._collections.get(user_id)
+            if entry is not None and entry[1] != stamp:
+                del self._collections[user_id]
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._collections.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user_id, movies, stamp):
+        """
+        Stores the collection of a user with the change stamp it was
+        read at, evicting the oldest if full.
+        """
+        with self._lock:
+            self._collections[user_id] = (movies, stamp)
+            self._collections.move_to_end(user_id)
+            while len(self._collections) > self.max_users:
+                self._collections.popitem(last=False)
+                self.evictions += 1
+
+    def get_version(self, user_id):
+        """Returns the version counter of the users collection."""
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def invalidate(self, user_id):
+        """Drops the cached collection of a user and bumps its version."""
+        with self._lock:
+            self._collections.pop(user_id, None)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def _patch(self, user_id, stamp, changes):
+        """
+        Bumps the version of the user and returns its cached collection
+        for a write that increased the change stamp by changes to stamp.
+        A collection that missed other changes is dropped instead.
+        Callers hold the lock.
+        """
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        entry = self._collections.get(user_id)
+        if entry is None:
+            return None
+        if entry[1] + changes != stamp:
+            del self._collections[user_id]
+            self.stale += 1
+            return None
+        self._collections[user_id] = (entry[0], stamp)
+        return entry[0]
+
+    def add_movie(self, user_id, title, info, stamp):
+        """Adds a movie to a cached collection and bumps the version."""
+        with self._lock:
+            movies = self._patch(user_id, stamp, 1)
+            if movies is not None:
+                movies[title] = info
+
+    def remove_movies(self, user_id, titles, stamp, changes):
+        """
+        Removes movies from a cached collection and bumps the version,
+        changes is the number of movies the write removed.
+        """
+        with self._lock:
+            movies = self._patch(user_id, stamp, changes)
+            if movies is not None:
+                for title in titles:
+                    movies.pop(title, None)
+
+    def set_note(self, user_id, title, note, stamp, changes):
+        """
+        Updates the note of a cached movie and bumps the version,
+        changes is the number of notes the write updated.
+        """
+        with self._lock:
+            movies = self._patch(user_id, stamp, changes)
+            if movies is not None and title in movies:
+                movies[title]["note"] = note
+
+    def clear(self):
+        """Drops all cached collections and resets the counters."""
+        with self._lock:
+            for user_id in self._collections:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._collections.clear()
+            self.hits = 0
+            self.misses = 0
+            self.stale = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Returns the cache counters as dict."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "cached_users": len(self._collections),
+            }
@@ -0,0 +1,266 @@
+"""
+Compact column store for the movies of a collection.
+
+get_movies holds one dict per movie, which costs several hundred bytes
+per movie and a hash lookup per field. MovieCollection keeps every field
+in a column instead: ratings in an array of doubles, years in an array
+of unsigned shorts and titles, posters and notes in lists of shared
+strings. Statistics, sorting and range filters run over the flat
+columns without a dict lookup per field, and only the movies that are
+shown become Movie records or dicts again.
+"""
+import math
+import sys
+from array import array
+
+
+# sort keys of argsort, like the ones of storage.query_movies
+SORT_FIELDS = ("title", "year", "rating")
+
+
+class Movie:
+    """A single movie of a collection"""
+
+    __slots__ = ("title", "year", "rating", "poster", "note")
+
+    def __init__(self, title, year, rating, poster, note=""):
+        self.title = title
+        self.year = year
+        self.rating = rating
+        self.poster = poster
+        self.note = note
+
+    def to_info(self):
+        """Returns the movie info dict as get_movies has it."""
+        return {
+            "year": self.year,
+            "rating": self.rating,
+            "poster": self.poster,
+            "note": self.note,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Movie):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for name in self.__slots__
+        )
+
+    def __repr__(self):
+        return f"Movie({self.title!r}, {self.year}, {self.rating})"
+
+
+class MovieCollection:
+    """
+    Movies stored by column. Rows are addressed by their index, argsort
+    and the filters return arrays of indices that select and to_dict
+    turn into collections or dicts again.
+    """
+
+    __slots__ = ("titles", "years", "ratings", "posters", "notes", "_rows")
+
+    def __init__(self):
+        self.titles = []
+        self.years = array("H")
+        self.ratings = array("d")
+        self.posters = []
+        self.notes = []
+        # title -> index, built on the first lookup by title
+        self._rows = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Returns a collection of (title, year, rating, poster, note) rows
+        like the ones of storage.iter_movies.
+        """
+        collection = cls()
+        for title, year, rating, poster, note in rows:
+            collection.append(title, year, rating, poster, note)
+        return collection
+
+    @classmethod
+    def from_dict(cls, movies):
+        """Returns a collection of a dict of dicts as get_movies has it."""
+        return cls.from_rows(
+            (
+                title,
+                info["year"],
+                info["rating"],
+                info["poster"],
+                info.get("note", ""),
+            )
+            for title, info in movies.items()
+        )
+
+    def append(self, title, year, rating, poster, note=""):
+        """Adds a movie at the end of the collection."""
+        if self._rows is not None:
+            self._rows[title] = len(self.titles)
+        # titles repeat across the collections of all users
+        self.titles.append(sys.intern(title))
+        self.years.append(year or 0)
+        self.ratings.append(rating or 0.0)
+        self.posters.append(poster)
+        # most movies have no note, they share the empty string
+        self.notes.append(note or "")
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __getitem__(self, index):
+        return Movie(
+            self.titles[index],
+            self.years[index],
+            self.ratings[index],
+            self.posters[index],
+            self.notes[index],
+        )
+
+    def __iter__(self):
+        return map(
+            Movie,
+            self.titles,
+            self.years,
+            self.ratings,
+            self.posters,
+            self.notes,
+        )
+
+    def __contains__(self, title):
+        return title in self._get_rows()
+
+    def get(self, title):
+        """Returns the movie with the title or None."""
+        index = self._get_rows().get(title)
+        return None if index is None else self[index]
+
+    def _get_rows(self):
+        if self._rows is None:
+            self._rows = {
+                title: index for index, title in enumerate(self.titles)
+            }
+        return self._rows
+
+    def mean(self):
+        """Returns the mean rating, None for an empty collection."""
+        if not self.ratings:
+            return None
+        return math.fsum(self.ratings) / len(self.ratings)
+
+    def median(self):
+        """Returns the median rating, None for an empty collection."""
+        if not self.ratings:
+            return None
+        ratings = sorted(self.ratings)
+        middle = len(ratings) // 2
+        if len(ratings) % 2:
+            return ratings[middle]
+        return (ratings[middle - 1] + ratings[middle]) / 2
+
+    def min_rating(self):
+        """Returns the lowest rating, None for an empty collection."""
+        return min(self.ratings, default=None)
+
+    def max_rating(self):
+        """Returns the highest rating, None for an empty collection."""
+        return max(self.ratings, default=None)
+
+    def _get_column(self, field):
+        if field not in SORT_FIELDS:
+            raise ValueError(f"Can not sort movies by {field}.")
+        return {
+            "title": self.titles,
+            "year": self.years,
+            "rating": self.ratings,
+        }[field]
+
+    def argsort(self, field, descending=False, indices=None):
+        """
+        Returns the indices of the movies sorted by the field, movies
+        with the same value by title, like storage.query_movies.
+        With indices only those movies are sorted.
+        """
+        if indices is None:
+            indices = range(len(self.titles))
+        order = sorted(indices, key=self.titles.__getitem__)
+        if field != "title" or descending:
+            # sorts are stable, also in reverse, so ties keep the titles
+            order.sort(
+                key=self._get_column(field).__getitem__, reverse=descending
+            )
+        return array("L", order)
+
+    def range_mask(self, field, start, end):
+        """
+        Returns a bytes mask with 1 for the movies whose year or rating
+        is between start and end, including both.
+        """
+        if field not in ("year", "rating"):
+            raise ValueError(f"Can not filter movies by {field}.")
+        column = self._get_column(field)
+        return bytes([start <= value <= end for value in column])
+
+    def filter(self, year_range=None, rating_range=None):
+        """
+        Returns the indices of the movies within the (start, end) ranges
+        of years and ratings, in the order of the collection.
+        """
+        indices = None
+        for field, value_range in (
+            ("year", year_range),
+            ("rating", rating_range),
+        ):
+            if value_range is None:
+                continue
+            start, end = value_range
+            column = self._get_column(field)
+            if indices is None:
+                indices = [
+                    index
+                    for index, value in enumerate(column)
+                    if start <= value <= end
+                ]
+            else:
+                # later ranges only check the movies left
+                indices = [
+                    index
+                    for index in indices
+                    if start <= column[index] <= end
+                ]
+
+        if indices is None:
+            indices = range(len(self.titles))
+        return array("L", indices)
+
+    def select(self, indices):
+        """Returns a new collection with the movies at the indices."""
+        collection = MovieCollection()
+        collection.titles = [self.titles[index] for index in indices]
+        collection.years = array(
+            "H", [self.years[index] for index in indices]
+        )
+        collection.ratings = array(
+            "d", [self.ratings[index] for index in indices]
+        )
+        collection.posters = [self.posters[index] for index in indices]
+        collection.notes = [self.notes[index] for index in indices]
+        return collection
+
+    def to_dict(self, indices=None):
+        """
+        Returns the movies at the indices, or all, as dict of dicts in
+        the format of get_movies, in the order of the indices.
+        """
+        if indices is None:
+            indices = range(len(self.titles))
+        return {
+            self.titles[index]: {
+                "year": self.years[index],
+                "rating": self.ratings[index],
+                "poster": self.posters[index],
+                "note": self.notes[index],
+            }
+            for index in indices
+        }
@@ -1,48 +1,42 @@
-from sqlalchemy import create_engine, text
-
-# Define the database URL as relative path
-DB_URL = "sqlite:///data/moviebrain.db"
-
-engine = create_engine(DB_URL)
-
-# Create the movies table if it does not exist
-with engine.connect() as connection:
-    connection.execute(
-        text("""
-        CREATE TABLE IF NOT EXISTS movies (
-            movie_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT UNIQUE NOT NULL,
-            year INTEGER NOT NULL,
-            rating REAL NOT NULL,
-            poster TEXT NOT NULL
-        )
-    """)
-    )
-    connection.commit()
-
-# Create the user table if it does not exist
-with engine.connect() as connection:
-    connection.execute(
-        text("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL
-        )
-    """)
-    )
-    connection.commit()
-
-# Create the movies_user table if it does not exist
-with engine.connect() as connection:
-    connection.execute(
-        text("""
-        CREATE TABLE IF NOT EXISTS movies_users (
-            movie_id INTEGER NOT NULL REFERENCES movies(movie_id),
-            user_id INTEGER NOT NULL REFERENCES users(user_id)
-        )
-    """)
-    )
-    connection.commit()
+import heapq
+import math
+import random
+
+from sqlalchemy import bindparam, text
+
+from . import database
+from .database import get_engine
+from .movie_cache import CollectionCache
+from .movie_collection import MovieCollection
+
+# Cache for the movie collections, kept up to date by the write functions
+collection_cache = CollectionCache(max_users=128)
+
+# columns the movies can be sorted by
+SORT_COLUMNS = {"title": "m.title", "year": "m.year", "rating": "m.rating"}
+
+# number of users sharing the most movies with a user whose movies
+# get_recommendations scores
+RECOMMENDATION_NEIGHBOURS = 50
+
+
+def parse_year(year):
+    """
+    Returns the year of an OMDb year value as integer,
+    series have years like "2010–2013", the first year is used.
+    """
+    try:
+        return int(str(year)[:4])
+    except ValueError:
+        return 0
+
+
+def parse_rating(rating):
+    """Returns an OMDb rating as float, 0.0 for "N/A"."""
+    try:
+        return float(rating)
+    except ValueError:
+        return 0.0
 
 
 def get_movies(user_id):
@@ -51,11 +45,26 @@ def get_movies(user_id):
     movies-users cross-reference table.
     Returns a dict of dicts, where the keys of the first dict are
     the movie titles and the values are dicts containing the movie info.
+    The users note is fetched in the same query, so no extra lookups
+    are needed per movie.
+    The result is cached per user and shared between callers,
+    so it must not be modified. A cached collection is only used while
+    the change stamp of the user is the same, so writes of other
+    processes are seen.
     """
-    with engine.connect() as connection:
+    with get_engine().connect() as connection:
+        # the stamp is read before the movies, so a write in between
+        # makes the next read miss instead of being hidden
+        stamp = get_change_stamp(connection, user_id)
+        if stamp is None:
+            return {}
+        movies = collection_cache.get(user_id, stamp)
+        if movies is not None:
+            return movies
+
         result = connection.execute(
             text("""
-                SELECT title, year, rating, poster
+                SELECT title, year, rating, poster, note
                 FROM movies AS m
                 JOIN movies_users AS mu
                 ON m.movie_id = mu.movie_id
@@ -63,67 +72,604 @@ def get_movies(user_id):
                 """),
             {"user_id": user_id}
         )
-        movies = result.fetchall()
+        rows = result.fetchall()
+
+    movies = {
+        row[0]: {
+            "year": row[1],
+            "rating": row[2],
+            "poster": row[3],
+            "note": row[4] or "",
+        }
+        for row in rows
+    }
+    collection_cache.put(user_id, movies, stamp)
+
+    return movies
+
+
+def get_change_stamp(connection, user_id):
+    """
+    Returns the change stamp of the user through the connection,
+    None if the user does not exist.
+    """
+    return connection.execute(
+        text("SELECT change_stamp FROM users WHERE user_id = :user_id"),
+        {"user_id": user_id}
+    ).scalar()
+
+
+def iter_movies(user_id=None, batch_size=1000):
+    """
+    Yields the movies of a user as (title, year, rating, poster, note)
+    tuples, or all movies of the catalog with empty notes if user_id is
+    None. The rows are fetched batch_size at a time from the open cursor,
+    so the memory use does not grow with the number of movies. They come
+    in the order of the primary keys, which needs no sorting.
+    """
+    if user_id is None:
+        query = text("""
+            SELECT title, year, rating, poster, ''
+            FROM movies
+            ORDER BY movie_id
+            """)
+    else:
+        query = text("""
+            SELECT title, year, rating, poster, COALESCE(note, '')
+            FROM movies_users AS mu
+            JOIN movies AS m
+            ON m.movie_id = mu.movie_id
+            WHERE mu.user_id = :user_id
+            ORDER BY mu.movie_id
+            """)
+
+    with get_engine().connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(
+            query, {"user_id": user_id}
+        )
+        while rows := result.fetchmany(batch_size):
+            for row in rows:
+                yield tuple(row)
+
+
+def get_movie_collection(user_id=None):
+    """
+    Returns the movies of a user, or of the catalog if user_id is None,
+    as MovieCollection. The rows are streamed into the columns, no dict
+    per movie is built and the collection cache is not used.
+    """
+    return MovieCollection.from_rows(iter_movies(user_id))
+
+
+def configure_database(db_url=None, **pragmas):
+    """
+    Points the storage layer to another database, e.g. sqlite:// for an
+    in-memory database in tests. Cached collections are dropped.
+    """
+    database.configure(db_url, **pragmas)
+    collection_cache.clear()
+
+
+def query_movies(
+    user_id,
+    sort_by=None,
+    descending=False,
+    year_range=None,
+    rating_range=None,
+    limit=None,
+    offset=0,
+):
+    """
+    Returns the movies of a user like get_movies, but sorted, filtered
+    and limited by the database.
+    sort_by is "title", "year" or "rating", year_range and rating_range
+    are (start, end) tuples including both ends, limit and offset select
+    a page of the results.
+    """
+    conditions = ["mu.user_id = :user_id"]
+    params = {"user_id": user_id}
+
+    if year_range is not None:
+        conditions.append("m.year BETWEEN :year_start AND :year_end")
+        params["year_start"], params["year_end"] = year_range
+    if rating_range is not None:
+        conditions.append("m.rating BETWEEN :rating_start AND :rating_end")
+        params["rating_start"], params["rating_end"] = rating_range
+
+    query = f"""
+        SELECT title, year, rating, poster, note
+        FROM movies AS m
+        JOIN movies_users AS mu
+        ON m.movie_id = mu.movie_id
+        WHERE {" AND ".join(conditions)}
+        """
+
+    if sort_by is not None:
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Can not sort movies by {sort_by}.")
+        direction = "DESC" if descending else "ASC"
+        query += f"ORDER BY {SORT_COLUMNS[sort_by]} {direction}, m.title\n"
+
+    if limit is not None:
+        query += "LIMIT :limit OFFSET :offset"
+        params["limit"] = limit
+        params["offset"] = offset
+
+    with get_engine().connect() as connection:
+        rows = connection.execute(text(query), params).fetchall()
 
     return {
-        row[0]: {"year": row[1], "rating": row[2], "poster": row[3]}
-        for row in movies
+        row[0]: {
+            "year": row[1],
+            "rating": row[2],
+            "poster": row[3],
+            "note": row[4] or "",
+        }
+        for row in rows
     }
 
 
-def add_movie(user_id, title, year, rating, poster):
+def search_movies(user_id, query, limit=20, offset=0):
     """
-    If it is not already in the movie table, add a new movie to the
-    movie table and add a reference to user_id in movies_users table.
+    Searches the titles and the users notes of the movies of a user for
+    query, case insensitive and matching any part of the text. Without
+    user_id the titles of all movies are searched.
+    Returns the matches like get_movies, best matches first, title
+    matches rank above note matches. limit None returns all matches.
     """
-    # check if movie already exits for different user
-    with engine.connect() as connection:
-        results = connection.execute(
-            text("""
-                 SELECT movie_id FROM movies
-                 WHERE movies.title = :title
-                 """),
-            {"title": title},
+    query = query.strip()
+    params = {
+        "user_id": user_id,
+        "limit": -1 if limit is None else limit,
+        "offset": offset,
+    }
+
+    # the trigram index needs at least three characters
+    if len(query) < 3:
+        params["pattern"] = (
+            "%"
+            + query.replace("\\", "\\\\")
+            .replace("%", "\\%")
+            .replace("_", "\\_")
+            + "%"
         )
-        # fetchall returns a list of tuples for every row
-        # accessing list item 0 tupel item 0
-        movie_id = results.scalar()
-
-    # add movie to movies table if it has no entry yet
-    if not movie_id:
-        with engine.connect() as connection:
-            result = connection.execute(
+        sql = """
+            SELECT m.title, m.year, m.rating, m.poster, mu.note
+            FROM movies AS m
+            LEFT JOIN movies_users AS mu
+            ON mu.movie_id = m.movie_id AND mu.user_id = :user_id
+            WHERE (
+                m.title LIKE :pattern ESCAPE '\\'
+                OR mu.note LIKE :pattern ESCAPE '\\'
+            )
+            AND (:user_id IS NULL OR mu.user_id IS NOT NULL)
+            ORDER BY m.title
+            LIMIT :limit OFFSET :offset
+            """
+    else:
+        # search for the query as one phrase
+        params["match"] = '"' + query.replace('"', '""') + '"'
+        # notes of a user have rowids from user_id << 32 on
+        params["note_start"] = (user_id or 0) << 32
+        params["note_end"] = ((user_id or 0) << 32) | 0xFFFFFFFF
+        sql = """
+            SELECT m.title, m.year, m.rating, m.poster, mu.note
+            FROM (
+                SELECT rowid AS movie_id, bm25(movies_fts) AS score
+                FROM movies_fts
+                WHERE movies_fts MATCH :match
+                UNION ALL
+                SELECT rowid & 0xFFFFFFFF, bm25(notes_fts) / 2
+                FROM notes_fts
+                WHERE notes_fts MATCH :match
+                AND :user_id IS NOT NULL
+                AND rowid BETWEEN :note_start AND :note_end
+            ) AS hits
+            JOIN movies AS m
+            ON m.movie_id = hits.movie_id
+            LEFT JOIN movies_users AS mu
+            ON mu.movie_id = m.movie_id AND mu.user_id = :user_id
+            WHERE :user_id IS NULL OR mu.user_id IS NOT NULL
+            GROUP BY m.movie_id
+            ORDER BY MIN(hits.score), m.title
+            LIMIT :limit OFFSET :offset
+            """
+
+    with get_engine().connect() as connection:
+        rows = connection.execute(text(sql), params).fetchall()
+
+    return {
+        row[0]: {
+            "year": row[1],
+            "rating": row[2],
+            "poster": row[3],
+            "note": row[4] or "",
+        }
+        for row in rows
+    }
+
+
+def get_top_movies(user_id, count, sort_by="rating"):
+    """Returns the count movies of a user with the highest sort_by values"""
+    return query_movies(user_id, sort_by=sort_by, descending=True, limit=count)
+
+
+def get_rating_histogram(user_id):
+    """
+    Returns the rating histogram of a user as list of (rating, count)
+    tuples sorted by rating, one entry per rating step of 0.1.
+    The histogram is kept up to date by triggers, so this reads at most
+    101 rows however big the collection is.
+    """
+    with get_engine().connect() as connection:
+        rows = connection.execute(
+            text("""
+                SELECT bucket, movie_count
+                FROM user_rating_histogram
+                WHERE user_id = :user_id
+                ORDER BY bucket
+                """),
+            {"user_id": user_id}
+        ).fetchall()
+    return [(bucket / 10, count) for bucket, count in rows]
+
+
+def get_decade_counts(user_id):
+    """Returns a dict with the number of movies of a user per decade."""
+    with get_engine().connect() as connection:
+        rows = connection.execute(
+            text("""
+                SELECT decade, movie_count
+                FROM user_decade_counts
+                WHERE user_id = :user_id
+                ORDER BY decade
+                """),
+            {"user_id": user_id}
+        ).fetchall()
+    return dict(rows)
+
+
+def get_rating_at(histogram, position):
+    """
+    Returns the rating at a position of the sorted ratings, counted from
+    0, walking the histogram instead of the movies.
+    """
+    for rating, count in histogram:
+        if position < count:
+            return rating
+        position -= count
+    raise IndexError("position is out of the histogram")
+
+
+def get_percentile(histogram, percent):
+    """
+    Returns the percentile of the ratings in the histogram, interpolated
+    between the closest ranks. 50 gives the median.
+    """
+    total = sum(count for _, count in histogram)
+    if total == 0:
+        raise ValueError("Can not get a percentile of no ratings.")
+    position = percent / 100 * (total - 1)
+    lower = int(position)
+    low_rating = get_rating_at(histogram, lower)
+    if lower == position:
+        return low_rating
+    high_rating = get_rating_at(histogram, lower + 1)
+    return low_rating + (high_rating - low_rating) * (position - lower)
+
+
+def get_stats(user_id, percentiles=(25, 50, 75)):
+    """
+    Returns the statistics of a users collection as dict with count,
+    mean, median, min and max rating, the best and worst movies, the
+    percentiles, the rating histogram and the counts per decade, or None
+    if the collection is empty.
+    Everything is derived from the maintained histograms, only the best
+    and worst movies are looked up through the rating index.
+    """
+    histogram = get_rating_histogram(user_id)
+    if not histogram:
+        return None
+
+    count = sum(movie_count for _, movie_count in histogram)
+    min_rating = histogram[0][0]
+    max_rating = histogram[-1][0]
+
+    return {
+        "count": count,
+        "mean": sum(rating * n for rating, n in histogram) / count,
+        "median": get_percentile(histogram, 50),
+        "min_rating": min_rating,
+        "max_rating": max_rating,
+        "best_movies": get_movies_with_rating(user_id, max_rating),
+        "worst_movies": get_movies_with_rating(user_id, min_rating),
+        "percentiles": {
+            percent: get_percentile(histogram, percent)
+            for percent in percentiles
+        },
+        "histogram": dict(histogram),
+        "decades": get_decade_counts(user_id),
+    }
+
+
+def get_movies_with_rating(user_id, rating):
+    """Returns the movies of a user with a rating, sorted by title."""
+    # the histogram buckets are 0.1 wide, so match around the bucket value
+    return query_movies(
+        user_id,
+        sort_by="title",
+        rating_range=(rating - 0.05, rating + 0.05),
+    )
+
+
+def get_random_movies(user_id, count=1, weighted=False, rng=random):
+    """
+    Returns count distinct random movies of a user like get_movies, in
+    the order they were picked. Fewer movies are returned if the user has
+    less than count movies.
+    Every movie of a user has a dense position, so each pick is a single
+    index lookup however big the collection is. With weighted=True the
+    chance of a movie is proportional to its rating, picks are accepted
+    with rating / max rating, unrated movies are never picked then.
+    """
+    # the histogram is read first, the picks share one read transaction
+    histogram = get_rating_histogram(user_id) if weighted else None
+
+    with get_engine().connect() as connection:
+        size = connection.execute(
+            text("""
+                SELECT MAX(position) + 1
+                FROM movies_users
+                WHERE user_id = :user_id
+                """),
+            {"user_id": user_id}
+        ).scalar()
+        if not size:
+            return {}
+        count = min(count, size)
+
+        max_rating = None
+        if histogram:
+            unrated = dict(histogram).get(0.0, 0)
+            # fall back to uniform picks if nothing is rated
+            if unrated < size:
+                max_rating = histogram[-1][0]
+                count = min(count, size - unrated)
+
+        picked = {}
+        while len(picked) < count:
+            positions = rng.sample(range(size), count - len(picked))
+            rows = connection.execute(
                 text("""
-                     INSERT INTO movies (
-                     title, year, rating, poster
-                     ) VALUES (
-                     :title, :year, :rating, :poster
-                     )
-                     RETURNING movie_id
-                    """),
-                {
-                    "title": title,
+                    SELECT mu.position, title, year, rating, poster, note
+                    FROM movies_users AS mu
+                    JOIN movies AS m
+                    ON m.movie_id = mu.movie_id
+                    WHERE mu.user_id = :user_id
+                    AND mu.position IN :positions
+                    """).bindparams(bindparam("positions", expanding=True)),
+                {"user_id": user_id, "positions": positions}
+            ).fetchall()
+            rows_by_position = {row[0]: row for row in rows}
+
+            for position in positions:
+                _, title, year, rating, poster, note = (
+                    rows_by_position[position]
+                )
+                if title in picked:
+                    continue
+                if max_rating and rng.random() * max_rating >= rating:
+                    continue
+                picked[title] = {
                     "year": year,
                     "rating": rating,
                     "poster": poster,
+                    "note": note or "",
                 }
+
+    return picked
+
+
+def get_recommendations(user_id, limit=10):
+    """
+    Returns up to limit movies the user does not have like get_movies,
+    best first. The users sharing the most movies with the user are its
+    neighbours, weighted by the cosine similarity of the collections:
+    the number of shared movies divided by the root of the product of
+    the collection sizes. The score of a movie is the sum of the weights
+    of the neighbours that have it. The counts come from the overlap
+    index the triggers keep up to date, RECOMMENDATION_NEIGHBOURS bounds
+    the collections read. Equal weights and scores are ordered by id,
+    so the result only depends on the current collections.
+    """
+    with get_engine().connect() as connection:
+        overlaps = connection.execute(
+            text("""
+                SELECT
+                    o.other_id,
+                    o.movie_count,
+                    own.movie_count,
+                    other.movie_count
+                FROM user_overlaps AS o
+                JOIN user_overlaps AS own
+                ON own.user_id = o.user_id AND own.other_id = o.user_id
+                JOIN user_overlaps AS other
+                ON other.user_id = o.other_id
+                AND other.other_id = o.other_id
+                WHERE o.user_id = :user_id AND o.other_id != :user_id
+                """),
+            {"user_id": user_id}
+        ).fetchall()
+        weights = dict(
+            heapq.nlargest(
+                RECOMMENDATION_NEIGHBOURS,
+                (
+                    (other_id, shared / math.sqrt(size * other_size))
+                    for other_id, shared, size, other_size in overlaps
+                ),
+                key=lambda item: (item[1], -item[0]),
             )
-            movie_id = result.scalar()
-            connection.commit()
+        )
+        if not weights:
+            return {}
 
-    # add crossreference in both cases
-    with engine.connect() as connection:
-        connection.execute(
+        rows = connection.execute(
+            text("""
+                SELECT mu.movie_id, mu.user_id
+                FROM movies_users AS mu
+                WHERE mu.user_id IN :user_ids
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM movies_users AS own
+                    WHERE own.user_id = :user_id
+                    AND own.movie_id = mu.movie_id
+                )
+                """).bindparams(bindparam("user_ids", expanding=True)),
+            {"user_id": user_id, "user_ids": list(weights)}
+        ).fetchall()
+
+        scores = {}
+        for movie_id, other_id in rows:
+            scores[movie_id] = scores.get(movie_id, 0.0) + weights[other_id]
+        # equal scores keep the older movie first
+        best = heapq.nlargest(
+            limit, scores.items(), key=lambda item: (item[1], -item[0])
+        )
+        if not best:
+            return {}
+
+        rows = connection.execute(
+            text("""
+                SELECT movie_id, title, year, rating, poster
+                FROM movies
+                WHERE movie_id IN :movie_ids
+                """).bindparams(bindparam("movie_ids", expanding=True)),
+            {"movie_ids": [movie_id for movie_id, _ in best]}
+        ).fetchall()
+
+    rows_by_id = {row[0]: row for row in rows}
+    recommendations = {}
+    for movie_id, _ in best:
+        _, title, year, rating, poster = rows_by_id[movie_id]
+        recommendations[title] = {
+            "year": year,
+            "rating": rating,
+            "poster": poster,
+            "note": "",
+        }
+    return recommendations
+
+
+def get_collection_version(user_id):
+    """
+    Returns the version counter of a users movie collection,
+    it increases on every write to the collection.
+    """
+    return collection_cache.get_version(user_id)
+
+
+def get_cache_stats():
+    """Returns the hit and miss counters of the collection cache."""
+    return collection_cache.stats()
+
+
+def add_movie(user_id, title, year, rating, poster):
+    """
+    If it is not already in the movie table, add a new movie to the
+    movie table and add a reference to user_id in movies_users table.
+    Both inserts run in one transaction with a single commit.
+    """
+    with get_engine().begin() as connection:
+        # the no-op update makes RETURNING give back existing movies too
+        result = connection.execute(
+            text("""
+                 INSERT INTO movies (
+                 title, year, rating, poster
+                 ) VALUES (
+                 :title, :year, :rating, :poster
+                 )
+                 ON CONFLICT (title) DO UPDATE SET title = excluded.title
+                 RETURNING movie_id, year, rating, poster
+                """),
+            {
+                "title": title,
+                "year": parse_year(year),
+                "rating": parse_rating(rating),
+                "poster": poster,
+            }
+        )
+        movie_id, year, rating, poster = result.one()
+
+        # add crossreference in both cases
+        result = connection.execute(
             text("""
                  INSERT INTO movies_users (
                  movie_id, user_id
                  ) VALUES (
                  :movie_id, :user_id
                  )
+                 ON CONFLICT (user_id, movie_id) DO NOTHING
+                 RETURNING movie_id
                 """),
             {"movie_id": movie_id, "user_id": user_id}
         )
-        connection.commit()
+        is_new_link = result.scalar() is not None
+        if is_new_link:
+            stamp = get_change_stamp(connection, user_id)
+
+    if is_new_link:
+        collection_cache.add_movie(
+            user_id,
+            title,
+            {"year": year, "rating": rating, "poster": poster, "note": ""},
+            stamp,
+        )
+
+
+def add_movies(user_id, movies):
+    """
+    Adds many movies for a user in one transaction. movies is a list of
+    dicts with the keys title, year, rating and poster. Movies and
+    cross-references that already exist are kept.
+    Returns the number of movies that were new for the user.
+    """
+    if not movies:
+        return 0
+
+    with get_engine().begin() as connection:
+        connection.execute(
+            text("""
+                 INSERT INTO movies (
+                 title, year, rating, poster
+                 ) VALUES (
+                 :title, :year, :rating, :poster
+                 )
+                 ON CONFLICT (title) DO NOTHING
+                """),
+            [
+                dict(
+                    movie,
+                    year=parse_year(movie["year"]),
+                    rating=parse_rating(movie["rating"]),
+                )
+                for movie in movies
+            ]
+        )
+        result = connection.execute(
+            text("""
+                 INSERT INTO movies_users (movie_id, user_id)
+                 SELECT movie_id, :user_id
+                 FROM movies
+                 WHERE title = :title
+                 ON CONFLICT (user_id, movie_id) DO NOTHING
+                """),
+            [{"user_id": user_id, "title": movie["title"]} for movie in movies]
+        )
+        added = result.rowcount
+
+    collection_cache.invalidate(user_id)
+
+    return added
 
 
 def delete_movie(user_id, title):
@@ -131,40 +677,58 @@ def delete_movie(user_id, title):
     Delete movie from the cross-reference table for given user_id and
     from the database, if it is not referenced anymore.
     """
-    with engine.connect() as connection:
-        connection.execute(
+    delete_movies(user_id, [title])
+
+
+def delete_movies(user_id, titles):
+    """
+    Deletes the movies with the titles from the collection of the user
+    and the movies no user references anymore, in one transaction.
+    Returns the number of movies removed from the collection.
+    """
+    titles = list(titles)
+    if not titles:
+        return 0
+
+    with get_engine().begin() as connection:
+        result = connection.execute(
             text("""
-                 DELETE FROM movies_users AS mu
-                 WHERE mu.user_id = user_id
-                 AND mu.movie_id = (
+                 DELETE FROM movies_users
+                 WHERE user_id = :user_id
+                 AND movie_id IN (
                     SELECT movie_id
                     FROM movies
-                    WHERE movies.title = :title
+                    WHERE title IN :titles
                 )
-                 """),
-            {"title": title, "user_id": user_id}
+                 """).bindparams(bindparam("titles", expanding=True)),
+            {"user_id": user_id, "titles": titles}
         )
-        connection.commit()
+        removed = result.rowcount
+        stamp = get_change_stamp(connection, user_id)
 
-    with engine.connect() as connection:
+        # anti-join on the movie_id index of movies_users
         connection.execute(
             text("""
                  DELETE FROM movies
-                 WHERE title = :title
-                 AND movie_id NOT IN (
-                    SELECT movie_id
-                    FROM movies_users
+                 WHERE title IN :titles
+                 AND NOT EXISTS (
+                    SELECT 1
+                    FROM movies_users AS mu
+                    WHERE mu.movie_id = movies.movie_id
                 )
-                 """),
-            {"title": title}
+                 """).bindparams(bindparam("titles", expanding=True)),
+            {"titles": titles}
         )
-        connection.commit()
+
+    collection_cache.remove_movies(user_id, titles, stamp, removed)
+
+    return removed
 
 
 def update_movie_note(user_id, title, note):
     """Update a movies note in the database."""
-    with engine.connect() as connection:
-        connection.execute(
+    with get_engine().begin() as connection:
+        result = connection.execute(
             text("""
                  UPDATE movies_users
                  SET
@@ -178,12 +742,15 @@ def update_movie_note(user_id, title, note):
                  """),
             {"user_id": user_id, "title": title, "note": note}
         )
-        connection.commit()
+        updated = result.rowcount
+        stamp = get_change_stamp(connection, user_id)
+
+    collection_cache.set_note(user_id, title, note, stamp, updated)
 
 
 def get_movie_note(user_id, title):
     """Returns a movie note from the database."""
-    with engine.connect() as connection:
+    with get_engine().connect() as connection:
         result = connection.execute(
             text("""
                  SELECT note
@@ -202,26 +769,88 @@ def get_movie_note(user_id, title):
         return result.fetchall()[0][0]
 
 
+def get_movie_notes(user_id, titles):
+    """
+    Returns the notes of a user for all given movie titles in one query.
+    Returns a dict with the titles as keys and the notes as values,
+    movies without a note get an empty string.
+    """
+    titles = list(titles)
+    if not titles:
+        return {}
+
+    with get_engine().connect() as connection:
+        result = connection.execute(
+            text("""
+                 SELECT m.title, mu.note
+                 FROM movies AS m
+                 JOIN movies_users AS mu
+                 ON m.movie_id = mu.movie_id
+                 WHERE mu.user_id = :user_id
+                 AND m.title IN :titles
+                 """).bindparams(bindparam("titles", expanding=True)),
+            {"user_id": user_id, "titles": titles}
+        )
+        notes = result.fetchall()
+
+    return {row[0]: row[1] or "" for row in notes}
+
 
 def get_users():
     """
     Retrieve all users from the database.
     Returns a list of user names
     """
-    with engine.connect() as connection:
+    with get_engine().connect() as connection:
         result = connection.execute(text("SELECT name FROM users"))
         users = result.fetchall()
 
     return users
 
 
+def get_user_stamps():
+    """
+    Returns (user_id, name, change_stamp) tuples of all users, sorted by
+    name. The change stamp increases with every change of the users
+    movies.
+    """
+    with get_engine().connect() as connection:
+        result = connection.execute(
+            text("""
+                SELECT user_id, name, change_stamp
+                FROM users
+                ORDER BY name
+                """)
+        )
+        return [tuple(row) for row in result.fetchall()]
+
+
+def get_poster_urls(user_ids):
+    """Returns the set of poster urls of the movies of the users."""
+    if not user_ids:
+        return set()
+    with get_engine().connect() as connection:
+        result = connection.execute(
+            text("""
+                SELECT DISTINCT poster
+                FROM movies_users AS mu
+                JOIN movies AS m
+                ON m.movie_id = mu.movie_id
+                WHERE mu.user_id IN :user_ids
+                """).bindparams(bindparam("user_ids", expanding=True)),
+            {"user_ids": list(user_ids)}
+        )
+        return {row[0] for row in result.fetchall()}
+
+
 def get_user_id(name):
     """
     Returns a user id for a given user name.
     """
-    with engine.connect() as connection:
+    with get_engine().connect() as connection:
         result = connection.execute(
-            text(f"SELECT user_id FROM users WHERE name = '{name}'")
+            text("SELECT user_id FROM users WHERE name = :name"),
+            {"name": name}
         )
         result_list = result.fetchall()
 
@@ -236,60 +865,94 @@ def add_user(name):
     """
     Adds a new user with name name and returns its user id.
     """
-    with engine.connect() as connection:
+    with get_engine().begin() as connection:
         result = connection.execute(
-            text(f"INSERT INTO users (name) VALUES ('{name}')")
-        )
-        connection.commit()
-
-    with engine.connect() as connection:
-        result = connection.execute(
-            text(f"SELECT user_id FROM users WHERE name = '{name}'")
+            text("INSERT INTO users (name) VALUES (:name) RETURNING user_id"),
+            {"name": name}
         )
-        result_list = result.fetchall()
-
-    user_id = result_list[0][0]
+        user_id = result.scalar()
 
     return user_id
 
 
 def delete_user(name):
     """
-    Deletes user with name name.
+    Deletes user with name name, the cross-references of the user and all
+    movies no other user references anymore in one transaction.
+    """
+    delete_users([name])
+
+
+def delete_users(names):
     """
-    # delete movies from user
-    with engine.connect() as connection:
+    Deletes the users with the names and all movies no other user
+    references in one transaction. The cross-references of the users
+    are deleted by the foreign keys. Returns the number of deleted users.
+    """
+    names = list(names)
+    if not names:
+        return 0
+
+    with get_engine().begin() as connection:
+        result = connection.execute(
+            text("SELECT user_id FROM users WHERE name IN :names").bindparams(
+                bindparam("names", expanding=True)
+            ),
+            {"names": names}
+        )
+        user_ids = [row[0] for row in result.fetchall()]
+
+        if not user_ids:
+            return 0
+
+        # the movies of the users are the candidates for the cleanup,
+        # their cross-references are deleted with the users
         connection.execute(
             text("""
-                DELETE FROM movies
-                WHERE movie_id IN (
-                    SELECT m.movie_id
-                    FROM movies AS m
-                    JOIN movies_user AS mu
-                        ON m.movie_id = mu.movie_id
-                    JOIN users AS u
-                        ON u.user_id = mu.user_id
-                    WHERE u.name = :name
+                CREATE TEMP TABLE IF NOT EXISTS deleted_movies (
+                    movie_id INTEGER PRIMARY KEY
                 )
-            """),
-            {"name": name}
+            """)
         )
-        connection.commit()
-
-    # delete cross-referencing entries from movies_users
-    with engine.connect() as connection:
         connection.execute(
             text("""
-                DELETE FROM movies_user
-                WHERE user_id IN (
-                    SELECT user_id FROM users WHERE name = :name
+                INSERT OR IGNORE INTO temp.deleted_movies (movie_id)
+                SELECT movie_id
+                FROM movies_users
+                WHERE user_id IN :user_ids
+            """).bindparams(bindparam("user_ids", expanding=True)),
+            {"user_ids": user_ids}
+        )
+        # the overlaps of the users go as a whole, so the trigger
+        # skips their cascaded cross-references
+        connection.execute(
+            text("""
+                DELETE FROM user_overlaps
+                WHERE user_id IN :user_ids OR other_id IN :user_ids
+            """).bindparams(bindparam("user_ids", expanding=True)),
+            {"user_ids": user_ids}
+        )
+        connection.execute(
+            text("DELETE FROM users WHERE user_id IN :user_ids").bindparams(
+                bindparam("user_ids", expanding=True)
+            ),
+            {"user_ids": user_ids}
+        )
+        # anti-join on the movie_id index of movies_users
+        connection.execute(
+            text("""
+                DELETE FROM movies
+                WHERE movie_id IN (SELECT movie_id FROM temp.deleted_movies)
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM movies_users AS mu
+                    WHERE mu.movie_id = movies.movie_id
                 )
-            """),
-            {"name": name}
+            """)
         )
-        connection.commit()
+        connection.execute(text("DROP TABLE temp.deleted_movies"))
 
-    # delete user
-    with engine.connect() as connection:
-        connection.execute(text(f"DELETE FROM users WHERE name = '{name}'"))
-        connection.commit()
+    for user_id in user_ids:
+        collection_cache.invalidate(user_id)
+
+    return len(user_ids)
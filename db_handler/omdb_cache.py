@@ -0,0 +1,206 @@
+"""
+Persistent cache for OMDb API responses.
+
+Responses are stored in the omdb_cache table keyed by the normalized
+title, so repeated and cross-user lookups of a title do not need the
+network. Found movies are also stored under their normalized OMDb title
+and can be looked up by imdbID. "Movie not found" answers are cached
+with a shorter time to live.
+"""
+import json
+import time
+
+from sqlalchemy import text
+
+from . import database
+from .database import get_engine, get_setting
+
+
+# time to live of cached responses in seconds
+DEFAULT_TTL = 30 * 24 * 60 * 60
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60
+
+NOT_FOUND_ERROR = "Movie not found!"
+
+# (found, not found) time to live read from the settings, loaded once
+# per engine, so cache lookups do not read the .env file
+_ttls = None
+
+
+def normalize_title(title):
+    """Returns the title in lower case with collapsed whitespace."""
+    return " ".join(title.lower().split())
+
+
+def load_ttls(engine=None):
+    """
+    Reads the time to live settings and keeps them until the next engine
+    is created. Called as engine hook, engine is not used.
+    """
+    global _ttls
+    _ttls = (
+        float(get_setting("MOVIEBRAIN_OMDB_CACHE_TTL", DEFAULT_TTL)),
+        float(
+            get_setting("MOVIEBRAIN_OMDB_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL)
+        ),
+    )
+
+
+def get_ttl():
+    """Returns the time to live for found movies in seconds."""
+    if _ttls is None:
+        load_ttls()
+    return _ttls[0]
+
+
+def get_negative_ttl():
+    """Returns the time to live for not found movies in seconds."""
+    if _ttls is None:
+        load_ttls()
+    return _ttls[1]
+
+
+def is_cacheable(data):
+    """
+    Returns True for found movies and not found answers, errors like an
+    invalid key or an exceeded request limit are not cached.
+    """
+    if data.get("Response") == "True":
+        return True
+    return data.get("Error") == NOT_FOUND_ERROR
+
+
+def is_fresh(data, fetched_at, now):
+    """Returns True if a cached response is within its time to live."""
+    if data.get("Response") == "True":
+        ttl = get_ttl()
+    else:
+        ttl = get_negative_ttl()
+    return now - fetched_at <= ttl
+
+
+def get_response(title):
+    """
+    Returns the cached OMDb response for a title as dict,
+    or None if there is no fresh response.
+    """
+    with get_engine().connect() as connection:
+        row = connection.execute(
+            text("""
+                 SELECT response, fetched_at
+                 FROM omdb_cache
+                 WHERE lookup_key = :lookup_key
+                 """),
+            {"lookup_key": normalize_title(title)}
+        ).first()
+
+    if row is None:
+        return None
+
+    data = json.loads(row[0])
+    if not is_fresh(data, row[1], time.time()):
+        return None
+
+    return data
+
+
+def get_response_by_imdb_id(imdb_id):
+    """
+    Returns the cached OMDb response for an imdbID as dict,
+    or None if there is no fresh response.
+    """
+    with get_engine().connect() as connection:
+        row = connection.execute(
+            text("""
+                 SELECT response, fetched_at
+                 FROM omdb_cache
+                 WHERE imdb_id = :imdb_id
+                 ORDER BY fetched_at DESC
+                 LIMIT 1
+                 """),
+            {"imdb_id": imdb_id}
+        ).first()
+
+    if row is None:
+        return None
+
+    data = json.loads(row[0])
+    if not is_fresh(data, row[1], time.time()):
+        return None
+
+    return data
+
+
+def save_response(title, data):
+    """
+    Stores an OMDb response for the looked up title and, for found movies,
+    also for the title OMDb returned. Uncacheable errors are ignored.
+    """
+    if not is_cacheable(data):
+        return
+
+    keys = {normalize_title(title)}
+    if data.get("Response") == "True":
+        keys.add(normalize_title(data["Title"]))
+
+    response = json.dumps(data)
+    fetched_at = time.time()
+
+    with get_engine().begin() as connection:
+        connection.execute(
+            text("""
+                 INSERT INTO omdb_cache (
+                 lookup_key, imdb_id, response, fetched_at
+                 ) VALUES (
+                 :lookup_key, :imdb_id, :response, :fetched_at
+                 )
+                 ON CONFLICT (lookup_key) DO UPDATE SET
+                   imdb_id = excluded.imdb_id,
+                   response = excluded.response,
+                   fetched_at = excluded.fetched_at
+                 """),
+            [
+                {
+                    "lookup_key": key,
+                    "imdb_id": data.get("imdbID"),
+                    "response": response,
+                    "fetched_at": fetched_at,
+                }
+                for key in keys
+            ]
+        )
+
+
+def get_or_fetch(title, fetch):
+    """
+    Returns the cached response for the title, calling fetch(title) and
+    caching its answer if there is none. Errors of fetch are passed on.
+    """
+    data = get_response(title)
+    if data is None:
+        data = fetch(title)
+        save_response(title, data)
+    return data
+
+
+def purge_expired():
+    """Deletes all cached responses that are older than their TTL."""
+    now = time.time()
+
+    with get_engine().begin() as connection:
+        result = connection.execute(
+            text("""
+                 DELETE FROM omdb_cache
+                 WHERE (imdb_id IS NOT NULL AND fetched_at < :found_limit)
+                 OR (imdb_id IS NULL AND fetched_at < :negative_limit)
+                 """),
+            {
+                "found_limit": now - get_ttl(),
+                "negative_limit": now - get_negative_ttl(),
+            }
+        )
+
+    return result.rowcount
+
+
+database.add_engine_hook(load_ttls)
@@ -0,0 +1,13 @@
+from .movie_exporter import (
+    EXPORT_FORMATS,
+    get_export_format,
+    write_movies,
+    export_movies,
+)
+
+__all__ = [
+    "EXPORT_FORMATS",
+    "get_export_format",
+    "write_movies",
+    "export_movies",
+]
@@ -0,0 +1,121 @@
+"""
+Streaming export of movie collections to JSON, NDJSON and CSV files.
+
+Rows are read from the database cursor in batches and written one by
+one, so the memory use stays flat however many movies are exported.
+Files ending in .gz are gzip compressed. The JSON and NDJSON files hold
+movie objects with a title key, which the importer reads back.
+"""
+import csv
+import gzip
+import json
+
+from db_handler import movie_storage_sql as storage
+
+
+EXPORT_FIELDS = ("title", "year", "rating", "poster", "note")
+EXPORT_FORMATS = ("json", "ndjson", "csv")
+DEFAULT_BATCH_SIZE = 1000
+
+
+def get_export_format(file_path):
+    """
+    Returns the export format for the extension of the file path,
+    .gz is ignored and unknown extensions give json.
+    """
+    name = file_path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    for export_format in EXPORT_FORMATS:
+        if name.endswith("." + export_format):
+            return export_format
+    if name.endswith(".jsonl"):
+        return "ndjson"
+    return "json"
+
+
+def format_json(row):
+    """Returns a row as JSON movie object."""
+    return json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False)
+
+
+def write_json(rows, handle):
+    """Writes the rows as JSON array of movie objects."""
+    count = 0
+    handle.write("[")
+    for row in rows:
+        if count:
+            handle.write(",")
+        handle.write("\n")
+        handle.write(format_json(row))
+        count += 1
+    handle.write("\n]\n")
+    return count
+
+
+def write_ndjson(rows, handle):
+    """Writes the rows as one JSON movie object per line."""
+    count = 0
+    for row in rows:
+        handle.write(format_json(row))
+        handle.write("\n")
+        count += 1
+    return count
+
+
+def write_csv(rows, handle):
+    """Writes the rows as CSV with a header line."""
+    writer = csv.writer(handle)
+    writer.writerow(EXPORT_FIELDS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+WRITERS = {
+    "json": write_json,
+    "ndjson": write_ndjson,
+    "csv": write_csv,
+}
+
+
+def write_movies(rows, handle, export_format="json"):
+    """
+    Writes (title, year, rating, poster, note) rows to an open text file.
+    Returns the number of rows written.
+    """
+    if export_format not in WRITERS:
+        raise ValueError(f"Can not export movies as {export_format}.")
+    return WRITERS[export_format](rows, handle)
+
+
+def open_export_file(file_path, compress=None):
+    """
+    Opens a file for writing text, gzip compressed if compress is True
+    or, with compress None, if the name ends in .gz.
+    """
+    if compress is None:
+        compress = file_path.lower().endswith(".gz")
+    if compress:
+        return gzip.open(file_path, "wt", newline="", encoding="utf-8")
+    return open(file_path, "w", newline="", encoding="utf-8")
+
+
+def export_movies(
+    file_path,
+    user_id=None,
+    export_format=None,
+    compress=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+):
+    """
+    Exports the movies of a user, or the whole catalog if user_id is
+    None, to a file. The format defaults to the one of the extension.
+    Returns the number of exported movies.
+    """
+    export_format = export_format or get_export_format(file_path)
+    rows = storage.iter_movies(user_id, batch_size=batch_size)
+    with open_export_file(file_path, compress) as handle:
+        return write_movies(rows, handle, export_format)
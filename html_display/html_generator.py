@@ -1,29 +1,58 @@
-import threading
-import logging
-from livereload import Server
+import hashlib
+import json
+import os
+from html import escape
 
+from metrics_handler import metrics
 
-HTML_TEMPLATE_FILE = "html_display/template.html"
-HTML_OUTPUT_FILENAME = "html_display/index.html"
-CSS_FILENAME = "html_display/style.css"
-HTML_LOCAL_URL = "http://localhost:8080/html_display/index.html"
+from . import poster_store, preview_server
 
 
-def start_livereload():
-    """configures and starts the http livereload"""
-    # disable logging, so it does not clutter the cli
-    logging.disable(logging.CRITICAL)
+HTML_TEMPLATE_FILE = "html_display/template.html"
+FEED_TEMPLATE_FILE = "html_display/feed_template.html"
+DATA_DIR = "html_display/data"
+DATA_INDEX_FILENAME = "html_display/data/movies.json"
+# number of movies per data feed file
+CHUNK_SIZE = 500
+HTML_OUTPUT_FILENAME = "html_display/index.html"
+PREVIEW_PORT = 8080
+HTML_LOCAL_URL = f"http://localhost:{PREVIEW_PORT}/html_display/index.html"
+PLACEHOLDER = "__REPLACE_MOVIES_INFO__"
+# the fragment cache is emptied when it grows past this size
+MAX_CACHED_FRAGMENTS = 200000
+# pages get larger changes as new feed instead of changed rows
+MAX_PATCH_ROWS = 500
 
-    local_server = Server()
-    local_server.watch(HTML_OUTPUT_FILENAME)
-    local_server.watch(CSS_FILENAME)
-    # local address http://localhost:8080
-    local_server.serve(root=".", port=8080)
+_template_parts = None
+_feed_template = None
+# html fragments of the movies keyed by the data they were made from
+_fragment_cache = {}
+# content hashes of the written html files, chunks of the data feed
+# are dropped when their files are deleted
+_written_hashes = {}
+# chunk files listed in the current data feed index
+_feed_chunks = set()
+# rows of the current data feed, to find the changed rows
+_feed_rows = []
+_preview_server = None
 
 
-# Run livereload in a separate thread in parallel
-thread = threading.Thread(target=start_livereload, daemon=True)
-thread.start()
+def start_preview_server():
+    """
+    Starts the preview server in a background thread on the first call,
+    so importing this module opens no port. If the port is taken the
+    browser view is still written, but not served.
+    Returns the server or None.
+    """
+    global _preview_server
+    if _preview_server is None:
+        server = preview_server.PreviewServer(root=".", port=PREVIEW_PORT)
+        try:
+            server.start()
+        except OSError:
+            return None
+        _preview_server = server
+    return _preview_server
 
 
 def show_link():
@@ -42,69 +71,271 @@ def read_template(file_path):
         return handle.read()
 
 
-def format_data(movie_dict):
-    """Aggregates and returns a string from the input data"""
+def get_template_parts():
+    """
+    Returns the template as the parts before and after the placeholder,
+    the template file is only read on first use
+    """
+    global _template_parts
+    if _template_parts is None:
+        head, _, tail = read_template(HTML_TEMPLATE_FILE).partition(
+            PLACEHOLDER
+        )
+        _template_parts = (head, tail)
+    return _template_parts
+
 
-    data_string = ""
+def get_feed_template():
+    """
+    Returns the page of the browser view, the template file is only read
+    on first use
+    """
+    global _feed_template
+    if _feed_template is None:
+        _feed_template = read_template(FEED_TEMPLATE_FILE)
+    return _feed_template
 
-    if movie_dict:
-        for movie, info in movie_dict.items():
-            data_string += serialize_movie(movie, info)
-    else:
-        data_string += serialize_no_movie()
 
-    return data_string
+def format_data(movie_dict, posters=None):
+    """
+    Aggregates and returns a string from the input data
+    The html fragment of every movie is cached, keyed by the data it was
+    made from, so only new or changed movies are serialized again.
+    posters are the stored posters by url, they are looked up if not given
+    """
+    if not movie_dict:
+        return serialize_no_movie()
+
+    if posters is None:
+        posters = poster_store.get_local_posters(
+            [info["poster"] for info in movie_dict.values()]
+        )
+
+    if len(_fragment_cache) >= MAX_CACHED_FRAGMENTS:
+        _fragment_cache.clear()
+
+    fragments = []
+    for movie, info in movie_dict.items():
+        poster = posters.get(info["poster"])
+        key = (
+            movie,
+            info["year"],
+            info["rating"],
+            info["note"],
+            info["poster"],
+            poster["thumbnail"] if poster else None,
+        )
+        fragment = _fragment_cache.get(key)
+        if fragment is None:
+            fragment = serialize_movie(movie, info, poster)
+            _fragment_cache[key] = fragment
+        fragments.append(fragment)
+
+    return "".join(fragments)
 
 
+@metrics.timed("moviebrain_html_seconds", step="generate_html_file")
 def generate_html_file(movie_dict):
-    write_html(HTML_OUTPUT_FILENAME, create_html_string(movie_dict))
+    """
+    Updates the browser view, the page itself only changes with the
+    template, the movies are written to the data feed it loads
+    """
+    is_changed = write_html(HTML_OUTPUT_FILENAME, get_feed_template())
+    if is_changed and _preview_server is not None:
+        _preview_server.publish("reload", {})
+    write_data_feed(movie_dict)
 
 
-def create_html_string(movie_dict):
+def serialize_rows(movie_dict):
     """
-    Reads the template file and replaces the placeholder
-    text with the generated html code
+    Returns the movies as compact rows of
+    [title, year, rating, note, poster src, poster srcset]
     """
-    return read_template(HTML_TEMPLATE_FILE).replace(
-        "__REPLACE_MOVIES_INFO__", format_data(movie_dict)
-    )
+    if not movie_dict:
+        return []
+
+    with metrics.timer("moviebrain_html_seconds", step="posters"):
+        posters = poster_store.get_local_posters(
+            [info["poster"] for info in movie_dict.values()]
+        )
+
+    rows = []
+    for movie, info in movie_dict.items():
+        src, srcset = get_poster_sources(info, posters.get(info["poster"]))
+        rows.append(
+            [movie, info["year"], info["rating"], info["note"], src, srcset]
+        )
+    return rows
+
+
+def write_data_feed(movie_dict):
+    """
+    Writes the movies as data feed for the browser view: chunk files of
+    CHUNK_SIZE rows named by the hash of their content and an index file
+    listing them. Only new chunks and a changed index are written, so an
+    update is a small delta. Chunks no longer listed are deleted.
+    The change is pushed to the pages of the preview server.
+    Returns True if the index changed.
+    """
+    global _feed_chunks, _feed_rows
+    os.makedirs(DATA_DIR, exist_ok=True)
+    rows = serialize_rows(movie_dict)
+
+    chunk_names = []
+    for start in range(0, len(rows), CHUNK_SIZE):
+        content = json.dumps(
+            rows[start:start + CHUNK_SIZE],
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        name = f"movies-{content_hash[:16]}.json"
+        chunk_path = os.path.join(DATA_DIR, name)
+        if not os.path.exists(chunk_path):
+            write_html(chunk_path, content)
+        chunk_names.append(name)
+
+    version = hashlib.sha256(" ".join(chunk_names).encode()).hexdigest()
+    index = {
+        "version": version[:16],
+        "count": len(rows),
+        "chunk_size": CHUNK_SIZE,
+        "chunks": chunk_names,
+    }
+    is_changed = write_html(DATA_INDEX_FILENAME, json.dumps(index))
+
+    if is_changed:
+        # keep the chunks of the previous index for browsers still
+        # loading them
+        keep = set(chunk_names) | _feed_chunks
+        for name in os.listdir(DATA_DIR):
+            if name.startswith("movies-") and name not in keep:
+                chunk_path = os.path.join(DATA_DIR, name)
+                os.remove(chunk_path)
+                _written_hashes.pop(chunk_path, None)
+        _feed_chunks = set(chunk_names)
+
+    publish_feed(index, get_changed_rows(_feed_rows, rows), is_changed)
+    _feed_rows = rows
+
+    return is_changed
+
+
+def get_changed_rows(old_rows, new_rows):
+    """
+    Returns a dict with the positions and rows of new_rows that differ
+    from old_rows at the same position
+    """
+    return {
+        position: row
+        for position, row in enumerate(new_rows)
+        if position >= len(old_rows) or old_rows[position] != row
+    }
+
+
+def publish_feed(index, changed_rows, is_changed):
+    """
+    Pushes a new data feed to the pages of the preview server. Pages
+    patch up to MAX_PATCH_ROWS changed rows in place, on larger changes
+    they load the new feed.
+    """
+    if _preview_server is None:
+        return
+    _preview_server.set_current("feed", index)
+    if not is_changed:
+        return
+    if len(changed_rows) <= MAX_PATCH_ROWS:
+        _preview_server.publish("patch", dict(index, rows=changed_rows))
+    else:
+        _preview_server.publish("feed", index)
+
+
+def get_file_hash(file_path):
+    """Returns the SHA-256 hash of a file or None if it does not exist"""
+    try:
+        with open(file_path, "rb") as handle:
+            return hashlib.sha256(handle.read()).hexdigest()
+    except FileNotFoundError:
+        return None
 
 
 def write_html(file_path, html_string):
-    """Returns the content of the template file as string"""
-    with open(file_path, "w") as handle:
-        handle.write(html_string)
+    """
+    Writes the html string to the file, if it differs from the content of
+    the file. The file is replaced atomically, so the browser never loads
+    a half written page.
+    Returns True if the file was written.
+    """
+    content = html_string.encode()
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    if file_path not in _written_hashes:
+        _written_hashes[file_path] = get_file_hash(file_path)
+    if _written_hashes[file_path] == content_hash:
+        return False
+
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as handle:
+        handle.write(content)
+    os.replace(temp_path, file_path)
+    _written_hashes[file_path] = content_hash
+
+    return True
 
 
 def serialize_no_movie():
-    data_string = ""
-    data_string += '<li style="max-width=360px">\n'
-    data_string += '<div class="movie" title="November rain.">\n'
-    data_string += '<img class="movie-poster" src="no_results.jpg"/>\n'
-    data_string += '<div class="movie-title">Sorry, no movies yet.</div>\n'
-    data_string += '<div class="movie-year">____</div>\n'
-    data_string += "</div>\n"
-    data_string += "</li>"
+    return (
+        '<li style="max-width=360px">\n'
+        '<div class="movie" title="November rain.">\n'
+        '<img class="movie-poster" src="no_results.jpg"/>\n'
+        '<div class="movie-title">Sorry, no movies yet.</div>\n'
+        '<div class="movie-year">____</div>\n'
+        "</div>\n"
+        "</li>"
+    )
+
 
-    return data_string
+def get_poster_sources(info, poster):
+    """
+    Returns the src and srcset of the poster image of a movie, pointing to
+    the local thumbnail and poster if the poster is stored locally.
+    The srcset is empty if there is no thumbnail.
+    """
+    if poster:
+        thumbnail_url = poster_store.get_thumbnail_url(poster)
+        if poster["thumbnail"] == poster["file"]:
+            return thumbnail_url, ""
+        return (
+            thumbnail_url,
+            f"{thumbnail_url} {poster_store.THUMBNAIL_WIDTH}w, "
+            + f"{poster_store.get_poster_url(poster)} 300w",
+        )
+    if poster_store.is_remote(info["poster"]):
+        return info["poster"], ""
+    return "no_results.jpg", ""
 
 
-def serialize_movie(movie, info):
+def serialize_poster(info, poster):
+    """Returns the lazy loading img tag for a movie"""
+    src, srcset = get_poster_sources(info, poster)
+    if srcset:
+        return (
+            '<img class="movie-poster" loading="lazy"\n'
+            f'src="{escape(src)}"\n'
+            f'srcset="{escape(srcset)}"\n'
+            'sizes="21vw"/>\n'
+        )
+    return f'<img class="movie-poster" loading="lazy"\nsrc="{escape(src)}"/>\n'
+
+
+def serialize_movie(movie, info, poster=None):
     """wraps data retrieved from a single object in html code"""
-    data_string = ""
-    # add html and data to output string
-    data_string += "<li>\n"
-    data_string += '<div class="movie" title="' + info["note"] + '">\n'
-    data_string += '<img class="movie-poster"\n'
-    data_string += 'src="' + info["poster"] + '"/>\n'
-    data_string += '<div class="movie-title">' + movie + "</div>"
-    data_string += (
-        '<div class="movie-info">'
-        + str(info["year"])
-        + " / "
-        + str(info["rating"])
-        + "</div>"
+    return (
+        "<li>\n"
+        f'<div class="movie" title="{escape(info["note"])}">\n'
+        f"{serialize_poster(info, poster)}"
+        f'<div class="movie-title">{escape(movie)}</div>'
+        f'<div class="movie-info">{info["year"]} / {info["rating"]}</div>'
+        "</div>\n"
+        "</li>"
     )
-    data_string += "</div>\n" + "</li>"
-
-    return data_string
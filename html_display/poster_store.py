@@ -0,0 +1,156 @@
+"""
+Local store for the movie posters shown in the browser view.
+
+Every poster is downloaded once and saved under html_display/posters with
+the SHA-256 hash of its content as file name, together with a small
+thumbnail. A manifest maps the poster urls to the local files, so later
+page loads only use local files and work offline. Missing posters are
+downloaded concurrently. Thumbnails need Pillow, without it the full
+poster is used as thumbnail.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+POSTER_DIR = "html_display/posters"
+# paths of the posters relative to the html file
+POSTER_URL_PATH = "posters"
+MANIFEST_FILENAME = "manifest.json"
+THUMBNAIL_WIDTH = 150
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_TIMEOUT = 10
+
+_manifest = None
+# urls that failed to download in this session, they are not retried
+# on every page update
+_failed_urls = set()
+
+
+def get_manifest_path():
+    return os.path.join(POSTER_DIR, MANIFEST_FILENAME)
+
+
+def load_manifest():
+    """Returns the url to file mapping, read from disk on first use."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(get_manifest_path(), "r") as handle:
+                _manifest = json.load(handle)
+        except (FileNotFoundError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def save_manifest(manifest):
+    """Writes the manifest atomically, so readers never see half a file."""
+    temp_path = get_manifest_path() + ".tmp"
+    with open(temp_path, "w") as handle:
+        json.dump(manifest, handle)
+    os.replace(temp_path, get_manifest_path())
+
+
+def is_remote(url):
+    return url.startswith("http://") or url.startswith("https://")
+
+
+def create_thumbnail(source_path, thumbnail_path):
+    """
+    Saves a copy of the image scaled to THUMBNAIL_WIDTH.
+    Returns False if Pillow is not installed or the image is unreadable.
+    """
+    if Image is None:
+        return False
+    try:
+        with Image.open(source_path) as image:
+            image.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 4))
+            image.save(thumbnail_path)
+    except OSError:
+        return False
+    return True
+
+
+def download_poster(session, url):
+    """
+    Downloads a poster and saves it with its content hash as name.
+    Returns a dict with the file and thumbnail names or None on errors.
+    """
+    import requests
+
+    try:
+        response = session.get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        return None
+
+    content = response.content
+    extension = os.path.splitext(url.split("?")[0])[1] or ".jpg"
+    name = hashlib.sha256(content).hexdigest()
+    file_name = name + extension
+    thumbnail_name = name + ".thumb" + extension
+
+    file_path = os.path.join(POSTER_DIR, file_name)
+    if not os.path.exists(file_path):
+        with open(file_path, "wb") as handle:
+            handle.write(content)
+
+    thumbnail_path = os.path.join(POSTER_DIR, thumbnail_name)
+    if not os.path.exists(thumbnail_path):
+        if not create_thumbnail(file_path, thumbnail_path):
+            thumbnail_name = file_name
+
+    return {"file": file_name, "thumbnail": thumbnail_name}
+
+
+def get_local_posters(urls):
+    """
+    Makes sure all poster urls are stored locally, downloading the missing
+    ones concurrently.
+    Returns a dict with the urls as keys and dicts with the file and
+    thumbnail names as values. Urls that failed to download are missing.
+    The dict is shared, callers must not modify it.
+    """
+    manifest = load_manifest()
+    missing = {
+        url
+        for url in set(urls).difference(manifest, _failed_urls)
+        if is_remote(url)
+    }
+
+    if missing:
+        # imported here, as pages with only stored posters need no http
+        import requests
+
+        os.makedirs(POSTER_DIR, exist_ok=True)
+        workers = min(DOWNLOAD_WORKERS, len(missing))
+        with requests.Session() as session:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(
+                    lambda url: (url, download_poster(session, url)),
+                    missing,
+                )
+                for url, poster in results:
+                    if poster is None:
+                        _failed_urls.add(url)
+                    else:
+                        manifest[url] = poster
+        save_manifest(manifest)
+
+    return manifest
+
+
+def get_poster_url(poster):
+    """Returns the path of a local poster file relative to the html file"""
+    return POSTER_URL_PATH + "/" + poster["file"]
+
+
+def get_thumbnail_url(poster):
+    """Returns the path of a local thumbnail relative to the html file"""
+    return POSTER_URL_PATH + "/" + poster["thumbnail"]
@@ -0,0 +1,134 @@
+"""
+Preview server for the browser view.
+
+Serves the project files like a static web server and pushes change
+events to the open pages as Server-Sent Events on /events. The renderer
+publishes an event the moment it writes new data, so the pages update
+in place without polling or watching files. A page that connects gets
+the current state first, so it never misses a change.
+"""
+import json
+import queue
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+EVENTS_PATH = "/events"
+# seconds between keep-alive comments on idle event streams
+KEEPALIVE_INTERVAL = 15
+# milliseconds browsers wait before reconnecting a lost event stream
+RECONNECT_DELAY = 1000
+
+
+def format_event(event, data):
+    """Returns an event in the Server-Sent Events wire format."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class PreviewHandler(SimpleHTTPRequestHandler):
+    """Serves the files of the root directory and the event stream."""
+
+    def do_GET(self):
+        if self.path == EVENTS_PATH:
+            self.server.preview.stream_events(self)
+        else:
+            super().do_GET()
+
+    def log_message(self, *args):
+        # the cli shares the terminal with the server
+        pass
+
+
+class PreviewServer:
+    """Static file and event stream server running in a background thread"""
+
+    def __init__(self, root=".", host="localhost", port=8080):
+        self.root = root
+        self.host = host
+        self.port = port
+        self._subscribers = set()
+        self._current = None
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        """
+        Starts serving in a daemon thread.
+        Raises OSError if the port is not available.
+        """
+        self._server = ThreadingHTTPServer(
+            (self.host, self.port),
+            partial(PreviewHandler, directory=self.root),
+        )
+        self._server.daemon_threads = True
+        self._server.preview = self
+        thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        thread.start()
+        return self.url
+
+    def stop(self):
+        """Ends all event streams and stops the server."""
+        with self._lock:
+            for events in self._subscribers:
+                events.put(None)
+        self._server.shutdown()
+        self._server.server_close()
+
+    def publish(self, event, data):
+        """Sends an event to all connected pages."""
+        message = format_event(event, data)
+        with self._lock:
+            for events in self._subscribers:
+                events.put(message)
+
+    def set_current(self, event, data):
+        """Sets the event that pages get first when they connect."""
+        with self._lock:
+            self._current = format_event(event, data)
+
+    def stream_events(self, handler):
+        """Sends the events to a page until it disconnects."""
+        events = queue.Queue()
+        with self._lock:
+            self._subscribers.add(events)
+            if self._current is not None:
+                events.put(self._current)
+
+        try:
+            handler.send_response(200)
+            handler.send_header("Content-Type", "text/event-stream")
+            handler.send_header("Cache-Control", "no-cache")
+            handler.end_headers()
+            handler.wfile.write(f"retry: {RECONNECT_DELAY}\n\n".encode())
+            handler.wfile.flush()
+
+            while True:
+                try:
+                    message = events.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    # comments keep proxies and browsers from timing out
+                    message = ": keep-alive\n\n"
+                if message is None:
+                    break
+                handler.wfile.write(message.encode())
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self._lock:
+                self._subscribers.discard(events)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
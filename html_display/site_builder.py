@@ -0,0 +1,332 @@
+"""
+Static site with the collections of all users.
+
+Every user gets a directory with the full movie list, views sorted by
+rating, year and title and a stats page, next to an index page listing
+the users. The users are rendered in parallel by a process pool. The
+change stamps of the users are saved with the build, so a rebuild only
+renders the users whose movies changed since and removes the pages of
+deleted users. The pages use the style sheet and the stored posters of
+html_display.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+
+from db_handler import database
+from db_handler import movie_storage_sql as storage
+
+from . import html_generator, poster_store
+
+
+SITE_DIR = "html_display/site"
+# directory with the style sheet, the placeholder image and the posters
+ASSET_DIR = "html_display"
+BUILD_FILENAME = "build.json"
+# increase when the pages change, so the next build renders all users
+SITE_VERSION = 1
+
+# file name, link text, sort field and direction of the movie pages
+MOVIE_PAGES = [
+    ("index.html", "All movies", None, False),
+    ("rating.html", "By rating", "rating", True),
+    ("year.html", "By year", "year", True),
+    ("title.html", "By title", "title", False),
+]
+STATS_PAGE = "stats.html"
+
+
+def get_user_directory(user_id, name):
+    """Returns the directory name of a user, unique by the user id."""
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+    return f"{slug}-{user_id}" if slug else str(user_id)
+
+
+def get_relative_url(path, start):
+    """Returns the url of path relative to the directory start."""
+    return os.path.relpath(path, start).replace(os.sep, "/")
+
+
+def get_site_hash():
+    """
+    Returns a hash of everything the pages are made from besides the
+    data, the builds of a different hash render all users again.
+    """
+    content = html_generator.read_template(html_generator.HTML_TEMPLATE_FILE)
+    return hashlib.sha256(f"{SITE_VERSION} {content}".encode()).hexdigest()
+
+
+def read_build(site_dir):
+    """Returns the saved state of the last build or an empty one."""
+    try:
+        with open(os.path.join(site_dir, BUILD_FILENAME), "r") as handle:
+            return json.load(handle)
+    except (FileNotFoundError, ValueError):
+        return {"site_hash": None, "users": {}}
+
+
+def write_file(file_path, content):
+    """
+    Writes the content to the file atomically. Unlike write_html it
+    does not remember the written content, as the site directory can be
+    changed or deleted between builds.
+    """
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        handle.write(content)
+    os.replace(temp_path, file_path)
+
+
+def write_build(site_dir, build):
+    write_file(
+        os.path.join(site_dir, BUILD_FILENAME), json.dumps(build, indent=2)
+    )
+
+
+def create_page(page_dir, navigation, content):
+    """
+    Returns a page of the template with the navigation above the grid
+    and content in it. The base url points to the assets, the links of
+    the navigation are relative to it.
+    """
+    head, tail = html_generator.get_template_parts()
+    base = get_relative_url(ASSET_DIR, page_dir) + "/"
+    links = [
+        f'<a href="{escape(get_relative_url(path, ASSET_DIR))}">'
+        + f"{escape(text)}</a>"
+        for path, text in navigation
+    ]
+    head = head.replace("<head>", f'<head>\n    <base href="{base}">', 1)
+    head = head.replace(
+        "<body>",
+        '<body>\n    <nav class="site-nav">' + " | ".join(links) + "</nav>",
+        1,
+    )
+    return "".join([head, content, tail])
+
+
+def serialize_movies(movie_dict, posters):
+    """
+    Returns the html fragments of the movies with stored posters. The
+    fragments are cached, so the sorted pages of a user reuse the ones
+    of the first page.
+    """
+    return html_generator.format_data(movie_dict, posters)
+
+
+def serialize_figure(label, value):
+    """Returns a grid item with a label and a value."""
+    return (
+        "<li>\n"
+        '<div class="movie">\n'
+        f'<div class="movie-title">{escape(label)}</div>'
+        f'<div class="movie-info">{escape(str(value))}</div>'
+        "</div>\n"
+        "</li>"
+    )
+
+
+def serialize_stats(stats, posters):
+    """Returns the grid items of the stats page."""
+    if stats is None:
+        return html_generator.serialize_no_movie()
+    figures = [
+        ("Movies", stats["count"]),
+        ("Average rating", round(stats["mean"], 1)),
+        ("Median rating", round(stats["median"], 1)),
+        ("Lowest rating", stats["min_rating"]),
+        ("Highest rating", stats["max_rating"]),
+    ]
+    figures += [
+        (f"{decade}s", count)
+        for decade, count in stats["decades"].items()
+        # movies without a known year are counted in decade 0
+        if decade
+    ]
+    return "".join(
+        [serialize_figure(label, value) for label, value in figures]
+        + [serialize_figure("Best rated", "")]
+        + [serialize_movies(stats["best_movies"], posters)]
+        + [serialize_figure("Worst rated", "")]
+        + [serialize_movies(stats["worst_movies"], posters)]
+    )
+
+
+def has_pages(user_dir):
+    """Returns True if all pages of a user are in the directory."""
+    return all(
+        os.path.isfile(os.path.join(user_dir, file_name))
+        for file_name in [page[0] for page in MOVIE_PAGES] + [STATS_PAGE]
+    )
+
+
+def get_navigation(site_dir, user_dir, name):
+    """Returns the (path, text) links of the pages of a user."""
+    navigation = [(os.path.join(site_dir, "index.html"), "All users")]
+    for file_name, text, _, _ in MOVIE_PAGES:
+        if file_name == "index.html":
+            text = f"{name}: {text}"
+        navigation.append((os.path.join(user_dir, file_name), text))
+    navigation.append((os.path.join(user_dir, STATS_PAGE), "Stats"))
+    return navigation
+
+
+def build_user(user_id, name, directory, site_dir, posters):
+    """
+    Writes the pages of a user to the directory in the site directory.
+    Returns the user id and the number of movies.
+    """
+    user_dir = os.path.join(site_dir, directory)
+    os.makedirs(user_dir, exist_ok=True)
+    navigation = get_navigation(site_dir, user_dir, name)
+
+    collection = storage.get_movie_collection(user_id)
+    for file_name, _, sort_by, descending in MOVIE_PAGES:
+        indices = None
+        if sort_by is not None:
+            indices = collection.argsort(sort_by, descending)
+        content = serialize_movies(collection.to_dict(indices), posters)
+        write_file(
+            os.path.join(user_dir, file_name),
+            create_page(user_dir, navigation, content),
+        )
+
+    content = serialize_stats(storage.get_stats(user_id), posters)
+    write_file(
+        os.path.join(user_dir, STATS_PAGE),
+        create_page(user_dir, navigation, content),
+    )
+    return user_id, len(collection)
+
+
+def write_site_index(site_dir, users, counts):
+    """Writes the index page linking the pages of all users."""
+    items = []
+    for user_id, name, directory in users:
+        link = get_relative_url(
+            os.path.join(site_dir, directory, "index.html"), ASSET_DIR
+        )
+        items.append(
+            "<li>\n"
+            '<div class="movie">\n'
+            f'<a class="movie-title" href="{escape(link)}">'
+            f"{escape(name)}</a>"
+            f'<div class="movie-info">{counts.get(user_id, 0)} movies</div>'
+            "</div>\n"
+            "</li>"
+        )
+    navigation = [(os.path.join(site_dir, "index.html"), "All users")]
+    write_file(
+        os.path.join(site_dir, "index.html"),
+        create_page(site_dir, navigation, "".join(items)),
+    )
+
+
+def init_worker(db_url):
+    """Gives every worker process its own database engine."""
+    # the connections of the parent must not be used or closed after a fork
+    database.dispose_engine(close=False)
+    storage.configure_database(db_url)
+
+
+def build_site(site_dir=SITE_DIR, workers=None, force=False):
+    """
+    Builds the static site of all users in site_dir, the users whose
+    change stamp is the one of the last build are skipped unless force
+    is True. workers is the number of processes, by default one per CPU,
+    with 1 or an in-memory database all users are built in this process.
+    Returns a dict with the lists of the built, unchanged and removed
+    user names.
+    """
+    os.makedirs(site_dir, exist_ok=True)
+    previous = read_build(site_dir)
+    site_hash = get_site_hash()
+    if previous["site_hash"] != site_hash:
+        force = True
+
+    users = []
+    changed = []
+    unchanged = []
+    for user_id, name, stamp in storage.get_user_stamps():
+        directory = get_user_directory(user_id, name)
+        users.append((user_id, name, directory))
+        entry = previous["users"].get(str(user_id))
+        if (
+            force
+            or entry is None
+            or entry["stamp"] != stamp
+            or entry["directory"] != directory
+            or not has_pages(os.path.join(site_dir, directory))
+        ):
+            changed.append((user_id, name, directory, stamp))
+        else:
+            unchanged.append((user_id, name, directory, stamp))
+
+    # the posters are downloaded here once, the workers only read them
+    posters = poster_store.get_local_posters(
+        storage.get_poster_urls([user[0] for user in changed])
+    )
+
+    counts = {}
+    db_url = database.get_db_url()
+    if workers == 1 or len(changed) <= 1 or database.is_memory_url(db_url):
+        for user_id, name, directory, _ in changed:
+            _, counts[user_id] = build_user(
+                user_id, name, directory, site_dir, posters
+            )
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(db_url,),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    build_user, user_id, name, directory, site_dir, posters
+                )
+                for user_id, name, directory, _ in changed
+            ]
+            for future in futures:
+                user_id, count = future.result()
+                counts[user_id] = count
+
+    for user_id, _, _, _ in unchanged:
+        counts[user_id] = previous["users"][str(user_id)]["count"]
+
+    # remove the pages of deleted or renamed users
+    directories = {directory for _, _, directory in users}
+    removed = []
+    for entry in previous["users"].values():
+        if entry["directory"] not in directories:
+            shutil.rmtree(
+                os.path.join(site_dir, entry["directory"]),
+                ignore_errors=True,
+            )
+            removed.append(entry["name"])
+
+    write_site_index(site_dir, users, counts)
+    write_build(
+        site_dir,
+        {
+            "site_hash": site_hash,
+            "users": {
+                str(user_id): {
+                    "name": name,
+                    "directory": directory,
+                    "stamp": stamp,
+                    "count": counts[user_id],
+                }
+                for user_id, name, directory, stamp in changed + unchanged
+            },
+        },
+    )
+
+    return {
+        "built": [name for _, name, _, _ in changed],
+        "unchanged": [name for _, name, _, _ in unchanged],
+        "removed": removed,
+    }
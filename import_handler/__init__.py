@@ -0,0 +1,11 @@
+from .movie_importer import (
+    read_titles,
+    import_movies,
+    ImportReport,
+)
+
+__all__ = [
+    "read_titles",
+    "import_movies",
+    "ImportReport",
+]
@@ -0,0 +1,3 @@
+from .movie_importer import main
+
+main()
@@ -0,0 +1,360 @@
+"""
+Bulk import of movie titles from JSON, NDJSON, CSV or plain text files.
+
+Titles are streamed from the file, resolved against the OMDb API by the
+worker pool of the OMDb client and written to the database in batches
+through the storage layer. Cached OMDb responses and
+movies the user already has do not need a request. All database access
+happens in the calling thread, the workers only do HTTP requests.
+"""
+import argparse
+import csv
+import json
+import os
+from collections import deque
+
+from api_handler import OmdbClient, OmdbError
+from api_handler.omdb_client import OMDB_URL, DEFAULT_RATE, DEFAULT_WORKERS
+from db_handler import movie_storage_sql as storage
+from db_handler import omdb_cache
+from db_handler.database import get_setting
+
+
+DEFAULT_BATCH_SIZE = 100
+
+# characters read from a JSON file at a time
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def title_from_item(item):
+    """Returns the title of a JSON item, which is a string or an object."""
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        return item.get("title") or item.get("Title")
+    return None
+
+
+class JsonChunkReader:
+    """
+    Reads the values of a JSON file one by one from chunks of the file,
+    so only the current value and one chunk are held in memory.
+    """
+
+    def __init__(self, handle, chunk_size=JSON_CHUNK_SIZE):
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.at_end = False
+
+    def fill(self):
+        """
+        Drops the consumed part of the buffer and appends the next chunk.
+        Returns False at the end of the file.
+        """
+        chunk = self.handle.read(self.chunk_size)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        if not chunk:
+            self.at_end = True
+        return bool(chunk)
+
+    def skip_whitespace(self):
+        """Moves past whitespace, reading chunks as needed."""
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position].isspace()
+            ):
+                self.position += 1
+            if self.position < len(self.buffer) or not self.fill():
+                return
+
+    def next_char(self):
+        """Returns and consumes the next character that is not whitespace."""
+        self.skip_whitespace()
+        if self.position >= len(self.buffer):
+            raise ValueError("unexpected end of the JSON file")
+        char = self.buffer[self.position]
+        self.position += 1
+        return char
+
+    def peek_char(self):
+        """Returns the next character that is not whitespace."""
+        self.skip_whitespace()
+        return self.buffer[self.position:self.position + 1]
+
+    def decode(self):
+        """Returns and consumes the next JSON value."""
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(
+                    self.buffer, self.position
+                )
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # a number at the end of the buffer may go on in the next chunk
+            if end == len(self.buffer) and not self.at_end and self.fill():
+                continue
+            self.position = end
+            return value
+
+
+def read_json_titles(handle, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Yields the titles of a JSON file, which holds a list of titles or
+    movie objects or an object with the titles as keys like
+    data/moviebrain.json. The file is parsed in chunks one list item or
+    key at a time, so large files are not read into memory.
+    """
+    reader = JsonChunkReader(handle, chunk_size)
+    opening = reader.next_char()
+    if opening == "[":
+        closing = "]"
+    elif opening == "{":
+        closing = "}"
+    else:
+        raise ValueError("the JSON file holds no list or object")
+
+    if reader.peek_char() == closing:
+        return
+
+    while True:
+        value = reader.decode()
+        if opening == "{":
+            if reader.next_char() != ":":
+                raise ValueError("expected : after a key of the JSON object")
+            # the movie data of the legacy format is not needed
+            reader.decode()
+            yield value
+        else:
+            yield title_from_item(value)
+
+        separator = reader.next_char()
+        if separator == closing:
+            return
+        if separator != ",":
+            raise ValueError(f"unexpected {separator!r} in the JSON file")
+
+
+def read_ndjson_titles(handle):
+    """Yields the titles of a file with one JSON value per line."""
+    for line in handle:
+        if line.strip():
+            yield title_from_item(json.loads(line))
+
+
+def read_csv_titles(handle):
+    """
+    Yields the titles of a CSV file from the title column,
+    or from the first column if there is no title header.
+    """
+    reader = csv.reader(handle)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    lower_header = [column.strip().lower() for column in header]
+    if "title" in lower_header:
+        index = lower_header.index("title")
+    else:
+        index = 0
+        yield header[0]
+
+    for row in reader:
+        if len(row) > index:
+            yield row[index]
+
+
+def read_text_titles(handle):
+    """Yields one title per line, lines starting with # are skipped."""
+    for line in handle:
+        if not line.startswith("#"):
+            yield line
+
+
+def read_titles(file_path):
+    """
+    Yields the stripped, non-empty titles of a file,
+    the format is chosen by the file extension.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".json":
+        reader = read_json_titles
+    elif extension in (".ndjson", ".jsonl"):
+        reader = read_ndjson_titles
+    elif extension == ".csv":
+        reader = read_csv_titles
+    else:
+        reader = read_text_titles
+
+    with open(file_path, "r", newline="") as handle:
+        for title in reader(handle):
+            if title and title.strip():
+                yield title.strip()
+
+
+class ImportReport:
+    """Counts the outcome of an import and collects the failures."""
+
+    def __init__(self):
+        self.processed = 0
+        self.added = 0
+        self.skipped = 0
+        self.requests = 0
+        self.failures = []
+
+    def print_progress(self):
+        print(
+            f"  Processed {self.processed} titles: {self.added} added, "
+            + f"{self.skipped} already in the collection, "
+            + f"{len(self.failures)} failed"
+        )
+
+    def print_summary(self):
+        print("\n  Import finished.\n")
+        self.print_progress()
+        print(f"  OMDb requests made: {self.requests}")
+        if self.failures:
+            print("\n  These titles could not be imported:\n")
+            for title, reason in self.failures:
+                print(f"  {title}: {reason}")
+
+
+def import_movies(
+    user_id,
+    titles,
+    client,
+    batch_size=DEFAULT_BATCH_SIZE,
+    show_progress=True,
+):
+    """
+    Resolves the titles with the OMDb client and adds the found movies to
+    the collection of the user in batches.
+    Returns an ImportReport.
+    """
+    report = ImportReport()
+    known_titles = {
+        omdb_cache.normalize_title(movie)
+        for movie in storage.get_movies(user_id)
+    }
+    batch = []
+    # futures of running requests in input order, bounded so a long input
+    # file is not read into memory at once
+    pending = deque()
+
+    def handle_result(title, data, error):
+        report.processed += 1
+        if data is None:
+            report.failures.append((title, error))
+            return
+        if data.get("Response") != "True":
+            report.failures.append((title, data.get("Error", "not found")))
+            return
+
+        lookup_key = omdb_cache.normalize_title(data["Title"])
+        if lookup_key in known_titles:
+            report.skipped += 1
+            return
+        known_titles.add(lookup_key)
+        batch.append(
+            {
+                "title": data["Title"],
+                "year": data["Year"],
+                "rating": data["imdbRating"],
+                "poster": data["Poster"],
+            }
+        )
+        if len(batch) >= batch_size:
+            flush()
+
+    def flush():
+        report.added += storage.add_movies(user_id, batch)
+        batch.clear()
+        if show_progress:
+            report.print_progress()
+
+    def finish_oldest():
+        title, future = pending.popleft()
+        try:
+            data = future.result()
+        except OmdbError as error:
+            handle_result(title, None, str(error))
+            return
+        omdb_cache.save_response(title, data)
+        handle_result(title, data, None)
+
+    seen = set()
+    for title in titles:
+        lookup_key = omdb_cache.normalize_title(title)
+        if lookup_key in seen:
+            continue
+        seen.add(lookup_key)
+
+        if lookup_key in known_titles:
+            report.processed += 1
+            report.skipped += 1
+            continue
+
+        data = omdb_cache.get_response(title)
+        if data is not None:
+            handle_result(title, data, None)
+            continue
+
+        report.requests += 1
+        pending.append((title, client.submit(title)))
+        if len(pending) >= client.workers * 2:
+            finish_oldest()
+
+    while pending:
+        finish_oldest()
+
+    flush()
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import movie titles from a JSON, CSV or text file."
+    )
+    parser.add_argument("file", help="file with the movie titles")
+    parser.add_argument("user", help="name of the user to import for")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help="maximum OMDb requests per second",
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    user_id = storage.get_user_id(args.user)
+    if not user_id:
+        user_id = storage.add_user(args.user)
+        print(f"\n  Added the new user {args.user} with id {user_id}.")
+
+    client = OmdbClient(
+        get_setting("OMDB_API_KEY"),
+        base_url=get_setting("MOVIEBRAIN_OMDB_URL", OMDB_URL),
+        rate=args.rate,
+        workers=args.workers,
+    )
+    with client:
+        report = import_movies(
+            user_id,
+            read_titles(args.file),
+            client,
+            batch_size=args.batch_size,
+        )
+    report.print_summary()
+
+
+if __name__ == "__main__":
+    main()
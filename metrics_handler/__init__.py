@@ -0,0 +1,21 @@
+from .metrics import (
+    MetricsRegistry,
+    registry,
+    enable,
+    disable,
+    timer,
+    timed,
+    instrument_engine,
+    write_metrics,
+)
+
+__all__ = [
+    "MetricsRegistry",
+    "registry",
+    "enable",
+    "disable",
+    "timer",
+    "timed",
+    "instrument_engine",
+    "write_metrics",
+]
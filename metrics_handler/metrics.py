@@ -0,0 +1,247 @@
+"""
+Latency metrics for SQL statements, OMDb requests, html generation and
+menu actions.
+
+Metrics are only recorded after enable() was called, before that the
+timers return at once. Every metric is a histogram with fixed buckets
+per label set, so recording costs a few list operations and the memory
+does not grow with the number of observations. The histograms are
+written as Prometheus text format or JSON.
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+METRIC_HELP = {
+    "moviebrain_sql_seconds": "Latency of SQL statements.",
+    "moviebrain_omdb_request_seconds": "Latency of OMDb API requests.",
+    "moviebrain_html_seconds": "Latency of the browser view updates.",
+    "moviebrain_action_seconds": "Latency of menu actions and commands.",
+}
+
+# statements are cut to this length in the labels
+MAX_STATEMENT_LENGTH = 120
+
+
+class Histogram:
+    """Counts observations in fixed buckets, with their sum and maximum."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # the last count is for observations above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self):
+        """Returns (upper bound, count) pairs as Prometheus expects them."""
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class MetricsRegistry:
+    """Histograms keyed by metric name and labels."""
+
+    def __init__(self):
+        self.enabled = False
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, **labels):
+        """Records a duration, if the registry is enabled."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def get(self, name, **labels):
+        """Returns the histogram of a metric and labels or None."""
+        with self._lock:
+            return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def reset(self):
+        """Drops all recorded histograms."""
+        with self._lock:
+            self._histograms.clear()
+
+    def items(self):
+        """Returns the (name, labels, histogram) triples sorted by name."""
+        with self._lock:
+            items = sorted(self._histograms.items(), key=lambda item: item[0])
+        return [(name, dict(labels), hist) for (name, labels), hist in items]
+
+    def to_json(self):
+        """Returns the metrics as JSON string."""
+        metrics = {}
+        for name, labels, histogram in self.items():
+            metrics.setdefault(name, []).append(
+                {
+                    "labels": labels,
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "max": histogram.max,
+                    "buckets": {
+                        format_bound(bound): count
+                        for bound, count in histogram.cumulative_counts()
+                    },
+                }
+            )
+        return json.dumps(metrics, indent=2)
+
+    def to_prometheus(self):
+        """Returns the metrics in the Prometheus text format."""
+        lines = []
+        current_name = None
+        for name, labels, histogram in self.items():
+            if name != current_name:
+                current_name = name
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            label_text = ",".join(
+                f'{key}="{escape_label(value)}"'
+                for key, value in labels.items()
+            )
+            separator = "," if label_text else ""
+            for bound, count in histogram.cumulative_counts():
+                lines.append(
+                    f"{name}_bucket{{{label_text}{separator}"
+                    + f'le="{format_bound(bound)}"}} {count}'
+                )
+            lines.append(f"{name}_sum{{{label_text}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{label_text}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def escape_label(value):
+    """Escapes a label value for the Prometheus text format."""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def enable():
+    """Starts recording metrics, including the SQL of the engine."""
+    # imported here, so timing html or http needs no database modules
+    from db_handler import database
+
+    registry.enabled = True
+    database.add_engine_hook(instrument_engine)
+
+
+def disable():
+    """Stops recording metrics, recorded metrics are kept."""
+    registry.enabled = False
+
+
+@contextmanager
+def timer(name, **labels):
+    """Context manager that records the duration of its block."""
+    if not registry.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorator that records the duration of every call."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                registry.observe(
+                    name, time.perf_counter() - start, **labels
+                )
+        return wrapper
+    return decorator
+
+
+def get_statement_label(statement):
+    """Returns the statement with collapsed whitespace, cut if long."""
+    return " ".join(statement.split())[:MAX_STATEMENT_LENGTH]
+
+
+def instrument_engine(engine):
+    """Records the latency of every statement executed by the engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(
+        connection, cursor, statement, parameters, context, executemany
+    ):
+        connection.info.setdefault("query_start", []).append(
+            time.perf_counter()
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(
+        connection, cursor, statement, parameters, context, executemany
+    ):
+        start = connection.info["query_start"].pop()
+        registry.observe(
+            "moviebrain_sql_seconds",
+            time.perf_counter() - start,
+            statement=get_statement_label(statement),
+        )
+
+    @event.listens_for(engine, "handle_error")
+    def drop_timer(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+
+def write_metrics(file_path):
+    """
+    Writes the metrics to the file, as JSON if its name ends in .json,
+    otherwise in the Prometheus text format.
+    """
+    if file_path.endswith(".json"):
+        content = registry.to_json()
+    else:
+        content = registry.to_prometheus()
+    with open(file_path, "w") as handle:
+        handle.write(content)
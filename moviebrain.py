@@ -1,11 +1,4 @@
-from random import randint
-from statistics import median, mean
-from dotenv import dotenv_values
-import requests
-
-
-from db_handler import movie_storage_sql as storage
-from html_display import html_generator
+import sys
 
 from cli_helper import (
     print_intro,
@@ -17,13 +10,23 @@ from cli_helper import (
     print_message,
     print_sub_menu,
     print_user_menu,
+    lazy_import,
 )
+from metrics_handler import metrics
+
+# the database, the api client and the browser view are loaded on first
+# use, so the intro screen shows up without waiting for them
+storage = lazy_import("db_handler.movie_storage_sql")
+omdb_cache = lazy_import("db_handler.omdb_cache")
+html_generator = lazy_import("html_display.html_generator")
+api_handler = lazy_import("api_handler")
 
-# read api key from .env file
-OMDB_API_KEY = dotenv_values(".env")["OMDB_API_KEY"]
 # global variable to save current user
 current_user_id = 0
 
+# number of movies recommend_movies shows
+RECOMMENDATIONS = 10
+
 
 def list_movies():
     """list all movies"""
@@ -110,20 +113,27 @@ def add_movie():
 
     movies = storage.get_movies(current_user_id)
 
-    payload = {"apikey": OMDB_API_KEY, "t": name}
+    # skip the api request for movies the user already has
+    lookup_key = omdb_cache.normalize_title(name)
+    for movie in movies:
+        if omdb_cache.normalize_title(movie) == lookup_key:
+            print_message(f"Error! Movie {name} is already in the database.")
+            return movies
+
+    # use a cached response if the title was looked up before
     try:
-        response = requests.get(
-            "https://www.omdbapi.com/", params=payload, timeout=5
+        data = omdb_cache.get_or_fetch(
+            name, lambda title: api_handler.get_client().get_movie(title)
         )
-    except requests.exceptions.ConnectionError:
+    except api_handler.OmdbConnectionError:
         print_message("Sorry, can't connect to the search API.")
         return
-    except requests.exceptions.Timeout:
+    except api_handler.OmdbTimeoutError:
         print_message("Sorry, the connection timed out.")
         return
-
-    # response is a json object so data is a dictionary
-    data = response.json()
+    except api_handler.OmdbError as error:
+        print_message(f"Error! {error}")
+        return
 
     if data["Response"] == "True":
         # check if movie name already exists in the database
@@ -194,7 +204,7 @@ def update_movie():
         movies = storage.get_movies(current_user_id)
 
         if movies.get(name) is not None:
-            current_note = storage.get_movie_note(current_user_id, name)
+            current_note = movies[name]["note"]
             if current_note:
                 print(f"\n  The current note says:\n {current_note}")
             else:
@@ -224,59 +234,37 @@ def show_stats():
     information about the worst and best movies
     """
     global current_user_id
-    movies = storage.get_movies(current_user_id)
+    stats = storage.get_stats(current_user_id)
 
-    if movies:
+    if stats:
         print("\n  Here are some fresh stats from the database:")
 
-        # get list of all movie ratings
-        rating_list = []
-        for movie in movies.values():
-            rating_list.append(movie["rating"])
-        # calculate and print average
-        avg_rating = mean(rating_list)
         print(
             "\n\n  The average rating of the movies is: "
-            + f"{round(avg_rating, 1)}"
+            + f"{round(stats['mean'], 1)}"
         )
-
-        # calculate and print median value
         print(
             "\n  The median rating of the movies is: "
-            + f"{round(median(rating_list), 1)}"
+            + f"{round(stats['median'], 1)}"
         )
 
         result_movie_dict = {}
 
-        # get maximum rating and print movie(s) with max rating
-        max_rating = max(rating_list)
-        best_movies = []
-        # build list by iterating through dict items
-        for movie in movies:
-            if movies[movie]["rating"] == max_rating:
-                best_movies.append(movie)
-
         print("\n  The best rated movie(s):")
-        for movie in best_movies:
-            print(
-                f"\n  {movie} ({movies[movie]['year']}): "
-                + f"{movies[movie]['rating']}"
-            )
-            result_movie_dict[movie] = movies[movie]
-
-        # get minimum rating and print movie(s) with min rating
-        min_rating = min(rating_list)
-        # build list with list comprehension
-        worst_movies = [
-            movie for movie in movies if movies[movie]["rating"] == min_rating
-        ]
+        for movie, info in stats["best_movies"].items():
+            print(f"\n  {movie} ({info['year']}): {info['rating']}")
+            result_movie_dict[movie] = info
+
         print("\n  The worst rated movie(s):")
-        for movie in worst_movies:
-            print(
-                f"\n  {movie} ({movies[movie]['year']}): "
-                + f"{movies[movie]['rating']}"
-            )
-            result_movie_dict[movie] = movies[movie]
+        for movie, info in stats["worst_movies"].items():
+            print(f"\n  {movie} ({info['year']}): {info['rating']}")
+            result_movie_dict[movie] = info
+
+        print("\n  Movies per decade:")
+        for decade, count in stats["decades"].items():
+            # movies without a known year are counted in decade 0
+            if decade:
+                print(f"\n  {decade}s: {count}")
 
         return result_movie_dict
     else:
@@ -289,81 +277,77 @@ def random_movie():
     Returns the random movie as dictionary
     """
     global current_user_id
-    movies = storage.get_movies(current_user_id)
+    result_movie_dict = storage.get_random_movies(current_user_id)
 
     # check for movies in database
-    if movies:
+    if result_movie_dict:
         print("\n  Here is a random movie from the database:")
-        # generate random index
-        index = randint(0, len(movies))
-        # get movie info for index
-        names = list(movies.keys())
-        info = movies[names[index]]
-        # print movie info
-        print(f"\n\n\n  {names[index]} ({info['year']}): {info['rating']}\n\n")
+        for movie, info in result_movie_dict.items():
+            print(f"\n\n\n  {movie} ({info['year']}): {info['rating']}\n\n")
     else:
         print_message("\n  The database is empty!")
 
-    result_movie_dict = {}
-    result_movie_dict[names[index]] = movies[names[index]]
     return result_movie_dict
 
 
 def search_movie():
     """
-    Case insensitive search by partial name
-    Returns the search results as dictionary
+    Case insensitive search by partial name or note
+    Returns the search results as dictionary, best matches first
     """
     global current_user_id
     search_term = input("\n  Enter the search term:\n\n  ")
 
     if not search_term:
         print("\n  No search term given. Listing all movies!")
-        list_movies()
+        return list_movies()
+
+    # the full-text index of the database finds and ranks the movies
+    result_movie_dict = storage.search_movies(
+        current_user_id, search_term, limit=None
+    )
+
+    if result_movie_dict:
+        print("\n  Here are the search results:")
+        for result, info in result_movie_dict.items():
+            print(f"\n  {result} ({info['year']}): {info['rating']}")
     else:
-        movies = storage.get_movies(current_user_id)
-        # used to return a dict of the search results
-        result_movie_dict = {}
-        # adds value movie to the list while iterating
-        # through the dict keys the condition is met
-        search_results = [
-            movie for movie in movies if search_term.lower() in movie.lower()
-        ]
-
-        if search_results:
-            print("\n  Here are the search results:")
-            for result in search_results:
-                print(
-                    f"\n  {result} ({movies[result]['year']})"
-                    + f": {movies[result]['rating']}"
-                )
-                result_movie_dict[result] = movies[result]
-        else:
-            print("\n  Sorry, no matching movie found.")
+        print("\n  Sorry, no matching movie found.")
 
     return result_movie_dict
 
 
-def print_sorted_movies(movies, info_type, bool_direction):
+def recommend_movies():
     """
-    Takes a list of movies, the info_type to sort by and a bool value to
-    specify to sort direction (False for ascending, True for descending)
-    Returns the sorted movie as dictionary
+    Shows the movies users with similar collections also saved
+    Returns the recommendations as dictionary, best first
     """
-    sorted_list = sorted(
-        movies,
-        key=lambda movie: movies[movie][info_type],
-        reverse=bool_direction,
+    global current_user_id
+    result_movie_dict = storage.get_recommendations(
+        current_user_id, limit=RECOMMENDATIONS
     )
 
-    result_movie_dict = {}
+    if result_movie_dict:
+        print("\n  Users who saved your movies also saved:")
+        for movie, info in result_movie_dict.items():
+            print(f"\n  {movie} ({info['year']}): {info['rating']}")
+    else:
+        print_message(
+            "\n  No recommendations yet, no other user shares your movies."
+        )
 
-    for movie in sorted_list:
-        info = movies[movie]
+    return result_movie_dict
+
+
+def print_movie_list(movies):
+    """
+    Prints the movies in the order of the given dict
+    Returns the movies as dictionary
+    """
+    for movie, info in movies.items():
         print(f"  {movie} ({info['year']}): {info['rating']}")
-        result_movie_dict[movie] = movies[movie]
 
-    return result_movie_dict
+    return movies
 
 
 def sort_movies():
@@ -379,9 +363,12 @@ def sort_movies():
 
     print(f"\n  Here is the movie list sorted by {info_type}:\n")
 
-    movies = storage.get_movies(current_user_id)
+    # the database sorts the movies
+    movies = storage.query_movies(
+        current_user_id, sort_by=info_type, descending=bool_direction
+    )
 
-    return print_sorted_movies(movies, info_type, bool_direction)
+    return print_movie_list(movies)
 
 
 def filter_movies():
@@ -406,28 +393,15 @@ def filter_movies():
 
     print(f"\n  Here is the movie list filtered by {info_type}:\n")
 
-    movies = storage.get_movies(current_user_id)
-    filtered_movies = get_filtered_movies(movies, info_type, start, end)
-
-    return print_sorted_movies(filtered_movies, info_type, bool_direction)
-
-
-def get_filtered_movies(movies, info_type, start, end):
-    """
-    Filters a dict of dict of movies according to info_type
-    and start and end values
-    """
-    global current_user_id
-    movies = storage.get_movies(current_user_id)
-
-    results = {}
-
-    for movie in movies:
-        info = movies[movie]
-        if start <= info[info_type] <= end:
-            results[movie] = info
+    # the database filters and sorts the movies
+    movies = storage.query_movies(
+        current_user_id,
+        sort_by=info_type,
+        descending=bool_direction,
+        **{f"{info_type}_range": (start, end)},
+    )
 
-    return results
+    return print_movie_list(movies)
 
 
 def print_users(users):
@@ -527,16 +501,22 @@ def add_notes_to_movies(movies):
     """
     For a given movie dictionary
     Adds a new key 'note' and adds the note fetched from the db as value
+    Movies loaded by get_movies already carry their note, the notes of
+    all other movies are fetched with a single query
     Returns the modified movie dict
     """
     global current_user_id
 
-    for movie, info in movies.items():
-        note = storage.get_movie_note(current_user_id, movie)
-        if note:
-            info["note"] = note
-        else:
-            info["note"] = ""
+    if not movies:
+        return movies
+
+    missing_titles = [
+        movie for movie, info in movies.items() if "note" not in info
+    ]
+    notes = storage.get_movie_notes(current_user_id, missing_titles)
+
+    for movie in missing_titles:
+        movies[movie]["note"] = notes.get(movie, "")
 
     return movies
 
@@ -551,6 +531,7 @@ menu = {
     "7": search_movie,
     "8": sort_movies,
     "9": filter_movies,
+    "10": recommend_movies,
 }
 
 
@@ -564,6 +545,9 @@ def main():
     wait_for_enter()
     clear_screen()
 
+    # the browser view is only served for the interactive program
+    html_generator.start_preview_server()
+
     # the main loop
     while True:
         # show menu screen
@@ -578,8 +562,12 @@ def main():
         # screen selection
         print_title()
 
-        if choice in map(str, range(1, 10)):
-            movie_output = menu[choice]()
+        if choice in menu:
+            # the time of an action includes waiting for the user input
+            with metrics.timer(
+                "moviebrain_action_seconds", action=menu[choice].__name__
+            ):
+                movie_output = menu[choice]()
             movie_output = add_notes_to_movies(movie_output)
             html_generator.generate_html_file(movie_output)
         elif choice == "0":
@@ -595,4 +583,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import command_handler
+
+    # without a command the interactive menu is started
+    sys.exit(command_handler.main(sys.argv[1:], interactive=main))
@@ -0,0 +1,11 @@
+import pytest
+
+from db_handler import movie_storage_sql as storage
+
+
+@pytest.fixture(autouse=True)
+def memory_database():
+    """Runs every test against a fresh in-memory database"""
+    storage.configure_database("sqlite://")
+    yield
+    storage.configure_database()
@@ -0,0 +1,171 @@
+import io
+import json
+
+from sqlalchemy.exc import OperationalError
+
+from api_handler.stub_server import make_movie
+from command_handler import main
+from db_handler import movie_storage_sql as storage
+from db_handler import omdb_cache
+from metrics_handler import metrics
+
+
+def add_movies():
+    user_id = storage.add_user("tester")
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+    storage.add_movie(user_id, "Memento", 2000, 8.4, "poster.jpg")
+    return user_id
+
+
+def test_single_command(capsys):
+    add_movies()
+
+    status = main(["--user", "tester", "--no-html", "list", "--sort", "year"])
+
+    assert status == 0
+    assert capsys.readouterr().out == (
+        "Memento (2000): 8.4\nInception (2010): 8.8\n"
+    )
+    assert main(["--user", "nobody", "--no-html", "list"]) == 1
+
+
+def test_output_options_after_the_command(capsys, monkeypatch):
+    add_movies()
+    rendered = []
+    monkeypatch.setattr(
+        "html_display.html_generator.generate_html_file", rendered.append
+    )
+
+    assert main(["--user", "tester", "stats", "--json", "--no-html"]) == 0
+    assert json.loads(capsys.readouterr().out)["count"] == 2
+    # an option before the command is kept
+    assert main(["--json", "--user", "tester", "list", "--no-html"]) == 0
+    assert list(json.loads(capsys.readouterr().out)) == [
+        "Inception",
+        "Memento",
+    ]
+
+    monkeypatch.setattr(
+        "sys.stdin", io.StringIO("list --json\nsearch memento --no-html\n")
+    )
+    assert main(["--user", "tester", "--batch", "-"]) == 0
+    assert capsys.readouterr().out.startswith("{")
+    assert list(rendered[0]) == ["Inception", "Memento"]
+
+
+def test_batch(capsys, monkeypatch, tmp_path):
+    user_id = add_movies()
+    export_file = tmp_path / "movies.csv"
+    monkeypatch.setattr(
+        "sys.stdin",
+        io.StringIO(
+            "# notes first\n"
+            'note Memento "Remember Sammy Jankis"\n'
+            "\n"
+            "delete Inception\n"
+            "delete Missing\n"
+            "unknown\n"
+            "search sammy\n"
+            f"export --format csv --output {export_file}\n"
+        ),
+    )
+
+    status = main(["--user", "tester", "--no-html", "--json", "--batch", "-"])
+
+    captured = capsys.readouterr()
+    assert status == 1
+    assert "line 5: Not in the database: Missing." in captured.err
+    assert "line 6: Invalid command: unknown" in captured.err
+    assert json.loads(captured.out) == {
+        "Memento": {
+            "year": 2000,
+            "rating": 8.4,
+            "poster": "poster.jpg",
+            "note": "Remember Sammy Jankis",
+        }
+    }
+    assert list(storage.get_movies(user_id)) == ["Memento"]
+    assert export_file.read_text().splitlines() == [
+        "title,year,rating,poster,note",
+        "Memento,2000,8.4,poster.jpg,Remember Sammy Jankis",
+    ]
+
+
+def test_metrics_and_profile(capsys, tmp_path):
+    add_movies()
+    metrics_file = tmp_path / "metrics.prom"
+    json_file = tmp_path / "metrics.json"
+    profile_file = tmp_path / "session.prof"
+
+    options = ["--user", "tester", "--no-html"]
+
+    main(options + ["--metrics", str(json_file), "stats"])
+    status = main(
+        options
+        + ["--metrics", str(metrics_file), "--profile", str(profile_file)]
+        + ["list"]
+    )
+    metrics.disable()
+    metrics.registry.reset()
+
+    assert status == 0
+    assert profile_file.stat().st_size > 0
+    actions = json.loads(json_file.read_text())["moviebrain_action_seconds"]
+    assert actions[0]["labels"] == {"action": "stats"}
+    assert actions[0]["count"] == 1
+    text = metrics_file.read_text()
+    assert "# TYPE moviebrain_sql_seconds histogram" in text
+    assert 'moviebrain_action_seconds_count{action="list"} 1' in text
+    assert 'moviebrain_action_seconds_bucket{action="list",le="+Inf"} 1' in (
+        text
+    )
+
+
+def test_batch_reports_failed_titles_and_continues(capsys, monkeypatch):
+    locked = OperationalError("INSERT", {}, Exception("database is locked"))
+    add_movie = storage.add_movie
+
+    def get_or_fetch(title, fetch):
+        if title == "Unknown":
+            return {"Response": "False", "Error": "Movie not found!"}
+        if title == "Broken":
+            raise ValueError("unreadable answer")
+        return make_movie(title)
+
+    def add_locked_movie(user_id, title, *args):
+        if title == "Alien":
+            raise locked
+        add_movie(user_id, title, *args)
+
+    def update_locked_note(*args):
+        raise locked
+
+    monkeypatch.setattr(omdb_cache, "get_or_fetch", get_or_fetch)
+    monkeypatch.setattr(storage, "add_movie", add_locked_movie)
+    monkeypatch.setattr(storage, "update_movie_note", update_locked_note)
+    monkeypatch.setattr(
+        "sys.stdin",
+        io.StringIO(
+            "add Heat Unknown Broken Memento\n"
+            "add Alien Se7en\n"
+            "note Heat Heist\n"
+            "list\n"
+        ),
+    )
+
+    status = main(["--user", "tester", "--no-html", "--batch", "-"])
+
+    captured = capsys.readouterr()
+    assert status == 1
+    assert (
+        "line 1: No movie found for Unknown. "
+        + "Can not add Broken: unreadable answer\n"
+    ) in captured.err
+    assert "line 2: Can not add Alien: " in captured.err
+    assert "line 3: " in captured.err
+    assert "database is locked" in captured.err
+    # the batch went on to the list after the failed lines
+    listed = [line.split(" (")[0] for line in captured.out.splitlines()[-3:]]
+    assert listed == ["Heat", "Memento", "Se7en"]
+    user_id = storage.get_user_id("tester")
+    assert sorted(storage.get_movies(user_id)) == ["Heat", "Memento", "Se7en"]
@@ -0,0 +1,88 @@
+import json
+import os
+
+from html_display import html_generator
+
+
+MOVIES = {
+    "Heat": {"year": 1995, "rating": 8.3, "poster": "N/A", "note": 'A "cop"'},
+}
+
+
+def test_format_data():
+    html_string = html_generator.format_data(MOVIES)
+
+    assert html_string.count("<li>") == 1
+    assert '<div class="movie-title">Heat</div>' in html_string
+    assert 'title="A &quot;cop&quot;"' in html_string
+    # the fragment is reused from the cache
+    assert html_generator.format_data(MOVIES, posters={}) == html_string
+
+
+def test_format_data_without_movies():
+    html_string = html_generator.format_data({})
+
+    assert "Sorry, no movies yet." in html_string
+
+
+def test_write_html_skips_unchanged_content(tmp_path):
+    file_path = str(tmp_path / "index.html")
+
+    assert html_generator.write_html(file_path, "<p>1</p>")
+    assert not html_generator.write_html(file_path, "<p>1</p>")
+    assert html_generator.write_html(file_path, "<p>2</p>")
+
+    with open(file_path) as handle:
+        assert handle.read() == "<p>2</p>"
+
+
+def test_write_data_feed(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    monkeypatch.setattr(html_generator, "DATA_DIR", str(data_dir))
+    monkeypatch.setattr(
+        html_generator, "DATA_INDEX_FILENAME", str(data_dir / "movies.json")
+    )
+    monkeypatch.setattr(html_generator, "CHUNK_SIZE", 2)
+    movies = {
+        f"Movie {number}": {
+            "year": 2000 + number,
+            "rating": 7.0,
+            "poster": "N/A",
+            "note": "",
+        }
+        for number in range(5)
+    }
+
+    assert html_generator.write_data_feed(movies)
+    assert not html_generator.write_data_feed(movies)
+
+    with open(data_dir / "movies.json") as handle:
+        feed = json.load(handle)
+    assert feed["count"] == 5
+    assert len(feed["chunks"]) == 3
+    with open(data_dir / feed["chunks"][0]) as handle:
+        assert json.load(handle)[1] == [
+            "Movie 1", 2001, 7.0, "", "no_results.jpg", ""
+        ]
+
+    # only the last chunk changes when a movie is added at the end
+    movies["Movie 5"] = dict(movies["Movie 4"])
+    assert html_generator.write_data_feed(movies)
+    with open(data_dir / "movies.json") as handle:
+        new_feed = json.load(handle)
+    assert new_feed["chunks"][:2] == feed["chunks"][:2]
+    assert new_feed["chunks"][2] != feed["chunks"][2]
+
+    # the hashes of deleted chunks are not kept
+    for number in range(3):
+        movies[f"Movie {number}"]["note"] = "changed"
+        assert html_generator.write_data_feed(movies)
+    chunk_paths = {
+        path
+        for path in html_generator._written_hashes
+        if path.startswith(str(data_dir / "movies-"))
+    }
+    assert chunk_paths == {
+        str(data_dir / name) for name in os.listdir(data_dir)
+        if name.startswith("movies-")
+    }
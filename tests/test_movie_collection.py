@@ -0,0 +1,79 @@
+import pytest
+
+from db_handler import movie_storage_sql as storage
+from db_handler.movie_collection import Movie, MovieCollection
+
+
+ROWS = [
+    ("Memento", 2000, 8.4, "memento.jpg", "Remember Sammy Jankis"),
+    ("Inception", 2010, 8.8, "inception.jpg", ""),
+    ("Tenet", 2020, 7.3, "tenet.jpg", None),
+    ("Following", 1998, 8.4, "following.jpg", ""),
+]
+
+
+def test_statistics():
+    collection = MovieCollection.from_rows(ROWS)
+
+    assert len(collection) == 4
+    assert collection.mean() == pytest.approx(8.225)
+    assert collection.median() == 8.4
+    assert collection.min_rating() == 7.3
+    assert collection.max_rating() == 8.8
+    assert MovieCollection().mean() is None
+    assert MovieCollection().median() is None
+
+
+def test_sort_and_filter():
+    collection = MovieCollection.from_rows(ROWS)
+
+    # ties are sorted by title like storage.query_movies does
+    assert list(collection.argsort("rating", descending=True)) == [1, 3, 0, 2]
+    assert list(collection.argsort("year")) == [3, 0, 1, 2]
+    assert list(collection.argsort("title")) == [3, 1, 0, 2]
+    assert list(collection.filter(rating_range=(8, 9))) == [0, 1, 3]
+    assert list(
+        collection.filter(year_range=(1999, 2020), rating_range=(8, 9))
+    ) == [0, 1]
+    assert collection.range_mask("year", 2000, 2010) == b"\x01\x01\x00\x00"
+    with pytest.raises(ValueError):
+        collection.argsort("poster")
+
+    indices = collection.argsort(
+        "year", indices=collection.filter(rating_range=(8.4, 8.4))
+    )
+    assert list(collection.to_dict(indices)) == ["Following", "Memento"]
+    assert [movie.title for movie in collection.select(indices)] == [
+        "Following",
+        "Memento",
+    ]
+
+
+def test_records_and_dicts():
+    movies = {
+        title: {"year": year, "rating": rating, "poster": poster, "note": note}
+        for title, year, rating, poster, note in ROWS
+    }
+    movies["Tenet"]["note"] = ""
+    collection = MovieCollection.from_dict(movies)
+
+    assert collection.to_dict() == movies
+    assert collection[0] == Movie(*ROWS[0])
+    assert collection.get("Tenet").to_info() == movies["Tenet"]
+    assert collection.get("Dunkirk") is None
+    assert "Inception" in collection
+    collection.append("Dunkirk", 2017, 7.8, "dunkirk.jpg")
+    assert "Dunkirk" in collection
+    assert collection.get("Dunkirk").note == ""
+
+
+def test_get_movie_collection():
+    user_id = storage.add_user("tester")
+    for title, year, rating, poster, note in ROWS:
+        storage.add_movie(user_id, title, year, rating, poster)
+    storage.update_movie_note(user_id, "Memento", ROWS[0][4])
+
+    collection = storage.get_movie_collection(user_id)
+
+    assert collection.to_dict() == storage.get_movies(user_id)
+    assert collection.titles == [row[0] for row in ROWS]
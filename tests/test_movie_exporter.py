@@ -0,0 +1,77 @@
+import csv
+import gzip
+import json
+
+from db_handler import movie_storage_sql as storage
+from export_handler import export_movies, get_export_format
+from import_handler import read_titles
+
+
+def add_movies():
+    user_id = storage.add_user("tester")
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+    storage.add_movie(user_id, "Amélie", 2001, 8.3, "poster.jpg")
+    storage.update_movie_note(user_id, "Amélie", 'Paris, "Montmartre"')
+    other_id = storage.add_user("other")
+    storage.add_movie(other_id, "Memento", 2000, 8.4, "poster.jpg")
+    return user_id
+
+
+def test_export_formats(tmp_path):
+    user_id = add_movies()
+    expected = [
+        {
+            "title": "Inception",
+            "year": 2010,
+            "rating": 8.8,
+            "poster": "poster.jpg",
+            "note": "",
+        },
+        {
+            "title": "Amélie",
+            "year": 2001,
+            "rating": 8.3,
+            "poster": "poster.jpg",
+            "note": 'Paris, "Montmartre"',
+        },
+    ]
+
+    json_file = tmp_path / "movies.json"
+    # a batch size below the number of rows fetches several batches
+    assert export_movies(str(json_file), user_id, batch_size=1) == 2
+    assert json.loads(json_file.read_text(encoding="utf-8")) == expected
+
+    ndjson_file = tmp_path / "movies.ndjson.gz"
+    assert export_movies(str(ndjson_file), user_id) == 2
+    with gzip.open(ndjson_file, "rt", encoding="utf-8") as handle:
+        assert [json.loads(line) for line in handle] == expected
+
+    csv_file = tmp_path / "movies.csv"
+    assert export_movies(str(csv_file), user_id) == 2
+    with open(csv_file, newline="", encoding="utf-8") as handle:
+        rows = list(csv.DictReader(handle))
+    assert rows[1]["note"] == 'Paris, "Montmartre"'
+
+    # the exports can be imported again
+    assert list(read_titles(str(json_file))) == ["Inception", "Amélie"]
+    assert list(read_titles(str(csv_file))) == ["Inception", "Amélie"]
+
+
+def test_export_catalog(tmp_path):
+    add_movies()
+    empty_file = tmp_path / "empty.json"
+    catalog_file = tmp_path / "catalog.csv.gz"
+
+    assert export_movies(str(empty_file), storage.add_user("new")) == 0
+    assert json.loads(empty_file.read_text()) == []
+    assert export_movies(str(catalog_file)) == 3
+    with gzip.open(catalog_file, "rt", encoding="utf-8") as handle:
+        titles = [row[0] for row in csv.reader(handle)]
+    assert titles == ["title", "Inception", "Amélie", "Memento"]
+
+
+def test_get_export_format():
+    assert get_export_format("movies.JSON") == "json"
+    assert get_export_format("movies.csv.gz") == "csv"
+    assert get_export_format("movies.jsonl") == "ndjson"
+    assert get_export_format("movies") == "json"
@@ -0,0 +1,60 @@
+import io
+import json
+
+from api_handler import OmdbClient
+from api_handler.stub_server import StubOmdbServer
+from db_handler import movie_storage_sql as storage
+from import_handler import import_movies, read_titles
+from import_handler.movie_importer import read_json_titles
+
+
+def test_read_titles(tmp_path):
+    legacy_file = tmp_path / "movies.json"
+    legacy_file.write_text(json.dumps({"Alien": {"year": 1979}, "Heat": {}}))
+    csv_file = tmp_path / "movies.csv"
+    csv_file.write_text("year,title\n1979,Alien\n1995, Heat \n")
+    text_file = tmp_path / "movies.txt"
+    text_file.write_text("# my list\nAlien\n\nHeat\n")
+
+    assert list(read_titles(legacy_file)) == ["Alien", "Heat"]
+    assert list(read_titles(csv_file)) == ["Alien", "Heat"]
+    assert list(read_titles(text_file)) == ["Alien", "Heat"]
+
+
+def test_read_json_titles_in_chunks():
+    movies = [
+        "Alien",
+        {"title": "Heat", "year": 1995},
+        {"Title": "Se7en", "ratings": [8.6, 86]},
+        12345,
+    ]
+    legacy = {"Alien": {"year": 1979}, "Heat": {"note": 'a "] }'}}
+
+    # every chunk boundary falls somewhere else in the values
+    for chunk_size in [1, 2, 3, 7, 64]:
+        titles = read_json_titles(io.StringIO(json.dumps(movies)), chunk_size)
+        assert list(titles) == ["Alien", "Heat", "Se7en", None]
+        titles = read_json_titles(io.StringIO(json.dumps(legacy)), chunk_size)
+        assert list(titles) == ["Alien", "Heat"]
+    assert list(read_json_titles(io.StringIO(" [ ] "), 1)) == []
+
+
+def test_import_movies():
+    user_id = storage.add_user("tester")
+    storage.add_movie(user_id, "Alien", 1979, 8.5, "poster.jpg")
+
+    with StubOmdbServer(not_found=["Unknown"]) as server:
+        with OmdbClient("key", base_url=server.url, rate=0) as client:
+            report = import_movies(
+                user_id,
+                ["alien", "Heat", "HEAT", "Unknown", "Memento"],
+                client,
+                batch_size=1,
+                show_progress=False,
+            )
+
+    assert report.added == 2
+    assert report.skipped == 1
+    assert report.failures == [("Unknown", "Movie not found!")]
+    assert sorted(storage.get_movies(user_id)) == ["Alien", "Heat", "Memento"]
+    assert server.request_count == 3
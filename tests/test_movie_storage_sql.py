@@ -1,21 +1,533 @@
-from db_handler.movie_storage_sql import (
-    add_movie,
-    get_movies,
-    delete_movie,
-    update_movie
+import random
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+from db_handler import migrations
+from db_handler import movie_storage_sql as storage
+from db_handler.database import get_engine
+from db_handler.migrations import (
+    MIGRATIONS,
+    SCHEMA_VERSION,
+    add_cascading_foreign_keys,
+    add_sample_positions,
+    get_schema_version,
+    migrate,
 )
 
-# Test adding a movie
-add_movie("Inception", 2010, 8.8)
 
-# Test listing movies
-movies = get_movies()
-print(movies)
+@pytest.fixture
+def user_id():
+    return storage.add_user("tester")
+
+
+def test_schema_is_migrated():
+    with get_engine().connect() as connection:
+        assert get_schema_version(connection) == SCHEMA_VERSION
+
+
+def test_add_and_get_movies(user_id):
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+
+    assert storage.get_movies(user_id) == {
+        "Inception": {
+            "year": 2010,
+            "rating": 8.8,
+            "poster": "poster.jpg",
+            "note": "",
+        }
+    }
+
+
+def test_add_movie_twice_keeps_one_entry(user_id):
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+
+    assert len(storage.get_movies(user_id)) == 1
+
+
+def test_update_movie_note(user_id):
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+    storage.update_movie_note(user_id, "Inception", "Dreams in dreams")
+
+    assert storage.get_movie_note(user_id, "Inception") == "Dreams in dreams"
+    assert storage.get_movies(user_id)["Inception"]["note"] == (
+        "Dreams in dreams"
+    )
+    assert storage.get_movie_notes(user_id, ["Inception", "Missing"]) == {
+        "Inception": "Dreams in dreams"
+    }
+
+
+def test_delete_movie_keeps_movie_of_other_user(user_id):
+    other_id = storage.add_user("other")
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+    storage.add_movie(other_id, "Inception", 2010, 8.8, "poster.jpg")
+
+    storage.delete_movie(user_id, "Inception")
+
+    assert storage.get_movies(user_id) == {}
+    assert "Inception" in storage.get_movies(other_id)
+
+
+def test_delete_user(user_id):
+    other_id = storage.add_user("other")
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+    storage.add_movie(user_id, "Memento", 2000, 8.4, "poster.jpg")
+    storage.add_movie(other_id, "Inception", 2010, 8.8, "poster.jpg")
+
+    storage.delete_user("tester")
+
+    assert storage.get_user_id("tester") is None
+    assert storage.get_movies(user_id) == {}
+    assert list(storage.get_movies(other_id)) == ["Inception"]
+
+
+def test_delete_movies_and_users_in_bulk(user_id):
+    other_id = storage.add_user("other")
+    spare_id = storage.add_user("spare")
+    for title in ["Alien", "Heat", "Inception", "Memento"]:
+        storage.add_movie(user_id, title, 2000, 8.0, "poster.jpg")
+    storage.add_movie(other_id, "Heat", 2000, 8.0, "poster.jpg")
+    storage.add_movie(spare_id, "Tenet", 2020, 7.3, "poster.jpg")
+
+    assert storage.delete_movies(user_id, ["Alien", "Heat", "Missing"]) == 2
+    assert sorted(storage.get_movies(user_id)) == ["Inception", "Memento"]
+    assert storage.get_stats(user_id)["count"] == 2
+    assert storage.delete_movies(user_id, []) == 0
+
+    assert storage.delete_users(["tester", "spare", "nobody"]) == 2
+    assert storage.get_user_id("spare") is None
+    assert storage.get_movies(user_id) == {}
+    assert list(storage.get_movies(other_id)) == ["Heat"]
+    assert storage.get_stats(other_id)["count"] == 1
+    with get_engine().connect() as connection:
+        titles = connection.execute(text("SELECT title FROM movies"))
+        assert [row[0] for row in titles] == ["Heat"]
+        assert connection.execute(
+            text("SELECT COUNT(*) FROM movies_users")
+        ).scalar() == 1
+
+
+def test_deleting_a_large_collection_keeps_the_other_users():
+    movies = [
+        {"title": f"Movie {number}", "year": 2000, "rating": 7.0, "poster": ""}
+        for number in range(5000)
+    ]
+    anna = storage.add_user("anna")
+    ben = storage.add_user("ben")
+    storage.add_movies(anna, movies)
+    storage.add_movies(ben, movies[4000:])
+    for user_id in [anna, ben]:
+        storage.update_movie_note(user_id, "Movie 4500", "seen")
+
+    assert storage.delete_users(["anna"]) == 1
+    assert len(storage.get_movies(ben)) == 1000
+    assert storage.get_stats(ben)["count"] == 1000
+    assert get_user_overlaps() == count_user_overlaps() == [(ben, ben, 1000)]
+    with get_engine().connect() as connection:
+        assert connection.execute(
+            text("SELECT COUNT(*) FROM movies")
+        ).scalar() == 1000
+        assert connection.execute(
+            text("SELECT COUNT(*) FROM notes_fts")
+        ).scalar() == 1
+
+
+def test_foreign_keys_delete_cross_references(user_id):
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+
+    with get_engine().begin() as connection:
+        with pytest.raises(IntegrityError):
+            connection.execute(
+                text("""
+                    INSERT INTO movies_users (user_id, movie_id)
+                    VALUES (:user_id, 12345)
+                """),
+                {"user_id": user_id},
+            )
+        connection.execute(text("DELETE FROM users"))
+        assert connection.execute(
+            text("SELECT COUNT(*) FROM movies_users")
+        ).scalar() == 0
+
+
+def test_foreign_key_migration_keeps_the_triggers():
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        # the migrations before the foreign keys
+        version = MIGRATIONS.index(add_cascading_foreign_keys)
+        for number, migration in enumerate(MIGRATIONS[:version], start=1):
+            migration(connection)
+        connection.execute(text(f"PRAGMA user_version = {number}"))
+        connection.execute(text("INSERT INTO users (name) VALUES ('anna')"))
+        connection.execute(
+            text("""
+                INSERT INTO movies (title, year, rating, poster)
+                VALUES ('Heat', 1995, 8.3, ''), ('Alien', 1979, 8.5, '')
+            """)
+        )
+        # the second user does not exist anymore
+        connection.execute(
+            text("""
+                INSERT INTO movies_users (user_id, movie_id)
+                VALUES (1, 1), (1, 2), (2, 1)
+            """)
+        )
+        connection.commit()
+
+    assert migrate(engine) == SCHEMA_VERSION
+    with engine.connect() as connection:
+        assert connection.execute(
+            text("SELECT user_id, movie_id, position FROM movies_users")
+        ).fetchall() == [(1, 1, 0), (1, 2, 1)]
+        assert connection.execute(
+            text("SELECT * FROM user_rating_histogram")
+        ).fetchall() == [(1, 83, 1), (1, 85, 1)]
+        # the triggers still run on the rebuilt table
+        connection.execute(
+            text("UPDATE movies_users SET note = 'Heist' WHERE movie_id = 1")
+        )
+        assert connection.execute(
+            text("SELECT change_stamp FROM users")
+        ).scalar() == 3
+
+
+def test_adding_an_existing_movie_keeps_the_other_stamps():
+    for name in ["a", "b"]:
+        storage.add_movie(
+            storage.add_user(name), "Heat", 1995, 8.3, "poster.jpg"
+        )
+    storage.add_user("c")
+    stamps = storage.get_user_stamps()
+
+    storage.add_movie(storage.get_user_id("c"), "Heat", 1995, 8.3, "x.jpg")
+    new_stamps = storage.get_user_stamps()
+    assert new_stamps[:2] == stamps[:2]
+    assert new_stamps[2][2] == stamps[2][2] + 1
+
+    storage.add_movie(storage.get_user_id("c"), "Heat", 1995, 8.3, "x.jpg")
+    assert storage.get_user_stamps() == new_stamps
+
+    # a changed movie still changes the stamps of all its users
+    with get_engine().begin() as connection:
+        connection.execute(text("UPDATE movies SET rating = 8.4"))
+    assert [stamp for _, _, stamp in storage.get_user_stamps()] == [
+        stamp + 1 for _, _, stamp in new_stamps
+    ]
+
+
+def test_failed_migration_is_rolled_back(monkeypatch):
+    engine = create_engine("sqlite://")
+    number = MIGRATIONS.index(add_sample_positions) + 1
+
+    def fail_after_alter(connection):
+        connection.execute(
+            text("ALTER TABLE movies_users ADD COLUMN position INTEGER")
+        )
+        raise RuntimeError("stopped mid-migration")
+
+    broken = list(MIGRATIONS)
+    broken[number - 1] = fail_after_alter
+    monkeypatch.setattr(migrations, "MIGRATIONS", broken)
+    with pytest.raises(RuntimeError):
+        migrate(engine)
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == number - 1
+
+    # the column of the failed migration is gone, so the rerun succeeds
+    monkeypatch.undo()
+    assert migrate(engine) == SCHEMA_VERSION
+
+
+def test_user_names_are_bound_as_parameters():
+    user_id = storage.add_user("O'Brien")
+
+    assert storage.get_user_id("O'Brien") == user_id
+
+
+def test_collection_cache(user_id):
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+    version = storage.get_collection_version(user_id)
+
+    first = storage.get_movies(user_id)
+    second = storage.get_movies(user_id)
+
+    assert first is second
+    assert storage.get_cache_stats()["hits"] >= 1
+
+    storage.add_movie(user_id, "Memento", 2000, 8.4, "poster.jpg")
+
+    assert storage.get_collection_version(user_id) > version
+    assert "Memento" in storage.get_movies(user_id)
+
+
+def test_collection_cache_sees_other_processes(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'movies.db'}"
+    storage.configure_database(db_url)
+    user_id = storage.add_user("tester")
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+    storage.get_movies(user_id)
+
+    # another process writes to the database file
+    other = create_engine(db_url)
+    with other.begin() as connection:
+        connection.execute(text("UPDATE movies SET rating = 9.0"))
+    movies = storage.get_movies(user_id)
+    assert movies["Inception"]["rating"] == 9.0
+    assert storage.get_movies(user_id) is movies
+    assert storage.get_cache_stats()["stale"] == 1
+
+    # a write of this process does not patch over the other's writes
+    with other.begin() as connection:
+        connection.execute(text("UPDATE movies_users SET note = 'Dream'"))
+    storage.add_movie(user_id, "Memento", 2000, 8.4, "poster.jpg")
+    movies = storage.get_movies(user_id)
+    assert movies["Inception"]["note"] == "Dream"
+    assert "Memento" in movies
+    # writes of this process alone still patch the cached collection
+    storage.add_movie(user_id, "Tenet", 2020, 7.3, "poster.jpg")
+    storage.delete_movie(user_id, "Memento")
+    storage.update_movie_note(user_id, "Tenet", "Inverted")
+    assert storage.get_movies(user_id) is movies
+    assert sorted(movies) == ["Inception", "Tenet"]
+    assert movies["Tenet"]["note"] == "Inverted"
+    other.dispose()
+
+
+def test_query_movies(user_id):
+    storage.add_movie(user_id, "Inception", "2010", "8.8", "poster.jpg")
+    storage.add_movie(user_id, "Memento", "2000", "8.4", "poster.jpg")
+    storage.add_movie(user_id, "Tenet", "2020", "7.3", "poster.jpg")
+    storage.add_movie(user_id, "Westworld", "2016–2022", "N/A", "N/A")
+
+    by_rating = storage.query_movies(user_id, sort_by="rating")
+    assert list(by_rating) == ["Westworld", "Tenet", "Memento", "Inception"]
+    assert by_rating["Westworld"]["year"] == 2016
+    assert by_rating["Westworld"]["rating"] == 0.0
+
+    by_year = storage.query_movies(
+        user_id, sort_by="year", descending=True, year_range=(2000, 2016)
+    )
+    assert list(by_year) == ["Westworld", "Inception", "Memento"]
+
+    assert list(
+        storage.query_movies(user_id, rating_range=(8, 9), sort_by="title")
+    ) == ["Inception", "Memento"]
+    assert list(
+        storage.query_movies(user_id, sort_by="title", limit=2, offset=1)
+    ) == ["Memento", "Tenet"]
+    assert list(storage.get_top_movies(user_id, 1)) == ["Inception"]
+
+
+def test_search_movies(user_id):
+    other_id = storage.add_user("other")
+    storage.add_movie(user_id, "The Godfather", 1972, 9.2, "poster.jpg")
+    storage.add_movie(user_id, "Godzilla", 2014, 6.4, "poster.jpg")
+    storage.add_movie(user_id, "Heat", 1995, 8.3, "poster.jpg")
+    storage.add_movie(other_id, "The Godfather Part II", 1974, 9.0, "p.jpg")
+    storage.update_movie_note(user_id, "Heat", "Pacino as a godlike cop")
+
+    assert list(storage.search_movies(user_id, "GODF")) == ["The Godfather"]
+    # title matches rank above note matches
+    assert list(storage.search_movies(user_id, "god")) == [
+        "Godzilla",
+        "The Godfather",
+        "Heat",
+    ]
+    assert list(storage.search_movies(user_id, "god", limit=1)) == [
+        "Godzilla"
+    ]
+    # short terms are matched without the index
+    assert list(storage.search_movies(user_id, "od")) == [
+        "Godzilla",
+        "Heat",
+        "The Godfather",
+    ]
+    # without user all titles are searched
+    assert list(storage.search_movies(None, "father")) == [
+        "The Godfather",
+        "The Godfather Part II",
+    ]
+
+    storage.update_movie_note(user_id, "Heat", "")
+    storage.delete_movie(user_id, "Godzilla")
+    assert list(storage.search_movies(user_id, "god")) == ["The Godfather"]
+    assert list(storage.search_movies(None, "zilla")) == []
+
+
+def test_stats_follow_inserts_and_deletes(user_id):
+    other_id = storage.add_user("other")
+    storage.add_movie(user_id, "Inception", 2010, 8.8, "poster.jpg")
+    storage.add_movie(user_id, "Memento", 2000, 8.4, "poster.jpg")
+    storage.add_movie(user_id, "Tenet", 2020, 7.3, "poster.jpg")
+    storage.add_movies(
+        user_id,
+        [{"title": "Heat", "year": 1995, "rating": 8.3, "poster": "p.jpg"}],
+    )
+    storage.add_movie(other_id, "Cats", 2019, 2.8, "poster.jpg")
+
+    stats = storage.get_stats(user_id)
+    assert stats["count"] == 4
+    assert stats["mean"] == pytest.approx(8.2)
+    assert stats["median"] == pytest.approx(8.35)
+    assert stats["percentiles"][25] == pytest.approx(8.05)
+    assert list(stats["best_movies"]) == ["Inception"]
+    assert list(stats["worst_movies"]) == ["Tenet"]
+    assert stats["decades"] == {1990: 1, 2000: 1, 2010: 1, 2020: 1}
+
+    storage.delete_movie(user_id, "Tenet")
+    stats = storage.get_stats(user_id)
+    assert stats["count"] == 3
+    assert stats["median"] == pytest.approx(8.4)
+    assert list(stats["worst_movies"]) == ["Heat"]
+    assert 2020 not in stats["decades"]
+
+    storage.delete_user("tester")
+    assert storage.get_stats(user_id) is None
+    assert storage.get_stats(other_id)["count"] == 1
+
+
+def test_random_movies(user_id):
+    titles = ["Alien", "Heat", "Inception", "Memento", "Tenet"]
+    for rating, title in enumerate(titles):
+        storage.add_movie(user_id, title, 2000, rating, "poster.jpg")
+
+    assert storage.get_random_movies(storage.add_user("empty")) == {}
+    assert list(storage.get_random_movies(user_id)) in [[t] for t in titles]
+    assert sorted(storage.get_random_movies(user_id, count=9)) == titles
+
+    # unrated movies are never picked by rating
+    for _ in range(20):
+        picks = storage.get_random_movies(user_id, count=4, weighted=True)
+        assert sorted(picks) == titles[1:]
+
+    # deleting keeps the positions dense, so every movie can be picked
+    storage.delete_movie(user_id, "Heat")
+    storage.delete_movie(user_id, "Alien")
+    assert sorted(storage.get_random_movies(user_id, count=9)) == [
+        "Inception",
+        "Memento",
+        "Tenet",
+    ]
+
+
+def test_recommendations_follow_the_collections(user_id):
+    collections = {
+        "anna": ["Alien", "Heat", "Inception"],
+        "ben": ["Alien", "Heat", "Tenet"],
+        "cleo": ["Heat", "Memento"],
+    }
+    user_ids = {name: storage.add_user(name) for name in collections}
+    for name, titles in collections.items():
+        for title in titles:
+            storage.add_movie(user_ids[name], title, 2000, 7.0, "poster.jpg")
+    storage.add_movie(user_id, "Alien", 2000, 7.0, "poster.jpg")
+
+    assert storage.get_recommendations(storage.add_user("empty")) == {}
+    # Heat is saved by everyone who saved Alien
+    recommendations = storage.get_recommendations(user_id)
+    assert list(recommendations)[0] == "Heat"
+    assert set(recommendations) == {"Heat", "Inception", "Tenet"}
+    assert recommendations["Heat"]["note"] == ""
+    assert list(storage.get_recommendations(user_id, limit=1)) == ["Heat"]
+
+    # the index is updated on every change of the cross-references
+    storage.add_movie(user_id, "Heat", 2000, 7.0, "poster.jpg")
+    assert "Heat" not in storage.get_recommendations(user_id)
+    assert "Memento" in storage.get_recommendations(user_id)
+    storage.delete_user("cleo")
+    storage.delete_movie(user_ids["anna"], "Inception")
+    assert list(storage.get_recommendations(user_id)) == ["Tenet"]
+    assert get_user_overlaps() == count_user_overlaps()
+
+
+def get_user_overlaps():
+    """Returns the rows of the overlap index."""
+    with get_engine().connect() as connection:
+        return connection.execute(
+            text("SELECT * FROM user_overlaps ORDER BY 1, 2")
+        ).fetchall()
+
+
+def count_user_overlaps():
+    """Returns the overlap index counted from the collections."""
+    with get_engine().connect() as connection:
+        return connection.execute(
+            text("""
+                SELECT a.user_id, b.user_id, COUNT(*)
+                FROM movies_users AS a
+                JOIN movies_users AS b
+                ON b.movie_id = a.movie_id
+                GROUP BY 1, 2
+                ORDER BY 1, 2
+            """)
+        ).fetchall()
+
+
+def test_recommendations_count_every_movie_of_a_collection():
+    titles = [f"Movie {number}" for number in range(600)]
+    movies = [
+        {"title": title, "year": 2000, "rating": 7.0, "poster": ""}
+        for title in titles
+    ]
+    anna = storage.add_user("anna")
+    ben = storage.add_user("ben")
+    storage.add_movies(anna, movies)
+    # ben only shares movies with the largest ids of anna
+    storage.add_movies(ben, movies[500:])
+
+    recommendations = storage.get_recommendations(ben, limit=3)
+    assert list(recommendations) == titles[:3]
+    assert list(storage.get_recommendations(anna)) == []
+
+    storage.add_movies(ben, movies[:300])
+    assert list(storage.get_recommendations(ben, limit=3)) == titles[300:303]
+    assert get_user_overlaps() == count_user_overlaps()
+
+
+def test_recommendations_do_not_depend_on_the_history(monkeypatch):
+    # the users share movies with more users than the neighbours read
+    monkeypatch.setattr(storage, "RECOMMENDATION_NEIGHBOURS", 2)
+    titles = [f"Movie {number}" for number in range(10)]
+    collections = {
+        "anna": titles[:7],
+        "ben": titles[1:9],
+        "cleo": titles[::2],
+        "dan": titles[:3] + titles[8:],
+    }
+
+    def build(seed):
+        storage.configure_database("sqlite://")
+        # the movie ids follow the catalog in both builds
+        storage.add_movies(
+            storage.add_user("catalog"),
+            [
+                {"title": title, "year": 2000, "rating": 7.0, "poster": ""}
+                for title in titles
+            ],
+        )
+        rng = random.Random(seed)
+        for name in collections:
+            user_id = storage.add_user(name)
+            shuffled = rng.sample(titles, len(titles))
+            for title in shuffled:
+                storage.add_movie(user_id, title, 2000, 7.0, "")
+            # the movies outside the collection are deleted again, in
+            # another order, which changes the sample positions
+            rng.shuffle(shuffled)
+            for title in shuffled:
+                if title not in collections[name]:
+                    storage.delete_movie(user_id, title)
+        storage.delete_user("catalog")
 
-# Test updating a movie's rating
-update_movie("Inception", 9.0)
-print(get_movies())
+        assert get_user_overlaps() == count_user_overlaps()
+        return get_user_overlaps(), {
+            name: storage.get_recommendations(storage.get_user_id(name))
+            for name in collections
+        }
 
-# Test deleting a movie
-delete_movie("Inception")
-print(get_movies())  # Should be empty if it was the only movie
+    first = build(1)
+    assert first == build(2)
+    assert first[1]["cleo"]
@@ -0,0 +1,66 @@
+import time
+
+from db_handler import movie_storage_sql as storage
+from db_handler import omdb_cache
+
+
+INCEPTION = {
+    "Response": "True",
+    "Title": "Inception",
+    "Year": "2010",
+    "imdbRating": "8.8",
+    "imdbID": "tt1375666",
+    "Poster": "poster.jpg",
+}
+
+NOT_FOUND = {"Response": "False", "Error": "Movie not found!"}
+
+
+def test_cached_response_by_title_and_imdb_id():
+    omdb_cache.save_response("  inception ", INCEPTION)
+
+    assert omdb_cache.get_response("Inception") == INCEPTION
+    assert omdb_cache.get_response("INCEPTION") == INCEPTION
+    assert omdb_cache.get_response_by_imdb_id("tt1375666") == INCEPTION
+    assert omdb_cache.get_response("Memento") is None
+
+
+def test_not_found_is_cached():
+    omdb_cache.save_response("No such movie", NOT_FOUND)
+
+    assert omdb_cache.get_response("no such movie") == NOT_FOUND
+
+
+def test_errors_are_not_cached():
+    omdb_cache.save_response(
+        "Inception", {"Response": "False", "Error": "Invalid API key!"}
+    )
+
+    assert omdb_cache.get_response("Inception") is None
+
+
+def test_expired_response(monkeypatch):
+    omdb_cache.save_response("No such movie", NOT_FOUND)
+    omdb_cache.save_response("Inception", INCEPTION)
+    later = time.time() + omdb_cache.DEFAULT_NEGATIVE_TTL + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+
+    assert omdb_cache.get_response("No such movie") is None
+    assert omdb_cache.get_response("Inception") == INCEPTION
+    assert omdb_cache.purge_expired() == 1
+
+
+def test_ttls_are_read_once_per_engine(monkeypatch):
+    monkeypatch.setenv("MOVIEBRAIN_OMDB_NEGATIVE_TTL", "5")
+    storage.configure_database("sqlite://")
+    omdb_cache.save_response("No such movie", NOT_FOUND)
+
+    def no_settings(*args):
+        raise AssertionError("settings read on lookup")
+
+    monkeypatch.setattr(omdb_cache, "get_setting", no_settings)
+    later = time.time() + 6
+    monkeypatch.setattr(time, "time", lambda: later)
+
+    assert omdb_cache.get_response("No such movie") is None
+    assert omdb_cache.get_negative_ttl() == 5
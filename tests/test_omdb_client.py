@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from api_handler import OmdbClient, OmdbConnectionError, OmdbError
+from api_handler.stub_server import StubOmdbServer
+
+
+def test_get_movie():
+    with StubOmdbServer(not_found=["Unknown"]) as server:
+        with OmdbClient("key", base_url=server.url, rate=0) as client:
+            assert client.get_movie("Heat")["Title"] == "Heat"
+            assert client.get_movie("Unknown")["Response"] == "False"
+
+
+def test_retries_rate_limited_requests():
+    with StubOmdbServer(rate_limited=2) as server:
+        with OmdbClient(
+            "key", base_url=server.url, rate=0, backoff=0.01
+        ) as client:
+            assert client.get_movie("Heat")["Title"] == "Heat"
+
+    assert server.request_count == 3
+
+
+def test_gives_up_after_retries():
+    with StubOmdbServer(rate_limited=10) as server:
+        with OmdbClient(
+            "key", base_url=server.url, rate=0, retries=1, backoff=0.01
+        ) as client:
+            with pytest.raises(OmdbError):
+                client.get_movie("Heat")
+
+    assert server.request_count == 2
+
+
+def test_connection_error():
+    with OmdbClient(
+        "key", base_url="http://127.0.0.1:9/", retries=0, timeout=1
+    ) as client:
+        with pytest.raises(OmdbConnectionError):
+            client.get_movie("Heat")
+
+
+def test_identical_titles_share_one_request():
+    barrier = threading.Barrier(5)
+
+    with StubOmdbServer(latency=0.2) as server:
+        with OmdbClient("key", base_url=server.url, rate=0) as client:
+
+            def lookup():
+                barrier.wait()
+                return client.get_movie("Heat")
+
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(lookup()))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    assert len(results) == 5
+    assert server.request_count == 1
+    assert client.coalesced == 4
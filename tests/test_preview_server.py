@@ -0,0 +1,78 @@
+import http.client
+import json
+
+from html_display import html_generator
+from html_display.preview_server import PreviewServer
+
+
+def read_event(response):
+    """Returns the next event of the stream as (name, data)."""
+    name = data = None
+    while True:
+        line = response.fp.readline().decode().rstrip("\n")
+        if line.startswith("event: "):
+            name = line[len("event: "):]
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: "):])
+        elif not line and name:
+            return name, data
+
+
+def open_events(server):
+    host, port = server._server.server_address[:2]
+    connection = http.client.HTTPConnection(host, port, timeout=5)
+    connection.request("GET", "/events")
+    response = connection.getresponse()
+    assert response.getheader("Content-Type") == "text/event-stream"
+    return connection, response
+
+
+def test_serves_files_and_events(tmp_path):
+    (tmp_path / "index.html").write_text("<p>hi</p>")
+
+    with PreviewServer(root=str(tmp_path), host="127.0.0.1", port=0) as server:
+        host, port = server._server.server_address[:2]
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+        connection.request("GET", "/index.html")
+        assert connection.getresponse().read() == b"<p>hi</p>"
+
+        server.set_current("feed", {"version": "1"})
+        events, response = open_events(server)
+        assert read_event(response) == ("feed", {"version": "1"})
+
+        server.publish("reload", {})
+        assert read_event(response) == ("reload", {})
+        events.close()
+
+
+def test_data_feed_changes_are_pushed(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    monkeypatch.setattr(html_generator, "DATA_DIR", str(data_dir))
+    monkeypatch.setattr(
+        html_generator, "DATA_INDEX_FILENAME", str(data_dir / "movies.json")
+    )
+    monkeypatch.setattr(html_generator, "_feed_rows", [])
+    movies = {
+        title: {"year": 2000, "rating": 7.0, "poster": "N/A", "note": ""}
+        for title in ["Alien", "Heat", "Tron"]
+    }
+
+    with PreviewServer(root=str(tmp_path), host="127.0.0.1", port=0) as server:
+        monkeypatch.setattr(html_generator, "_preview_server", server)
+        html_generator.write_data_feed(movies)
+        events, response = open_events(server)
+        name, feed = read_event(response)
+        assert name == "feed"
+        assert feed["count"] == 3
+
+        movies["Heat"] = dict(movies["Heat"], note="Pacino")
+        html_generator.write_data_feed(movies)
+        name, patch = read_event(response)
+        events.close()
+
+    assert name == "patch"
+    assert patch["count"] == 3
+    # only the changed movie is sent
+    assert patch["rows"] == {
+        "1": ["Heat", 2000, 7.0, "Pacino", "no_results.jpg", ""]
+    }
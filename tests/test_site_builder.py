@@ -0,0 +1,76 @@
+import json
+
+from db_handler import movie_storage_sql as storage
+from html_display import site_builder
+
+
+def add_users():
+    anna_id = storage.add_user("Anna")
+    storage.add_movie(anna_id, "Inception", 2010, 8.8, "poster.jpg")
+    storage.add_movie(anna_id, "Memento", 2000, 8.4, "poster.jpg")
+    ben_id = storage.add_user("Ben & Co")
+    storage.add_movie(ben_id, "Tenet", 2020, 7.3, "poster.jpg")
+    return anna_id, ben_id
+
+
+def test_build_site_renders_changed_users(tmp_path):
+    anna_id, ben_id = add_users()
+    anna_dir = tmp_path / f"anna-{anna_id}"
+
+    report = site_builder.build_site(str(tmp_path))
+
+    assert report == {
+        "built": ["Anna", "Ben & Co"],
+        "unchanged": [],
+        "removed": [],
+    }
+    assert sorted(path.name for path in anna_dir.iterdir()) == [
+        "index.html",
+        "rating.html",
+        "stats.html",
+        "title.html",
+        "year.html",
+    ]
+    year_page = (anna_dir / "year.html").read_text()
+    assert year_page.index("Inception") < year_page.index("Memento")
+    assert '<base href="' in year_page
+    assert "Average rating" in (anna_dir / "stats.html").read_text()
+    site_index = (tmp_path / "index.html").read_text()
+    assert "Ben &amp; Co" in site_index
+    assert f"ben-co-{ben_id}/index.html" in site_index
+
+    # only the users whose movies changed are rendered again
+    assert site_builder.build_site(str(tmp_path))["built"] == []
+    storage.update_movie_note(anna_id, "Memento", "Remember Sammy Jankis")
+    report = site_builder.build_site(str(tmp_path))
+    assert report["built"] == ["Anna"]
+    assert report["unchanged"] == ["Ben & Co"]
+    assert "Remember Sammy Jankis" in (anna_dir / "index.html").read_text()
+
+    # deleted users lose their pages, missing pages are rendered again
+    storage.delete_user("Ben & Co")
+    for page in anna_dir.iterdir():
+        page.unlink()
+    report = site_builder.build_site(str(tmp_path))
+    assert report == {
+        "built": ["Anna"],
+        "unchanged": [],
+        "removed": ["Ben & Co"],
+    }
+    assert not (tmp_path / f"ben-co-{ben_id}").exists()
+    assert (anna_dir / "index.html").exists()
+    build = json.loads((tmp_path / "build.json").read_text())
+    assert build["users"][str(anna_id)]["count"] == 2
+
+
+def test_build_site_in_worker_processes(tmp_path):
+    storage.configure_database(f"sqlite:///{tmp_path / 'site.db'}")
+    anna_id, ben_id = add_users()
+    site_dir = tmp_path / "site"
+
+    report = site_builder.build_site(str(site_dir), workers=2)
+
+    assert report["built"] == ["Anna", "Ben & Co"]
+    ben_page = site_dir / f"ben-co-{ben_id}" / "index.html"
+    assert "Tenet" in ben_page.read_text()
+    assert "2 movies" in (site_dir / "index.html").read_text()
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_has_no_side_effects():
+    script = (
+        "import sys, threading, moviebrain\n"
+        "heavy = ['sqlalchemy', 'requests', 'http.server']\n"
+        "print(sorted(set(heavy) & set(sys.modules)))\n"
+        "print(threading.active_count())\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # no database, http or preview server modules and no server thread
+    assert result.stdout.split("\n")[:2] == ["[]", "1"]